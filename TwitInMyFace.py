@@ -6,9 +6,17 @@ Authors:
     Steven Tan
 """
 
-import unittest
-import io
-import random
+import functools
+import heapq
+import itertools
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
 
 
 ######################### Helper Functions ####################################
@@ -43,6 +51,21 @@ def list_to_string(lst: list) -> str:
     return output    
 
 
+def bit_positions(bits: int) -> list:
+    """
+    Return the sorted list of the positions of the bits set in bits.
+    """
+    
+    positions = []
+    for byte_number, byte in enumerate(bits.to_bytes(
+            (bits.bit_length() + 7) // 8, 'little')):
+        while byte:
+            low = byte & -byte
+            positions.append(byte_number * 8 + low.bit_length() - 1)
+            byte ^= low
+    return positions
+
+
 def construct_network(file: 'file to be read') -> 'SocialNetwork':
     """
     Returns a SocialNetwork object given a file.
@@ -52,103 +75,1208 @@ def construct_network(file: 'file to be read') -> 'SocialNetwork':
     return network
     
     
+def read_lines(file: 'path, file object or mmap') -> 'iterator of str':
+    """
+    Yield the lines of file one at a time, decoded to str. file can be a 
+    path, a file object opened in text or binary mode, or a memory-mapped
+    file. A path is opened here and closed once every line was read.
+    """
+    
+    if isinstance(file, str):
+        with open(file, 'r') as opened_file:
+            yield from opened_file
+        return
+    if isinstance(file, mmap.mmap):
+        lines = iter(file.readline, b'')
+    else:
+        lines = file
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        yield line
+
+
+def parse_timf(file: 'path, file object or mmap', 
+               report: 'LoadReport'=None) -> 'iterator of tuple':
+    """
+    Yield one record (name, email, schools, friends) for every person listed
+    in the .timf file, where schools and friends are the comma separated
+    strings of the line. Only one line is held in memory at a time. Blank
+    lines are skipped; malformed lines are added to report, if one is given,
+    and skipped instead of aborting the parse.
+    """
+    
+    for line_number, line in enumerate(read_lines(file), 1):
+        line = line.strip()
+        if not line:
+            continue
+        # name<email>(schools):friends
+        name, found_email, rest = line.partition('<')
+        email, found_schools, rest = rest.partition('>(')
+        schools, found_friends, friends = rest.partition('):')
+        if not (found_email and found_schools and found_friends and email):
+            if report is not None:
+                report.add_bad_line(line_number, line)
+            continue
+        if report is not None:
+            report.records += 1
+        yield name, email, schools, friends
+
+
+def timf_ranges(path: str, parts: int, minimum: int=1) -> list:
+    """
+    Split the file at path into at most parts byte ranges (start, end) of
+    about the same size, but at least minimum bytes, each starting at the
+    beginning of a line and ending after the newline of its last line (or at
+    the end of the file), so together they cover every line exactly once.
+    """
+    
+    size = os.path.getsize(path)
+    parts = max(1, min(parts, size // max(minimum, 1)))
+    bounds = [0]
+    with open(path, 'rb') as opened_file:
+        for part in range(1, parts):
+            position = size * part // parts
+            if position <= bounds[-1]:
+                continue
+            # Move on to the start of the line after byte position - 1.
+            opened_file.seek(position - 1)
+            opened_file.readline()
+            position = opened_file.tell()
+            if position >= size:
+                break
+            if position > bounds[-1]:
+                bounds.append(position)
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
 ######################### Exception Class #####################################
 class EmptyFileError(Exception):
     pass
 
 
+######################### Load Report Class ###################################
+class LoadReport(object):
+    '''Summary of the problems found while loading a .timf file. Only the
+    first few examples of each kind of problem are kept so the report stays
+    small however large the file is.'''
+    
+    SAMPLES = 10
+    
+    def __init__(self):
+        '''Initializes an empty report. self.records counts the people that
+        were read, the other counters count the problems of each kind and the
+        matching lists hold the first few examples.'''
+        
+        self.records = 0
+        self.bad_line_count = 0
+        self.bad_lines = []
+        self.dangling_count = 0
+        self.dangling = []
+        self.duplicate_count = 0
+        self.duplicates = []
+        
+    def add_bad_line(self, line_number: int, line: str) -> None:
+        '''Record a line that is not of the form name<email>(schools):friends
+        '''
+        
+        self.bad_line_count += 1
+        if len(self.bad_lines) < self.SAMPLES:
+            self.bad_lines.append((line_number, line))
+            
+    def add_dangling(self, email: str, friend: str) -> None:
+        '''Record that email lists friend, who is not in the file.'''
+        
+        self.dangling_count += 1
+        if len(self.dangling) < self.SAMPLES:
+            self.dangling.append((email, friend))
+            
+    def add_duplicate(self, email: str) -> None:
+        '''Record a person whose email was already listed on an earlier line.
+        '''
+        
+        self.duplicate_count += 1
+        if len(self.duplicates) < self.SAMPLES:
+            self.duplicates.append(email)
+            
+    def is_clean(self) -> bool:
+        '''Return True iff no problem was found.'''
+        
+        return not (self.bad_line_count or self.dangling_count or 
+                    self.duplicate_count)
+    
+    def __str__(self) -> str:
+        lines = ['Loaded {} people: {} malformed lines, {} dangling friends, '
+                 '{} duplicate emails'.format(
+                     self.records, self.bad_line_count, self.dangling_count,
+                     self.duplicate_count)]
+        for line_number, line in self.bad_lines:
+            lines.append('  line {}: malformed: {}'.format(line_number, line))
+        for email, friend in self.dangling:
+            lines.append('  {}: unknown friend {}'.format(email, friend))
+        for email in self.duplicates:
+            lines.append('  {}: listed more than once'.format(email))
+        return '\n'.join(lines)
+
+
 ######################### Node Class ##########################################
 class Node(object):
-    '''Node object that contains a person's name, email, school and friends.'''
-    def __init__(self, name: str, email: str, schools: str=None, 
-                 friends: str=None):
-        '''Initializes the Node object containing a person's name, 
-        email, school(s) and friend(s) where school(s) and friend(s)
-        can be None'''
-        
-        self._name = name                  
-        self._email = email 
-        self._schools = []
-        if schools:
-            for school in schools.split(','):
-                self._schools.append(school)       
-        self._friends = []
-        if friends:
-            for friend in friends.split(','):
-                self._friends.append(friend)
+    '''Node object that gives a person's name, email, school and friends. It
+    is a lightweight view of the person with a given id in a SocialNetwork,
+    which stores the data of everyone once.'''
+    
+    __slots__ = ('_network', '_id')
+    
+    def __init__(self, network: 'SocialNetwork', idx: int):
+        '''Initializes the Node object viewing the person with id idx in
+        network.'''
+        
+        self._network = network
+        self._id = idx
+        
+    def get_id(self) -> int:
+        return self._id
     
     def get_email(self) -> str:
-        return self._email
+        return self._network._emails[self._id]
     
     def get_name(self) -> str:
-        return self._name
+        return self._network._names[self._id]
     
     def get_friends(self) -> list:
-        return self._friends
+        emails = self._network._emails
+        return [emails[friend] for friend in self._network._network[self._id]]
     
     def get_schools(self) -> list:
-        return self._schools
+        return self._network.school_index().school_names(self._id)
+    
+    def __eq__(self, other: object) -> bool:
+        return (isinstance(other, Node) and self._network is other._network
+                and self._id == other._id)
+    
+    def __hash__(self) -> int:
+        return hash(self._id)
+
+
+class NodeTable(object):
+    '''Read-only sequence of the nodes of a SocialNetwork. Nodes are views,
+    made when they are asked for.'''
+    
+    __slots__ = ('_network',)
+    
+    def __init__(self, network: 'SocialNetwork'):
+        self._network = network
+        
+    def __len__(self) -> int:
+        return len(self._network._emails)
+    
+    def __getitem__(self, idx: int) -> 'Node':
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('node index out of range')
+        return Node(self._network, idx)
+    
+    def __iter__(self) -> 'iterator of Node':
+        for idx in range(len(self)):
+            yield Node(self._network, idx)
+
+
+######################### Layer Cache Class ###################################
+class CachedLayers(object):
+    '''The layers of one breadth first search kept by a LayerCache, along
+    with the depth of every id reached. complete is True iff the search ran
+    until nobody was left to reach.'''
+    
+    __slots__ = ('layers', 'depths', 'complete', 'size')
+    
+    def __init__(self, layers: list, complete: bool):
+        self.layers = layers
+        self.depths = {}
+        for depth, layer in enumerate(layers):
+            for idx in layer:
+                self.depths[idx] = depth
+        self.complete = complete
+        self.size = len(self.depths)
+
+
+class LayerCache(object):
+    '''Least recently used cache of breadth first search layers keyed by the
+    id of the source. budget is the largest number of ids, summed over all
+    cached searches, that the cache may hold; the least recently used
+    searches are evicted to stay under it.'''
+    
+    # The number of sources that missed remembered by missed_again.
+    REMEMBERED = 1024
+    
+    def __init__(self, budget: int):
+        self._budget = budget
+        self._size = 0
+        self._entries = OrderedDict()
+        # Sources that missed lately, the most recent last.
+        self._missed = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        
+    def layers(self, source: int, depth: int) -> list:
+        '''Return the cached layers from source up to depth, or None if they
+        are not cached.'''
+        
+        entry = self._entries.get(source)
+        if entry is None or not (entry.complete or len(entry.layers) > depth):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(source)
+        return entry.layers[:depth + 1]
+    
+    def distance(self, source: int, target: int) -> 'int or float':
+        '''Return the degree between source and target if a search from
+        either of them is cached and settles it, None otherwise.'''
+        
+        for key, other in ((source, target), (target, source)):
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            depth = entry.depths.get(other)
+            if depth is not None or entry.complete:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return float('inf') if depth is None else depth
+        self.misses += 1
+        return None
+        
+    def missed_again(self, source: int) -> bool:
+        '''Return True iff source already missed lately, i.e. a full search
+        from it is worth running and caching if it fits. Remember that
+        source missed.'''
+        
+        if source in self._missed:
+            self._missed.move_to_end(source)
+            return True
+        self._missed[source] = None
+        if len(self._missed) > self.REMEMBERED:
+            self._missed.popitem(last=False)
+        return False
+    
+    def fits(self, size: int) -> bool:
+        '''Return True iff a search reaching size ids fits the budget.'''
+        
+        return size <= self._budget
+        
+    def put(self, source: int, layers: list, 
+            complete: bool) -> 'CachedLayers':
+        '''Cache the layers of a search from source, evicting the least
+        recently used searches if the budget is exceeded. A search larger
+        than the whole budget is not cached. Return the new entry.'''
+        
+        entry = CachedLayers(layers, complete)
+        if entry.size > self._budget:
+            return entry
+        old = self._entries.pop(source, None)
+        if old is not None:
+            self._size -= old.size
+        self._entries[source] = entry
+        self._size += entry.size
+        while self._size > self._budget:
+            source, old = self._entries.popitem(last=False)
+            self._size -= old.size
+        return entry
+            
+    def clear(self) -> None:
+        '''Drop every cached search, e.g. because the graph changed.'''
+        
+        self._entries.clear()
+        self._missed.clear()
+        self._size = 0
+        
+    def get_stats(self) -> dict:
+        '''Return the hit and miss counters and the current size.'''
+        
+        return {'hits': self.hits, 'misses': self.misses,
+                'searches': len(self._entries), 'ids': self._size,
+                'budget': self._budget}
+
+
+######################### Query Stats Class ###################################
+class QueryStats(object):
+    '''Counters of the queries answered by a SocialNetwork, kept per query
+    type: the number of calls, a histogram of their wall times, the number
+    of people whose friends were looked at (nodes expanded), the number of
+    friend ids looked at (edges scanned) and the hits and misses of the
+    layer cache. Bucket k of the histogram counts the calls that took less
+    than 2 ** k microseconds but not less than 2 ** (k - 1). Searches run on
+    bitsets or by the numpy backend count the people they expand but not
+    the friend ids, which they never look at one by one.'''
+    
+    FIELDS = ('calls', 'total_seconds', 'max_seconds', 'nodes_expanded', 
+              'edges_scanned', 'cache_hits', 'cache_misses')
+    
+    def __init__(self):
+        self._types = {}
+        # The counters of the queries running right now, innermost last.
+        self._running = []
+        
+    def counters(self, query_type: str) -> dict:
+        '''Return the counters of query_type, adding them if needed.'''
+        
+        counters = self._types.get(query_type)
+        if counters is None:
+            counters = dict.fromkeys(self.FIELDS, 0)
+            counters['histogram'] = []
+            self._types[query_type] = counters
+        return counters
+        
+    def record(self, query_type: str, network: 'SocialNetwork', 
+               method: 'function', args: tuple, kwargs: dict) -> object:
+        '''Return method(network, *args, **kwargs), counting the call, its
+        wall time, its work and its cache lookups under query_type.'''
+        
+        counters = self.counters(query_type)
+        cache = network._cache
+        if cache is not None:
+            hits, misses = cache.hits, cache.misses
+        self._running.append(counters)
+        start = time.perf_counter()
+        try:
+            return method(network, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._running.pop()
+            counters['calls'] += 1
+            counters['total_seconds'] += elapsed
+            counters['max_seconds'] = max(counters['max_seconds'], elapsed)
+            bucket = int(elapsed * 1e6).bit_length()
+            histogram = counters['histogram']
+            if bucket >= len(histogram):
+                histogram.extend([0] * (bucket + 1 - len(histogram)))
+            histogram[bucket] += 1
+            if cache is not None:
+                counters['cache_hits'] += cache.hits - hits
+                counters['cache_misses'] += cache.misses - misses
+                
+    def add_work(self, expanded: int, scanned: int) -> None:
+        '''Count the nodes expanded and edges scanned by a search towards the
+        innermost running query. Searches outside any query are ignored.'''
+        
+        if self._running:
+            counters = self._running[-1]
+            counters['nodes_expanded'] += expanded
+            counters['edges_scanned'] += scanned
+            
+    def clear(self) -> None:
+        '''Reset every counter.'''
+        
+        self._types.clear()
+        
+    def to_dict(self) -> dict:
+        '''Return {query type: counters}, the histogram given as 
+        {upper bound in microseconds: calls} without the empty buckets.'''
+        
+        result = {}
+        for query_type, counters in sorted(self._types.items()):
+            entry = {field: counters[field] for field in self.FIELDS}
+            entry['histogram_us'] = {
+                str(2 ** bucket): calls for bucket, calls in 
+                enumerate(counters['histogram']) if calls}
+            result[query_type] = entry
+        return result
+    
+    def to_json(self, file: 'file to be written'=None) -> str:
+        '''Return the counters of to_dict as JSON, also writing them to file
+        if it is given.'''
+        
+        import json
+        text = json.dumps(self.to_dict(), sort_keys=True)
+        if file is not None:
+            file.write(text + '\n')
+        return text
+    
+    def __str__(self) -> str:
+        lines = ['{:<22}{:>8}{:>10}{:>10}{:>12}{:>12}{:>8}{:>8}'.format(
+            'query', 'calls', 'mean ms', 'max ms', 'expanded', 'scanned', 
+            'hits', 'misses')]
+        for query_type, entry in self.to_dict().items():
+            lines.append(
+                '{:<22}{:>8}{:>10.3f}{:>10.3f}{:>12}{:>12}{:>8}{:>8}'.format(
+                    query_type, entry['calls'], 
+                    entry['total_seconds'] * 1000 / entry['calls'],
+                    entry['max_seconds'] * 1000, entry['nodes_expanded'],
+                    entry['edges_scanned'], entry['cache_hits'], 
+                    entry['cache_misses']))
+            lines.append('    ' + ' '.join(
+                '<{}us:{}'.format(bound, calls) 
+                for bound, calls in entry['histogram_us'].items()))
+        return '\n'.join(lines)
+    
+    
+def instrumented(query_type: str) -> 'decorator':
+    '''Make a query method of SocialNetwork count its calls under
+    query_type in the QueryStats of the network. When stats are off the
+    method is called straight away.'''
+    
+    def decorate(method: 'function') -> 'function':
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self._stats is None:
+                return method(self, *args, **kwargs)
+            return self._stats.record(query_type, self, method, args, kwargs)
+        return wrapper
+    return decorate
+
+
+######################### Components Class ##################################
+class Components(object):
+    '''Union-find over the ids 0 .. size - 1, tracking the connected
+    components of the network. The id of a component is the id of its root;
+    it may change when two components are joined.
+    
+    The tree nodes are slots, one per id until an id is removed: from then
+    on self._slots holds the slot of every id, and self._names the id
+    naming the component of every root slot (self._named the other way
+    round), as the slot of a removed id may still hold others together.'''
+    
+    def __init__(self, size: int):
+        self._parent = list(range(size))
+        self._size = [1] * size
+        self._slots = None
+        self._names = None
+        self._named = None
+        
+    def root(self, slot: int) -> int:
+        '''Return the root slot of the tree of slot.'''
+        
+        parent = self._parent
+        while parent[slot] != slot:
+            # Path halving keeps the trees flat.
+            parent[slot] = parent[parent[slot]]
+            slot = parent[slot]
+        return slot
+        
+    def find(self, idx: int) -> int:
+        '''Return the id of the component of idx.'''
+        
+        if self._slots is None:
+            return self.root(idx)
+        return self._names[self.root(self._slots[idx])]
+    
+    def union(self, first: int, second: int) -> None:
+        '''Join the components of first and second, e.g. when a friendship
+        between them is added.'''
+        
+        if self._slots is not None:
+            first, second = self._slots[first], self._slots[second]
+        first, second = self.root(first), self.root(second)
+        if first == second:
+            return
+        if self._size[first] < self._size[second]:
+            first, second = second, first
+        self._parent[second] = first
+        self._size[first] += self._size[second]
+        if self._names is not None:
+            del self._named[self._names.pop(second)]
+        
+    def add(self) -> int:
+        '''Add a new id in a component of its own and return it.'''
+        
+        slot = len(self._parent)
+        self._parent.append(slot)
+        self._size.append(1)
+        if self._slots is None:
+            return slot
+        idx = len(self._slots)
+        self._slots.append(slot)
+        self._names[slot] = idx
+        self._named[idx] = slot
+        return idx
+    
+    def remove(self, idx: int, friend: int=None) -> None:
+        '''Remove id idx, the last id taking it over. friend is one of the
+        friends idx had, all of whom must still be connected to each other,
+        or None if idx had no friends.'''
+        
+        if self._slots is None:
+            self._slots = list(range(len(self._parent)))
+            self._names = {slot: slot for slot in range(len(self._parent))
+                           if self._parent[slot] == slot}
+            self._named = dict(self._names)
+        root = self.root(self._slots[idx])
+        self._size[root] -= 1
+        if self._named.get(idx) == root:
+            # The component is named after idx: name it after friend, or
+            # drop it if idx was alone.
+            del self._named[idx]
+            if friend is None:
+                del self._names[root]
+            else:
+                self._names[root] = friend
+                self._named[friend] = root
+        last = len(self._slots) - 1
+        self._slots[idx] = self._slots[last]
+        self._slots.pop()
+        if last != idx and last in self._named:
+            root = self._named.pop(last)
+            self._names[root] = idx
+            self._named[idx] = root
+        
+    def size_of(self, idx: int) -> int:
+        '''Return the number of ids in the component of idx.'''
+        
+        if self._slots is None:
+            return self._size[self.find(idx)]
+        return self._size[self.root(self._slots[idx])]
+    
+    def sizes(self) -> dict:
+        '''Return {component id: number of ids in it}.'''
+        
+        if self._names is not None:
+            return {idx: self._size[slot] 
+                    for slot, idx in self._names.items()}
+        return {idx: self._size[idx] for idx in range(len(self._parent)) 
+                if self._parent[idx] == idx}
+
+
+class FlatComponents(Components):
+    '''Read-only components of a snapshot: roots[idx] is the id of the
+    component of idx and sizes[root] the number of ids in that component.'''
+    
+    def __init__(self, roots: 'sequence of int', sizes: 'sequence of int'):
+        self._parent = roots
+        self._size = sizes
+        self._slots = None
+        self._names = None
+        self._named = None
+        
+    def find(self, idx: int) -> int:
+        '''Return the id of the component of idx.'''
+        
+        return self._parent[idx]
+
+
+######################### Dense Components Class ##############################
+class DenseComponents(object):
+    '''Friend bitsets of the people in the dense components of a network.
+    A component of n people is dense when it has at least density * n *
+    (n - 1) / 2 friendships. Its people get local numbers 0 .. n - 1 in
+    increasing id order, and each person's friends are kept as a Python int
+    with the bit of every friend's local number set, so intersecting two
+    friend sets is an AND and counting it a popcount.'''
+    
+    # Components smaller than this are never worth bitsets.
+    MIN_SIZE = 3
+    
+    def __init__(self, network: 'sequence of list', 
+                 components: 'Components', density: float):
+        self._root = {}
+        self._local = {}
+        self._rows = {}
+        self._members = {}
+        self._school_bits = {}
+        groups = {}
+        for idx in range(len(network)):
+            groups.setdefault(components.find(idx), []).append(idx)
+        for root, members in groups.items():
+            size = len(members)
+            if size < self.MIN_SIZE:
+                continue
+            # Every friendship is counted once from each side.
+            ends = sum(len(network[idx]) for idx in members)
+            if ends < density * size * (size - 1):
+                continue
+            self._members[root] = members
+            for number, idx in enumerate(members):
+                self._root[idx] = root
+                self._local[idx] = number
+            for idx in members:
+                row = bytearray((size + 7) // 8)
+                for friend in network[idx]:
+                    number = self._local[friend]
+                    row[number >> 3] |= 1 << (number & 7)
+                self._rows[idx] = int.from_bytes(row, 'little')
+                
+    def covers(self, idx: int) -> bool:
+        '''Return True iff the person with id idx is in a dense component.
+        '''
+        
+        return idx in self._root
+    
+    def forget_schools(self) -> None:
+        '''Drop the school bitsets, to be called when schools change.'''
+        
+        self._school_bits.clear()
+        
+    def to_ids(self, root: int, bits: int) -> list:
+        '''Return the sorted ids of the people of the component with the
+        given root whose local numbers are set in bits.'''
+        
+        members = self._members[root]
+        return [members[number] for number in bit_positions(bits)]
+    
+    def ball(self, start: int, d: int) -> int:
+        '''Return the bits of the people 1 to d degrees from start.'''
+        
+        visited = 1 << self._local[start]
+        frontier = visited
+        root = self._root[start]
+        for depth in range(d):
+            reached = 0
+            for idx in self.to_ids(root, frontier):
+                reached |= self._rows[idx]
+            frontier = reached & ~visited
+            if not frontier:
+                break
+            visited |= frontier
+        return visited & ~(1 << self._local[start])
+    
+    def search_layers(self, start: int, d: int) -> list:
+        '''Return the layers of a breadth first search from start that stops
+        at depth d. Each step ORs the rows of the frontier together and masks
+        out the people already visited.'''
+        
+        root = self._root[start]
+        visited = 1 << self._local[start]
+        layers = [[start]]
+        while len(layers) <= d:
+            reached = 0
+            for idx in layers[-1]:
+                reached |= self._rows[idx]
+            reached &= ~visited
+            if not reached:
+                break
+            visited |= reached
+            layers.append(self.to_ids(root, reached))
+        return layers
+    
+    def mutual_ids(self, first: int, second: int) -> list:
+        '''Return the ids of the mutual friends of first and second, at
+        least one of whom is in a dense component.'''
+        
+        root = self._root.get(first)
+        if root is None or root != self._root.get(second):
+            # Friends are always in the same component.
+            return []
+        return self.to_ids(root, self._rows[first] & self._rows[second])
+    
+    def mutual_counts(self, start: int) -> dict:
+        '''Return {id: number of mutual friends with start} for everyone in
+        start's component who is not start or already their friend.'''
+        
+        root = self._root[start]
+        row = self._rows[start]
+        everyone = (1 << len(self._members[root])) - 1
+        counts = {}
+        for idx in self.to_ids(root, everyone & ~row & 
+                               ~(1 << self._local[start])):
+            count = (row & self._rows[idx]).bit_count()
+            if count:
+                counts[idx] = count
+        return counts
+    
+    def classmates(self, start: int, d: int, schools: 'SchoolIndex') -> list:
+        '''Return the ids of the people 1 to d degrees from start who went
+        to one of start's schools: the ball around start ANDed with the
+        bitsets of the schools.'''
+        
+        root = self._root[start]
+        school_bits = 0
+        for school in schools.schools_of(start):
+            bits = self._school_bits.get((root, school))
+            if bits is None:
+                bits = 0
+                for idx in schools.members(school):
+                    if self._root.get(idx) == root:
+                        bits |= 1 << self._local[idx]
+                self._school_bits[(root, school)] = bits
+            school_bits |= bits
+        return self.to_ids(root, self.ball(start, d) & school_bits)
+
+
+######################### School Index Class ##################################
+class SchoolIndex(object):
+    '''Schools of every person, stored once: school names are interned to
+    dense ids in the order they are first seen and each person keeps an
+    array of school ids. The inverted index from each school to the ids of
+    the people who went there is built the first time it is needed and kept
+    up to date afterwards.'''
+    
+    def __init__(self, names: 'sequence of str'=None, 
+                 person_schools: 'sequence of array'=None,
+                 members: 'sequence of sequence'=None):
+        '''Initializes the index, empty or over the school names, school
+        ids of every person and ids of the people of every school of a
+        snapshot.'''
+        
+        self._names = [] if names is None else names
+        self._person_schools = [] if person_schools is None else person_schools
+        self._school_ids = None
+        self._members = members
+        
+    def thaw(self) -> None:
+        '''Copy the index of a snapshot into lists so it can be changed.'''
+        
+        if isinstance(self._person_schools, list):
+            return
+        self._names = list(self._names)
+        self._person_schools = [array('i', school_ids) 
+                                for school_ids in self._person_schools]
+        self._members = None
+        
+    def school_id(self, school: str) -> int:
+        '''Return the id of the school, or None if it has none.'''
+        
+        if self._school_ids is None:
+            self._school_ids = {name: school_id for school_id, name 
+                                in enumerate(self._names)}
+        return self._school_ids.get(school)
+    
+    def intern(self, school: str) -> int:
+        '''Return the id of the school, giving it the next free id if it
+        does not have one yet.'''
+        
+        school_id = self.school_id(school)
+        if school_id is None:
+            school_id = len(self._names)
+            self._school_ids[school] = school_id
+            self._names.append(school)
+            if self._members is not None:
+                self._members.append(set())
+        return school_id
+        
+    def add_person(self, schools: 'list of str') -> int:
+        '''Add the next person, who went to schools, and return their id.
+        '''
+        
+        self._person_schools.append(array('i'))
+        idx = len(self._person_schools) - 1
+        self.set_schools(idx, schools)
+        return idx
+    
+    def set_schools(self, idx: int, schools: 'list of str') -> None:
+        '''Replace the schools of the person with id idx by schools.'''
+        
+        if self._members is not None:
+            for school_id in self._person_schools[idx]:
+                self._members[school_id].discard(idx)
+        school_ids = array('i')
+        for school in schools:
+            school_id = self.intern(school)
+            if school_id not in school_ids:
+                school_ids.append(school_id)
+        self._person_schools[idx] = school_ids
+        if self._members is not None:
+            for school_id in school_ids:
+                self._members[school_id].add(idx)
+        
+    def remove_person(self, idx: int) -> None:
+        '''Remove the person with id idx. To keep the ids dense, the person
+        with the last id takes over id idx.'''
+        
+        self.set_schools(idx, [])
+        last = len(self._person_schools) - 1
+        if idx != last:
+            if self._members is not None:
+                for school_id in self._person_schools[last]:
+                    self._members[school_id].discard(last)
+                    self._members[school_id].add(idx)
+            self._person_schools[idx] = self._person_schools[last]
+        self._person_schools.pop()
+    
+    def schools_of(self, idx: int) -> 'sequence of int':
+        '''Return the ids of the schools of the person with id idx.'''
+        
+        return self._person_schools[idx]
+    
+    def school_names(self, idx: int) -> list:
+        '''Return the names of the schools of the person with id idx.'''
+        
+        return [self._names[school_id] 
+                for school_id in self._person_schools[idx]]
+    
+    def members(self, school_id: int) -> 'collection of int':
+        '''Return the ids of the people who went to the school: a set, or a
+        sorted sequence in a snapshot.'''
+        
+        if self._members is None:
+            self.warm()
+        return self._members[school_id]
+    
+    def warm(self) -> None:
+        '''Build the inverted index from each school to its people now
+        rather than when it is first needed.'''
+        
+        if self._members is None:
+            members = [set() for _ in range(len(self._names))]
+            for idx, school_ids in enumerate(self._person_schools):
+                for member_school in school_ids:
+                    members[member_school].add(idx)
+            self._members = members
+
+
+######################### Snapshot Classes ####################################
+# A .timfb snapshot is an 8 byte magic, the number of people and schools and
+# the (byte offset, byte length) of each section below. Every section starts
+# on an 8 byte boundary and holds a flat array in native byte order, so it can
+# be used straight from the memory-mapped file.
+SNAPSHOT_MAGIC = b'TIMFB03' + (b'<' if sys.byteorder == 'little' else b'>')
+SNAPSHOT_SECTIONS = (('email_offsets', 'q'), ('email_blob', 'B'),
+                     ('name_offsets', 'q'), ('name_blob', 'B'),
+                     ('school_offsets', 'q'), ('school_blob', 'B'),
+                     ('person_school_offsets', 'q'), ('person_schools', 'i'),
+                     ('school_member_offsets', 'q'), ('school_members', 'i'),
+                     ('friend_offsets', 'q'), ('friends', 'i'),
+                     ('email_order', 'i'), ('name_order', 'i'), 
+                     ('name_ranks', 'i'), ('component_roots', 'i'),
+                     ('component_sizes', 'i'))
+SNAPSHOT_HEADER = struct.Struct('=8sQQ' + 'QQ' * len(SNAPSHOT_SECTIONS))
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class StringTable(object):
+    '''Read-only sequence of strings stored as an offsets array into a blob
+    of utf-8 bytes. Strings are only decoded when asked for.'''
+    
+    def __init__(self, offsets: 'sequence of int', blob: memoryview):
+        self._offsets = offsets
+        self._blob = blob
+        
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+    
+    def __getitem__(self, idx: int) -> str:
+        if idx < 0:
+            idx += len(self)
+        return str(self._blob[self._offsets[idx]:self._offsets[idx + 1]],
+                   'utf-8')
+    
+    def __iter__(self) -> 'iterator of str':
+        for idx in range(len(self)):
+            yield self[idx]
+
+
+class CSRAdjacency(object):
+    '''Read-only sequence of integer lists stored in compressed sparse row
+    form: the list at idx is targets[offsets[idx]:offsets[idx + 1]].'''
+    
+    def __init__(self, offsets: 'sequence of int', targets: 'sequence of int'):
+        self._offsets = offsets
+        self._targets = targets
+        
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+    
+    def __getitem__(self, idx: int) -> 'sequence of int':
+        return self._targets[self._offsets[idx]:self._offsets[idx + 1]]
+    
+    def __iter__(self) -> 'iterator':
+        for idx in range(len(self)):
+            yield self[idx]
+
+
+class SortedEmailIndex(object):
+    '''Read-only mapping from email to id, answered by binary search over
+    the ids sorted by email, so nothing has to be built when it is opened.'''
+    
+    def __init__(self, emails: 'StringTable', order: 'sequence of int'):
+        self._emails = emails
+        self._order = order
+        
+    def __len__(self) -> int:
+        return len(self._order)
+    
+    def get(self, email: str, default: int=None) -> int:
+        low, high = 0, len(self._order)
+        while low < high:
+            middle = (low + high) // 2
+            idx = self._order[middle]
+            found = self._emails[idx]
+            if found == email:
+                return idx
+            if found < email:
+                low = middle + 1
+            else:
+                high = middle
+        return default
+    
+    def __getitem__(self, email: str) -> int:
+        idx = self.get(email)
+        if idx is None:
+            raise KeyError(email)
+        return idx
+    
+    def __contains__(self, email: str) -> bool:
+        return self.get(email) is not None
+
+
+def string_table(strings: 'iterable of str') -> tuple:
+    '''Return the (offsets, blob) arrays of a StringTable holding strings.
+    '''
+    
+    offsets = array('q', [0])
+    blob = bytearray()
+    for string in strings:
+        blob += string.encode('utf-8')
+        offsets.append(len(blob))
+    return offsets, blob
+
+
+def csr_arrays(lists: 'iterable of list') -> tuple:
+    '''Return the (offsets, targets) arrays of a CSRAdjacency holding lists.
+    '''
+    
+    offsets = array('q', [0])
+    targets = array('i')
+    for lst in lists:
+        targets.extend(lst)
+        offsets.append(len(targets))
+    return offsets, targets
 
 
 ######################### SocialNetwork Class #################################
 class SocialNetwork(object):
-    def __init__(self):
-        '''Initializes the SocialNetwork class which contains a map of graph
-        of nodes in the form of a dictionary {nodes: list of nodes}
-        self._network, a list of emails self._emails and a list of nodes that 
-        corresponds to the list self._emails.'''
-        self._network = {}
+    # classmates checks each classmate with its own bounded search when x's
+    # schools have at most this many people.
+    PROBE_LIMIT = 16
+    # The fewest bytes of a .timf file parsed by one process when loading
+    # with workers.
+    PARSE_CHUNK = 1 << 20
+    # The sources searched at once by bit_parallel_search, one bit each:
+    # wider searches take fewer passes but up to SEARCH_WIDTH / 8 bytes per
+    # person.
+    SEARCH_WIDTH = 1024
+    
+    def __init__(self, cache_budget: int=0, backend: str='python',
+                 bitset_density: float=None, stats: bool=False):
+        '''Initializes the SocialNetwork class. Every email is interned to a
+        dense integer id through the dictionary self._email_ids, and every
+        other structure is indexed by that id: self._emails is the list of
+        emails, self._names the list of names, self._schools the SchoolIndex
+        holding the school ids of each person and self._network the array of
+        friend ids of each person, i.e. {id: array of ids} stored as a list.
+        Each friendship is stored once per side as an integer, and
+        self._nodes hands out Node views over all of this.
+        self._name_index holds the ids in alphabetical order of names and
+        the rank of every id in that order once they were needed; adding or
+        removing a person keeps the order and leaves the ranks None until
+        they are needed again.
+        
+        Indexes only some queries need are built by the first query that
+        needs them, so a short run pays only for the parse and its queries:
+        self._school_lines holds the unparsed schools of the people loaded
+        but not yet added to self._schools, and self._components holds the
+        connected components of the network once they were needed. warm()
+        builds all of them at once.
+        
+        When cache_budget is positive the breadth first searches of degree
+        queries are kept in a LayerCache holding at most cache_budget ids.
+        
+        backend chooses how the searches are run: 'python' (the default) or
+        'numpy', which uses the sparse matrix NumpyBackend of the
+        TwitInMyFace_numpy module and needs numpy and scipy.
+        
+        When bitset_density is given, the people of every component with at
+        least that fraction of all possible friendships get their friends as
+        bitsets in a DenseComponents index, which the searches then use for
+        them.
+        
+        When stats is True every query is counted in the QueryStats
+        self._stats; otherwise self._stats is None and costs nothing.
+        
+        self._index_lock is held while an index is built on first use, so
+        threads sharing the network build it once between them.'''
+        self._network = []
         self._emails = []
-        self._nodes = []
+        self._email_ids = {}
+        self._names = []
+        self._schools = SchoolIndex()
+        self._school_lines = []
+        self._nodes = NodeTable(self)
+        self._report = LoadReport()
+        self._cache = LayerCache(cache_budget) if cache_budget > 0 else None
+        self._components = None
+        if backend == 'python':
+            self._backend = None
+        elif backend == 'numpy':
+            from TwitInMyFace_numpy import NumpyBackend
+            self._backend = NumpyBackend(self)
+        else:
+            raise ValueError('Unknown backend {}'.format(backend))
+        self._bitset_density = bitset_density
+        self._bitsets = None
+        self._name_index = None
+        self._stats = QueryStats() if stats else None
+        self._index_lock = threading.Lock()
         
     ############################# Helper Methods #############################
-    def convert_to_lists(self, file: 'file to be read') -> None:
+    def convert_to_lists(self, file: 'file to be read') -> list:
         '''Modify self._emails so that it contains all the emails from the 
-        file and modify self._nodes into a list of nodes that are associated
-        with each email. No duplicates may exist in both lists.'''
+        file and modify self._names and self._school_lines so they hold the
+        name and schools of each email. Every new email is given the next
+        free id in self._email_ids. No duplicates may exist in both lists;
+        when an email is listed twice the first line wins. The file is
+        streamed through parse_timf, so only the graph itself is kept in
+        memory.
         
-        if isinstance(file, str):
-            opened_file = open(file, 'r')
-        else:
-            opened_file = file
-        for line in opened_file:
-            if not line.strip():
+        Return the list of friend ids each new person listed, in the order
+        of the file, so listed[k] belongs to the id of the first new person
+        plus k. Friends that never get a line of their own are dropped and
+        added to self._report along with any malformed or duplicate line.'''
+        
+        first = len(self._emails)
+        listed = []
+        # email not seen yet: list of (k, position in listed[k]) waiting for
+        # that email to get an id.
+        pending = {}
+        for name, email, schools, friends in parse_timf(file, self._report):
+            if email in self._email_ids:
+                self._report.add_duplicate(email)
                 continue
-            line = line.strip()
-            # The first element of two_elements list is the name of person.
-            two_elements = line.split('<')
-            name = two_elements[0]
-            # First element of two_sub_elements list is person's email
-            # and the second element is person's friends as a string.
-            two_sub_elements = two_elements[1].split('>(')
-            email = two_sub_elements[0]
-            rest = two_sub_elements[1].split('):')
-            schools = rest[0]
-            friends = rest[1]
+            idx = len(self._emails)
+            self._email_ids[email] = idx
             self._emails.append(email)
-            self._nodes.append(Node(name, email, schools, friends))
+            self._names.append(name)
+            self._school_lines.append(schools)
+            for waiting, position in pending.pop(email, ()):
+                listed[waiting][position] = idx
+            friends_ids = []
+            if friends:
+                for friend in friends.split(','):
+                    friend_idx = self._email_ids.get(friend)
+                    if friend_idx is None:
+                        pending.setdefault(friend, []).append(
+                            (idx - first, len(friends_ids)))
+                    friends_ids.append(friend_idx)
+            listed.append(friends_ids)
+        # Whatever is still pending was never defined in the file.
+        for friend, waiting_list in pending.items():
+            for waiting, position in waiting_list:
+                self._report.add_dangling(self._emails[first + waiting], 
+                                          friend)
+        if pending:
+            listed = [[friend for friend in friends_ids if friend is not None]
+                      for friends_ids in listed]
+        return listed
+    
+    def convert_to_lists_parallel(self, path: str, workers: int) -> list:
+        '''Do what convert_to_lists does for the file at path, the parsing
+        being shared by workers processes. The file is split into
+        line-aligned byte ranges, each parsed by parse_timf_range into the
+        people of its lines and the friends they list as indexes into a
+        table of the friend emails of the range. The ranges are merged in
+        file order, so the ids, the lists returned and self._report are the
+        same as those of convert_to_lists: every email gets the next free id
+        where it is first listed, then each table is looked up once to turn
+        the friends of its range into ids.'''
+        
+        ranges = timf_ranges(path, workers * 4, self.PARSE_CHUNK)
+        if len(ranges) <= 1:
+            return self.convert_to_lists(path)
+        import multiprocessing
+        email_ids = self._email_ids
+        # (id of the first person kept, positions kept, friend offsets, 
+        # friend indexes, friend table) of every range.
+        parsed = []
+        lines = 0
+        with multiprocessing.Pool(min(workers, len(ranges))) as pool:
+            for (emails, names, schools, offsets, refs, table, line_count, 
+                 report) in pool.imap(parse_timf_range, [
+                     (path, start, end) for start, end in ranges]):
+                self._report.records += report.records
+                for line_number, line in report.bad_lines:
+                    self._report.add_bad_line(lines + line_number, line)
+                self._report.bad_line_count += (report.bad_line_count - 
+                                                len(report.bad_lines))
+                lines += line_count
+                first = len(self._emails)
+                if (len(set(emails)) == len(emails) and 
+                        email_ids.keys().isdisjoint(emails)):
+                    # No duplicates: everyone of the range is kept.
+                    email_ids.update(zip(emails, itertools.count(first)))
+                    self._emails.extend(emails)
+                    self._names.extend(names)
+                    self._school_lines.extend(schools)
+                    parsed.append((first, None, offsets, refs, table))
+                    continue
+                kept = []
+                for position, email in enumerate(emails):
+                    if email in email_ids:
+                        self._report.add_duplicate(email)
+                        continue
+                    email_ids[email] = len(self._emails)
+                    self._emails.append(email)
+                    self._names.append(names[position])
+                    self._school_lines.append(schools[position])
+                    kept.append(position)
+                parsed.append((first, kept, offsets, refs, table))
+        
+        listed = []
+        # email never listed: ids of the people who listed it as a friend.
+        dangling = {}
+        for first, kept, offsets, refs, table in parsed:
+            ids = list(map(email_ids.get, table))
+            if None not in ids:
+                # Arrays rather than lists keep the garbage collector off the
+                # friends of everyone.
+                friends_ids = array('i', map(ids.__getitem__, refs))
+                if kept is None:
+                    listed.extend(map(friends_ids.__getitem__, 
+                                      map(slice, offsets, offsets[1:])))
+                else:
+                    listed.extend(friends_ids[offsets[position]:
+                                              offsets[position + 1]]
+                                  for position in kept)
+                continue
+            if kept is None:
+                kept = range(len(offsets) - 1)
+            for idx, position in enumerate(kept, first):
+                friends_ids = array('i')
+                for ref in refs[offsets[position]:offsets[position + 1]]:
+                    if ids[ref] is None:
+                        dangling.setdefault(table[ref], []).append(idx)
+                    else:
+                        friends_ids.append(ids[ref])
+                listed.append(friends_ids)
+        for friend, waiting_list in dangling.items():
+            for waiting in waiting_list:
+                self._report.add_dangling(self._emails[waiting], friend)
+        return listed
     
     def email_index(self: 'SocialNetwork', email: str) -> int:
-        '''Return the index of the email in the list self._emails'''
+        '''Return the id of the email, which is also its index in the list
+        self._emails. Raise ValueError if the email is not in the network.'''
         
-        return self._emails.index(email)
+        try:
+            return self._email_ids[email]
+        except KeyError:
+            raise ValueError('{} is not in the network'.format(email))
     
     def get_node(self: 'SocialNetwork', idx: int) -> 'Node':
         '''Return the node in self._nodes at given index idx.'''
         
         return self._nodes[idx]
     
+    def ids_to_names(self: 'SocialNetwork', ids: 'iterable of int') -> list:
+        '''Return a list of the names of the people with the given ids.'''
+        
+        names = self._names
+        return [names[idx] for idx in ids]
+    
+    def ids_to_emails(self: 'SocialNetwork', ids: 'iterable of int') -> list:
+        '''Return a list of the emails of the people with the given ids.'''
+        
+        emails = self._emails
+        return [emails[idx] for idx in ids]
+    
     def email_to_name(self: 'SocialNetwork', lst: list) -> list:
         """
         Return a list of the names of people which corresponds to 
         the list of given emails.
         """
         
-        result = []
-        for email in lst:
-            idx = self.email_index(email)
-            result.append(self._nodes[idx].get_name())
-        return result
+        return self.ids_to_names(self.email_index(email) for email in lst)
 
     def find_node_by_email(self: 'SocialNetwork', email: str) -> 'Node':
         """
@@ -167,126 +1295,583 @@ class SocialNetwork(object):
             result.append(node)
         return result
     
-    def read_from_file(self: 'SocialNetwork', file: 'file to be read') -> None:
-        """ Reads the file given and constructs a dictionary of everyone
-        If one person lists someone as their friend, but not the other way
-        around, we'll make them both considered friends with each other.
+    def read_from_file(self: 'SocialNetwork', file: 'file to be read',
+                       workers: int=None) -> None:
+        """ Reads the file given and constructs the list of friend ids of
+        everyone. If one person lists someone as their friend, but not the
+        other way around, we'll make them both considered friends with each
+        other. Runs in O(N + E): every listed friendship is looked at once per
+        direction and duplicates are dropped through a set per person.
+        A path is parsed by workers processes if more than one is given.
+        The people of the file are added after those already loaded, who
+        keep their ids and friends.
         """
         
-        self.convert_to_lists(file)
+        self.thaw()
+        first = len(self._emails)
+        if workers is not None and workers > 1 and isinstance(file, str):
+            listed = self.convert_to_lists_parallel(file, workers)
+        else:
+            listed = self.convert_to_lists(file)
         if len(self._emails) == 0:
             raise EmptyFileError()         
-        # Construct the dictionary of everyone.
-        # Node of person: node of person's friends
-        for node in self._nodes:
-            list_friends = node.get_friends()
-            friends_nodes = []
-            for email in list_friends:
-                idx = self.email_index(email)
-                friends_nodes.append(self._nodes[idx])
-            for person in self._network:
-                i = self.email_index(person.get_email())
-                item = self._nodes[i]
-                if (node in self._network[person]) and (item not in 
-                                                        friends_nodes):
-                    friends_nodes.append(item)
-            self._network[node] = friends_nodes
+        # Construct the adjacency of everyone.
+        # id of person - first: ids of person's friends
+        network = [[] for _ in range(len(listed))]
+        friend_sets = [set() for _ in range(len(listed))]
+        # First the friends each person listed, in the order of the file ...
+        for idx, friends_ids in enumerate(listed):
+            for friend in friends_ids:
+                if friend not in friend_sets[idx]:
+                    friend_sets[idx].add(friend)
+                    network[idx].append(friend)
+        # ... then everyone who listed them but was not listed back, people
+        # loaded before getting the new friends after their own.
+        # id of person loaded before: the new people added to their friends
+        old_added = {}
+        for idx, friends_ids in enumerate(listed, first):
+            for friend in friends_ids:
+                if friend < first:
+                    added = old_added.setdefault(friend, set())
+                    if idx not in added:
+                        added.add(idx)
+                        self._network[friend].append(idx)
+                elif idx not in friend_sets[friend - first]:
+                    friend_sets[friend - first].add(idx)
+                    network[friend - first].append(idx)
+        self._network.extend(array('i', friends_ids) 
+                             for friends_ids in network)
+        
+    def get_load_report(self: 'SocialNetwork') -> 'LoadReport':
+        '''Return the report of the problems found by the last load.'''
+        
+        return self._report
+    
+    def save_snapshot(self: 'SocialNetwork', path: str) -> None:
+        """
+        Write the network to path in the binary .timfb format: the email
+        and name tables, the school table, the schools of every person, the
+        people of every school and the friendships in CSR form, along with
+        the ids sorted by email, the name index and the component of every
+        id.
+        """
+        
+        with open(path, 'wb') as opened_file:
+            for part in self.snapshot_parts():
+                opened_file.write(part)
+                
+    def snapshot_parts(self: 'SocialNetwork') -> list:
+        """
+        Return the byte strings that make up the .timfb snapshot of the
+        network, padding included, in the order they are written.
+        """
+        
+        schools = self.school_index()
+        components = self.components()
+        sections = {}
+        (sections['email_offsets'], 
+         sections['email_blob']) = string_table(self._emails)
+        (sections['name_offsets'], 
+         sections['name_blob']) = string_table(self._names)
+        (sections['school_offsets'], 
+         sections['school_blob']) = string_table(schools._names)
+        (sections['person_school_offsets'], 
+         sections['person_schools']) = csr_arrays(schools._person_schools)
+        (sections['friend_offsets'], 
+         sections['friends']) = csr_arrays(self._network)
+        (sections['school_member_offsets'], 
+         sections['school_members']) = csr_arrays(
+             sorted(schools.members(school_id)) 
+             for school_id in range(len(schools._names)))
+        sections['email_order'] = array('i', sorted(
+            range(len(self._emails)), key=self._emails.__getitem__))
+        sections['name_order'], sections['name_ranks'] = self.name_index()
+        sections['component_roots'] = array(
+            'i', map(components.find, range(len(self._emails))))
+        sections['component_sizes'] = array('i', bytes(4 * len(self._emails)))
+        for root, size in components.sizes().items():
+            sections['component_sizes'][root] = size
+        
+        layout = []
+        parts = [b'']
+        position = SNAPSHOT_HEADER.size
+        for name, typecode in SNAPSHOT_SECTIONS:
+            parts.append(b'\0' * (-position % 8))
+            parts.append(bytes(sections[name]))
+            position += len(parts[-2])
+            layout.extend((position, len(parts[-1])))
+            position += len(parts[-1])
+        parts[0] = SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC, len(self._emails), len(schools._names), *layout)
+        return parts
+    
+    def load_snapshot(self: 'SocialNetwork', path: str) -> None:
+        """
+        Open the .timfb snapshot at path written by save_snapshot. The file
+        is memory-mapped and used in place: nothing is parsed up front and
+        the pages of the file are only read when a query touches them.
+        """
+        
+        with open(path, 'rb') as opened_file:
+            mapped = mmap.mmap(opened_file.fileno(), 0, 
+                               access=mmap.ACCESS_READ)
+        self.open_snapshot(mapped, path)
+        
+    def open_snapshot(self: 'SocialNetwork', mapped: 'buffer', 
+                      source: str) -> None:
+        """
+        Use the .timfb snapshot held in the buffer mapped, e.g. an mmap, in
+        place as the network. source names the buffer in errors.
+        """
+        
+        view = memoryview(mapped)
+        if len(view) < SNAPSHOT_HEADER.size:
+            raise SnapshotError('{} is not a .timfb snapshot'.format(source))
+        header = SNAPSHOT_HEADER.unpack_from(view)
+        if header[0] != SNAPSHOT_MAGIC:
+            raise SnapshotError('{} is not a .timfb snapshot for this '
+                                'machine'.format(source))
+        sections = {}
+        for i, (name, typecode) in enumerate(SNAPSHOT_SECTIONS):
+            position, length = header[3 + 2 * i], header[4 + 2 * i]
+            sections[name] = view[position:position + length].cast(typecode)
+        emails = StringTable(sections['email_offsets'], 
+                             sections['email_blob'])
+        names = StringTable(sections['name_offsets'], sections['name_blob'])
+        schools = StringTable(sections['school_offsets'], 
+                              sections['school_blob'])
+        person_schools = CSRAdjacency(sections['person_school_offsets'],
+                                      sections['person_schools'])
+        members = CSRAdjacency(sections['school_member_offsets'],
+                               sections['school_members'])
+        self._mapped = mapped
+        self._emails = emails
+        self._email_ids = SortedEmailIndex(emails, sections['email_order'])
+        self._network = CSRAdjacency(sections['friend_offsets'], 
+                                     sections['friends'])
+        self._names = names
+        self._schools = SchoolIndex(schools, person_schools, members)
+        self._school_lines = []
+        self._report = LoadReport()
+        self._report.records = header[1]
+        self.invalidate()
+        self._components = FlatComponents(sections['component_roots'],
+                                          sections['component_sizes'])
+        self._name_index = sections['name_order'], sections['name_ranks']
+        
+    def degree_layers(self: 'SocialNetwork', x: str, d: int) -> list:
+        """
+        Return the list of layers of a breadth first search from person x
+        that stops at depth d: layer k is the list of ids of the people
+        exactly k degrees from x. Fewer than d + 1 layers are returned when
+        nobody is left to reach.
+        """
+        
+        start = self.email_index(x)
+        if d < 0:
+            return []
+        # Nobody in a component of n people is more than n - 1 degrees away.
+        size = self.components().size_of(start)
+        if d >= size:
+            d = size - 1
+        if self._cache is not None:
+            layers = self._cache.layers(start, d)
+            if layers is not None:
+                return layers
+        layers = self.search_layers(start, d)
+        if self._cache is not None:
+            self._cache.put(start, layers, len(layers) <= d or d == size - 1)
+        return layers
+    
+    def search_layers(self: 'SocialNetwork', start: int, d: int) -> list:
+        """
+        Return the layers of a breadth first search from the person with id
+        start that stops at depth d, without looking at the cache.
+        """
+        
+        dense = self.bitset_index()
+        if dense is not None and dense.covers(start):
+            layers = dense.search_layers(start, d)
+        elif self._backend is not None:
+            layers = self._backend.search_layers(start, d)
+        else:
+            return self.python_search_layers(start, d)
+        if self._stats is not None:
+            self._stats.add_work(sum(len(layer) for layer in layers[:d]), 0)
+        return layers
+    
+    def python_search_layers(self: 'SocialNetwork', start: int, 
+                             d: int) -> list:
+        """
+        Return the layers of search_layers, searched one friend id at a
+        time over self._network. visited is a bytearray: allocating a list
+        of every id cost more than a shallow search itself.
+        """
+        
+        visited = bytearray(len(self._emails))
+        visited[start] = 1
+        layers = [[start]]
+        expanded = scanned = 0
+        while len(layers) <= d:
+            next_layer = []
+            for idx in layers[-1]:
+                friends = self._network[idx]
+                scanned += len(friends)
+                for friend in friends:
+                    if not visited[friend]:
+                        visited[friend] = 1
+                        next_layer.append(friend)
+            expanded += len(layers[-1])
+            if not next_layer:
+                break
+            layers.append(next_layer)
+        if self._stats is not None:
+            self._stats.add_work(expanded, scanned)
+        return layers
+    
+    def search_degree(self: 'SocialNetwork', start: int, target: int,
+                      limit: int=None) -> 'int or float':
+        """
+        Return the degree between the people with ids start and target, or
+        inf if there is no path between them or, when limit is given, no
+        path of at most limit edges. start and target must differ.
+        """
+        
+        # Search from both ends at once, always growing the smaller frontier.
+        # count is the number of edges between the two frontiers, and the
+        # two visited sets never overlap until the frontiers meet.
+        count = 0
+        frontier, other_frontier = [start], [target]
+        visited, other_visited = {start}, {target}
+        expanded = scanned = 0
+        while frontier and other_frontier:
+            if limit is not None and count >= limit:
+                break
+            if len(frontier) > len(other_frontier):
+                frontier, other_frontier = other_frontier, frontier
+                visited, other_visited = other_visited, visited
+            next_frontier = []
+            for idx in frontier:
+                friends = self._network[idx]
+                expanded += 1
+                scanned += len(friends)
+                for friend in friends:
+                    if friend in other_visited:
+                        if self._stats is not None:
+                            self._stats.add_work(expanded, scanned)
+                        return count + 1
+                    if friend not in visited:
+                        visited.add(friend)
+                        next_frontier.append(friend)
+            frontier = next_frontier
+            count = count + 1
+        if self._stats is not None:
+            self._stats.add_work(expanded, scanned)
+        return float('inf')
+    
+    def invalidate(self: 'SocialNetwork') -> None:
+        '''Forget everything derived from the graph, to be called whenever
+        a new graph is loaded.'''
+        
+        self.clear_cache()
+        self._components = None
+        self._name_index = None
+        
+    def clear_cache(self: 'SocialNetwork') -> None:
+        '''Forget the cached searches and the matrix of the backend, to be
+        called whenever a person or a friendship changes. The name index
+        only changes with the people, see add_person and remove_person.'''
+        
+        if self._cache is not None:
+            self._cache.clear()
+        if self._backend is not None:
+            self._backend.reset()
+        self._bitsets = None
+            
+    def adjacency_arrays(self: 'SocialNetwork') -> tuple:
+        '''Return the (offsets, targets) arrays of the friendships in CSR
+        form, as stored in a snapshot.'''
+        
+        if isinstance(self._network, CSRAdjacency):
+            return self._network._offsets, self._network._targets
+        return csr_arrays(self._network)
+            
+    def get_cache_stats(self: 'SocialNetwork') -> dict:
+        '''Return the counters of the layer cache, or None if it is off.'''
+        
+        if self._cache is None:
+            return None
+        return self._cache.get_stats()
+    
+    def get_query_stats(self: 'SocialNetwork') -> 'QueryStats':
+        '''Return the counters of the queries answered so far, or None if
+        stats are off.'''
+        
+        return self._stats
+    
+    def components(self: 'SocialNetwork') -> 'Components':
+        '''Return the connected components of the network, finding them
+        first if they are not known yet.'''
+        
+        if self._components is None:
+            with self._index_lock:
+                if self._components is None:
+                    components = Components(len(self._emails))
+                    for idx in range(len(self._network)):
+                        for friend in self._network[idx]:
+                            if friend > idx:
+                                components.union(idx, friend)
+                    self._components = components
+        return self._components
+    
+    def school_index(self: 'SocialNetwork') -> 'SchoolIndex':
+        '''Return the index holding the schools of every person and the
+        people of every school, adding the people loaded since the last
+        call first.'''
+        
+        if self._school_lines:
+            with self._index_lock:
+                for schools in self._school_lines:
+                    self._schools.add_person(schools.split(',') if schools 
+                                             else [])
+                self._school_lines = []
+        return self._schools
+    
+    def bitset_index(self: 'SocialNetwork') -> 'DenseComponents':
+        '''Return the friend bitsets of the dense components, building them
+        first if needed, or None if bitsets are off.'''
+        
+        if self._bitset_density is None:
+            return None
+        if self._bitsets is None:
+            self._bitsets = DenseComponents(self._network, self.components(),
+                                            self._bitset_density)
+        return self._bitsets
+    
+    def name_index(self: 'SocialNetwork') -> tuple:
+        '''Return (order, ranks): the array of all ids in alphabetical order
+        of names, people sharing a name by id, and the array of the position
+        of every id in order. Built the first time it is needed, the ranks
+        again after people were added or removed.'''
+        
+        if self._name_index is None or self._name_index[1] is None:
+            with self._index_lock:
+                if self._name_index is None:
+                    order = array('i', sorted(range(len(self._names)), 
+                                              key=self._names.__getitem__))
+                    self._name_index = order, None
+                order = self._name_index[0]
+                if self._name_index[1] is None:
+                    ranks = array('i', bytes(4 * len(order)))
+                    for rank, idx in enumerate(order):
+                        ranks[idx] = rank
+                    self._name_index = order, ranks
+        return self._name_index
+    
+    def name_position(self: 'SocialNetwork', idx: int) -> int:
+        '''Return the position of the id idx in the order of the name index,
+        or where it goes if it is not in it, by binary search on (name, id).
+        '''
+        
+        order, names = self._name_index[0], self._names
+        key = (names[idx], idx)
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high) // 2
+            if (names[order[middle]], order[middle]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+    
+    def names_in_order(self: 'SocialNetwork', ids: 'collection of int', 
+                       offset: int=0, limit: int=None) -> 'iterator of str':
+        '''Return an iterator over the names of the people with the given
+        distinct ids in alphabetical order, leaving out the first offset and
+        stopping after limit names. A page much smaller than ids is picked
+        with a heap, many ids are picked out of the whole order of the name
+        index if it is built, and others are sorted. The name index is not
+        built for this: without it, ids are compared by (name, id) instead
+        of by rank.'''
+        
+        names = self._names
+        index = self._name_index
+        if index is not None and index[1] is not None:
+            key = index[1].__getitem__
+        else:
+            key = lambda idx: (names[idx], idx)
+        stop = None if limit is None else offset + limit
+        if stop is not None and stop * 8 < len(ids):
+            chosen = heapq.nsmallest(stop, ids, key=key)
+        elif index is not None and len(ids) * 8 >= len(index[0]):
+            wanted = bytearray(len(index[0]))
+            for idx in ids:
+                wanted[idx] = 1
+            chosen = (idx for idx in index[0] if wanted[idx])
+        else:
+            chosen = sorted(ids, key=key)
+        return (names[idx] for idx in itertools.islice(chosen, offset, stop))
+    
+    def warm(self: 'SocialNetwork') -> None:
+        '''Build every index the queries may need now instead of at the first
+        query that needs it, e.g. before a server takes its first query.'''
+        
+        self.components()
+        self.name_index()
+        self.school_index().warm()
+        self.bitset_index()
+        if self._backend is not None:
+            self._backend.matrix()
+    
+    def component_of(self: 'SocialNetwork', email: str) -> int:
+        '''Return the id of the connected component of the person with the
+        given email. Two people are connected iff their components are the
+        same.'''
+        
+        return self.components().find(self.email_index(email))
+    
+    def component_sizes(self: 'SocialNetwork') -> dict:
+        '''Return {component id: number of people in it}.'''
+        
+        return self.components().sizes()
     
     def people_with_degree_list(self, x: str, d: int) -> list:
         """
-        Returns a list of emails that corresponds to every person within 
+        Returns a list of emails that corresponds to every person exactly
         'd' degrees from person x.
         """
-        list_of_people_with_seperation = []
-        
-        for i in range(len(self._emails)):
-            depth = self.degree_between(x, self._emails[i])
-            if depth == int(d):
-                list_of_people_with_seperation.append(self._emails[i])
         
-        return list_of_people_with_seperation   
+        d = int(d)
+        layers = self.degree_layers(x, d)
+        if d < 0 or len(layers) <= d:
+            return []
+        return self.ids_to_emails(layers[d])
         
     def mutual_friends_list(self, x: str, y: str) -> list:
         """
-        Returns a list of names of people who are mutual friends with person
-        x and person y.
-        """
-        
-        node1 = self.find_node_by_email(x)
-        node2 = self.find_node_by_email(y)
-        lst_1 = node1.get_friends()
-        lst_2 = node2.get_friends()
-        lst_1_friends = self.email_to_name(lst_1)
-        lst_2_friends = self.email_to_name(lst_2)
-        set_1 = set(lst_1_friends)
-        set_2 = set(lst_2_friends)
-        # Find the emails that appear in both set_1 and set_2.
-        intersect = set.intersection(set_1, set_2)
-        result_lst = list(intersect)
+        Returns a sorted list of names of people who are mutual friends with
+        person x and person y. Friends are matched by id, so two different
+        people who share a name are never mistaken for one mutual friend.
+        """
+        
+        idx_1, idx_2 = self.email_index(x), self.email_index(y)
+        dense = self.bitset_index()
+        if dense is not None and (dense.covers(idx_1) or dense.covers(idx_2)):
+            intersect = dense.mutual_ids(idx_1, idx_2)
+        elif self._backend is not None:
+            intersect = self._backend.mutual_ids(idx_1, idx_2)
+        else:
+            friends_1, friends_2 = self._network[idx_1], self._network[idx_2]
+            if len(friends_1) > len(friends_2):
+                friends_1, friends_2 = friends_2, friends_1
+            # Find the ids that appear in both lists.
+            set_2 = set(friends_2)
+            intersect = [idx for idx in friends_1 if idx in set_2]
+            if self._stats is not None:
+                self._stats.add_work(2, len(friends_1) + len(friends_2))
+        result_lst = self.ids_to_names(intersect)
         result_lst.sort()  
         return result_lst    
     
+    def mutual_counts(self, start: int) -> dict:
+        """
+        Return {id: number of mutual friends with the person with id start}
+        for everyone two degrees from that person who is not already their
+        friend. Only the friends of start and their friends are looked at.
+        """
+        
+        dense = self.bitset_index()
+        if dense is not None and dense.covers(start):
+            counts = dense.mutual_counts(start)
+        elif self._backend is not None:
+            counts = self._backend.mutual_counts(start)
+        else:
+            return self.python_mutual_counts(start)
+        if self._stats is not None:
+            self._stats.add_work(len(self._network[start]) + 1, 0)
+        return counts
+    
+    def python_mutual_counts(self, start: int) -> dict:
+        """
+        Return the counts of mutual_counts, counted one friend id at a time
+        over self._network.
+        """
+        
+        friends = self._network[start]
+        excluded = set(friends)
+        excluded.add(start)
+        counts = {}
+        scanned = len(friends)
+        for friend in excluded:
+            if friend == start:
+                continue
+            friends_of_friend = self._network[friend]
+            scanned += len(friends_of_friend)
+            for idx in friends_of_friend:
+                if idx not in excluded:
+                    counts[idx] = counts.get(idx, 0) + 1
+        if self._stats is not None:
+            self._stats.add_work(len(excluded), scanned)
+        return counts
+    
     def get_people_within_degrees(self: 'SocialNetwork', x: str, 
                                   d: int) -> list:
         """
         Returns a list of emails within a degree of separation of 'd' 
-        from person x.
+        from person x, not counting x, farthest people first.
         """
         if int(d) <= 0:
             return []
-        lst = self.people_with_degree_list(x, int(d))
-        for i in range(1, int(d)):
-            lst.extend(self.people_with_degree_list(x, int(d) - i))
+        layers = self.degree_layers(x, int(d))
+        lst = []
+        for layer in reversed(layers[1:]):
+            lst.extend(self.ids_to_emails(layer))
         return lst
     
     ############################## Main Methods ##############################
-    def load_from_file(self: 'SocialNetwork', file: 'file to be read') -> None:
+    def load_from_file(self: 'SocialNetwork', file: 'file to be read',
+                       workers: int=None) -> None:
         """
         Retrieves data from file and puts the data in 
-        self._network in the form of a dictionary. The dictionary format will
-        be {node: list of nodes} where each key of the dictionary is the node
-        of each person in the file and the value associated with each key is
-        the list of nodes that correspond to the person's friends.
+        self._network in the form of a list indexed by id. Each entry of the
+        list is the array of ids that correspond to the person's friends.
+        
+        When file is a path and workers is more than 1, the file is parsed
+        by that many processes, giving the same network and load report.
+        Loading another file adds its people to those already loaded.
         """
         
+        self.invalidate()
+        self._report = LoadReport()
         # Handles the exception where the file is empty.
         try:
-            self.read_from_file(file)
+            self.read_from_file(file, workers)
         except EmptyFileError:
             print('The File Is Empty')
-        # Ensure each friendship made is mutual, i.e A purports B is a friend,
-        # then A will automatically be listed as B's friend.
-        for key in self._network:
-            for item in self._network:
-                if item != key:
-                    if (key in self._network[item]) and (item not in 
-                                                         self._network[key]):
-                        self._network[key].append(item)
-        # Update the attribute _friends for each node in the dictionary, 
-        # if there is one.       
-        for key in self._network:
-            if (self._network[key] == key.get_friends()):
-                pass
-            else:
-                key._friends[:] = self._network[key]
-                # Do the same for the nodes in the list self._nodes
-                email = key.get_email()
-                idx = self.email_index(email)
-                lst = nodes_emails(self._network[key])
-                self._nodes[idx]._friends[:] = lst
                 
+    @instrumented('friends')
     def friends(self: 'SocialNetwork', email: str) -> str:
         """
         Return a string that contains the names of every friend of the
         person that has the email email.
         """
         
+        return ' '.join(self.iter_friends(email))
+    
+    def iter_friends(self: 'SocialNetwork', email: str, offset: int=0,
+                     limit: int=None) -> 'iterator of str':
+        """
+        Return an iterator over the names of the friends of the person with
+        the email in alphabetical order, from the offset-th on and at most
+        limit of them.
+        """
+        
         idx = self.email_index(email)
-        lst_nodes = self._network[self._nodes[idx]]
-        lst_friends = nodes_names(lst_nodes)
-        output = list_to_string(lst_friends)
-        return output
+        if self._stats is not None:
+            self._stats.add_work(1, len(self._network[idx]))
+        return self.names_in_order(set(self._network[idx]), offset, limit)
 
+    @instrumented('degree_between')
     def degree_between(self: "SocialNetwork", x: str, y: str) -> int:
         """
         Return the degree of separation between person x and person y 
@@ -296,41 +1881,32 @@ class SocialNetwork(object):
         and y. Return inf if no path is found between x and y.
         """
         
-        count = 0
-        # lst used to keep track of emails already looked at
-        lst = []
-        to_pass_through = []
-        # temp_list stores all the friends of nth iteration email 
-        # to be used for later
-        temp_list = []
-        # hold_values takes temp's contents and puts back into to_pass_through
-        hold_values = []
         if y == x:
-            return count
-        # start off we use the initial email, which is [[email_of_x]]
-        to_pass_through.append([x])
-        while to_pass_through != [[]]:
-            temp_list[:] = []
-            emails = to_pass_through.pop(0) 
-            for email in emails:
-                # Do not traverse through these nodes
-                lst.append(email)
-            for email in emails:
-                cur_node = self.find_node_by_email(email)
-                friends = cur_node.get_friends()
-                if cur_node.get_email() == y:
-                    return count
-                for friend in friends:
-                    if friend not in lst:
-                        temp_list.append(friend)
-            # replace hold_values with the contents of temp list
-            hold_values[:] = temp_list
-            # to_pass_through is [['email1'...]] or [[]] if we checked
-            # all friends possible already
-            to_pass_through[:] = [hold_values] 
-            count = count + 1
-        return float('inf')
+            return 0
+        start = self.email_index(x)
+        target = self._email_ids.get(y)
+        if target is None:
+            return float('inf')
+        # The components settle unconnected people at once once they are
+        # built, but building them costs more than one search.
+        components = self._components
+        if (components is not None and 
+                components.find(start) != components.find(target)):
+            return float('inf')
+        if self._cache is not None:
+            # Hot sources are answered from a full search from x, kept for
+            # the next query; others from the bidirectional search.
+            count = self._cache.distance(start, target)
+            if (count is None and self._cache.missed_again(start) and 
+                    self._cache.fits(self.components().size_of(start))):
+                layers = self.search_layers(start, len(self._emails))
+                entry = self._cache.put(start, layers, True)
+                count = entry.depths.get(target, float('inf'))
+            if count is not None:
+                return count
+        return self.search_degree(start, target)
            
+    @instrumented('people_with_degree')
     def people_with_degree(self, x: str, d: int) -> str:
         """
         Return a string that contains the names of every person separated from 
@@ -338,11 +1914,36 @@ class SocialNetwork(object):
         e-mail address). The names will be sorted in an alphabetical order. 
         """
         
-        lst_email = self.people_with_degree_list(x, int(d))
+        return ' '.join(self.iter_people_with_degree(x, d))
+    
+    def iter_people_with_degree(self, x: str, d: int, offset: int=0,
+                                limit: int=None) -> 'iterator of str':
+        """
+        Return an iterator over the names of the people exactly d degrees
+        from person x in alphabetical order, from the offset-th on and at
+        most limit of them.
+        """
+        
+        d = int(d)
+        layers = self.degree_layers(x, d)
+        if d < 0 or len(layers) <= d:
+            return iter(())
+        return self.names_in_order(layers[d], offset, limit)
+        
+    @instrumented('people_within_degrees')
+    def people_within_degrees(self, x: str, d: int) -> str:
+        """
+        Return a string that contains the names of every person within d 
+        degrees of separation of person x (where x is an e-mail address),
+        not counting x. The names will be sorted in an alphabetical order. 
+        """
+        
+        lst_email = self.get_people_within_degrees(x, int(d))
         lst_people = self.email_to_name(lst_email)
         output = list_to_string(lst_people)
         return output
         
+    @instrumented('mutual_friends')
     def mutual_friends(self, x: str, y: str) -> str:
         """
         Return a string that contains the names of people who are friends with 
@@ -354,6 +1955,7 @@ class SocialNetwork(object):
         output = list_to_string(lst)
         return output
     
+    @instrumented('likely_friends')
     def likely_friends(self, person: str) -> str:
         """
         Return a string that contains the names of missing friends for a
@@ -361,39 +1963,66 @@ class SocialNetwork(object):
         x is the person's email address. 
         """
         
-        # Max mutual will start as 1 because if it's 0, then it will assume
-        # that since x has zero mutual friends with y, we'll say that y is a
-        # likely candidate, even though x probably doesn't know y. By putting
-        # max_mutual = 1, we ensure that you have to at least have 1 friend in
-        # common.
-        max_mutual = 1
-        missing_friends = []
-        visited = []
-        visited.append(person)
-        node = self.find_node_by_email(person)
-        for friend in node.get_friends():
-            visited.append(friend)
-        for i in range(len(self._emails)):
-            # Search through every email that's avaliable in the graph
-            if self._emails[i] in visited:
-                continue
-            # list of people who have mutual friends with current person
-            lst_mutual = self.mutual_friends_list(person, self._emails[i])
-            num_mutual = len(lst_mutual)
-            # If the amount of mutual friends this person has with the other
-            # Exceeds the current friend that has a lot of mutual friends
-            # with the person, then we will replace the existing max with the
-            # new candidate, if they're equal we'll add those two people.
-            if num_mutual > max_mutual:
-                max_mutual = num_mutual
-                email = self._emails[i]
-                missing_friends[:] = [email]
-            elif num_mutual == max_mutual:
-                missing_friends.append(self._emails[i])
-        result_lst = self.email_to_name(missing_friends)
+        counts = self.mutual_counts(self.email_index(person))
+        # Nobody is suggested without at least 1 friend in common, since
+        # people with zero mutual friends probably don't know each other.
+        max_mutual = max(counts.values(), default=0)
+        missing_friends = [idx for idx, count in counts.items() 
+                           if count == max_mutual]
+        result_lst = self.ids_to_names(missing_friends)
         result = list_to_string(result_lst)
         return result
+    
+    @instrumented('likely_friends_topk')
+    def likely_friends_topk(self, person: str, k: int) -> list:
+        """
+        Return the k likeliest missing friends of person as a list of
+        (email, number of mutual friends) pairs, the most mutual friends
+        first and ties in alphabetical order of names, then emails.
+        """
+        
+        counts = self.mutual_counts(self.email_index(person))
+        names = self._names
+        ranked = heapq.nsmallest(int(k), counts.items(), key=lambda item: (
+            -item[1], names[item[0]], self._emails[item[0]]))
+        return [(self._emails[idx], count) for idx, count in ranked]
+        
+    def likely_friends_batch(self, output: 'file to be written', 
+                             emails: list=None, workers: int=None,
+                             shard_size: int=1000) -> int:
+        """
+        Write the likeliest missing friends of everyone in emails, or of
+        everyone in the network if emails is None, to output: one line per
+        person of the form 'email<TAB>names', names as in likely_friends.
+        
+        The people are split into shards of shard_size and the shards are
+        spread over workers processes (all the cores by default) that share
+        this network read-only. Lines are written as the shards finish, so
+        they are not in input order. Return the number of lines written.
+        """
         
+        if emails is None:
+            ids = range(len(self._emails))
+        else:
+            ids = [self.email_index(email) for email in emails]
+        shards = [ids[i:i + shard_size] for i in range(0, len(ids), 
+                                                       shard_size)]
+        written = 0
+        if workers == 1 or len(shards) <= 1:
+            for shard in shards:
+                for line in likely_friends_shard(shard, self):
+                    output.write(line)
+                    written += 1
+            return written
+        import multiprocessing
+        with multiprocessing.Pool(workers, initializer=set_worker_network,
+                                  initargs=(self,)) as pool:
+            for lines in pool.imap_unordered(likely_friends_shard, shards):
+                output.writelines(lines)
+                written += len(lines)
+        return written
+        
+    @instrumented('classmates')
     def classmates(self: 'SocialNetwork', x: str, d: int) -> str:
         """
         Return a string that contains the names of every person within 
@@ -401,403 +2030,587 @@ class SocialNetwork(object):
         same school as the person x and x is an email address of the person. 
         """
         
-        classmates = []
-        x_node = self.find_node_by_email(x)
-        lst_emails = self.get_people_within_degrees(x, int(d))
-        lst_nodes = self.emails_to_node(lst_emails)
-        # Check every node in lst_nodes to see if any person went
-        # to the same school as person x.
-        for node in lst_nodes:
-            for school in node.get_schools():
-                # If the person is not already in the list classmates and 
-                # go to the same schooll as x, then append the person to
-                # classmates.
-                if school in x_node.get_schools() and \
-                   node.get_name() not in classmates:
-                    classmates.append(node.get_name())
-        result = list_to_string(classmates)
-        return result
+        return ' '.join(self.iter_classmates(x, d))
+    
+    def iter_classmates(self: 'SocialNetwork', x: str, d: int, offset: int=0,
+                        limit: int=None) -> 'iterator of str':
+        """
+        Return an iterator over the names of the classmates of person x
+        within d degrees in alphabetical order, from the offset-th on and at
+        most limit of them.
+        
+        The people who went to x's schools are taken from the school index,
+        and whichever of them and the people within d degrees is smaller is
+        iterated over and checked against the other.
+        """
+        
+        start = self.email_index(x)
+        d = int(d)
+        schools = self.school_index()
+        components = self.components()
+        component = components.find(start)
+        school_ids = schools.schools_of(start)
+        candidates = sum(len(schools.members(school)) for school in school_ids)
+        classmates = set()
+        dense = self.bitset_index()
+        if d <= 0 or not candidates:
+            pass
+        elif dense is not None and dense.covers(start):
+            classmates.update(dense.classmates(start, d, schools))
+        elif candidates <= self.PROBE_LIMIT:
+            # A few classmates: check each one with a search bounded by d
+            # instead of finding everyone within d degrees.
+            for school in school_ids:
+                for idx in schools.members(school):
+                    if (idx != start and idx not in classmates and 
+                            components.find(idx) == component and 
+                            self.search_degree(start, idx, d) <= d):
+                        classmates.add(idx)
+        else:
+            layers = self.degree_layers(x, d)
+            within = sum(len(layer) for layer in layers) - 1
+            if within <= candidates:
+                # Iterate over the neighbourhood, checking each school.
+                school_set = set(school_ids)
+                for layer in layers[1:]:
+                    for idx in layer:
+                        if not school_set.isdisjoint(schools.schools_of(idx)):
+                            classmates.add(idx)
+            else:
+                # Iterate over the classmates, checking the neighbourhood.
+                ball = set()
+                for layer in layers[1:]:
+                    ball.update(layer)
+                for school in school_ids:
+                    classmates.update(idx for idx in schools.members(school) 
+                                      if idx in ball)
+        return self.names_in_order(classmates, offset, limit)
     
 
-########################### Unittest Test Cases ###############################
-class TestDegree(unittest.TestCase):
-        
-    def test_one_person_no_friend(self: 'TestDegree') -> None:
-        """
-        One person in the graph. Test to see if the degree between the start
-        and itself, is zero(0).
-        """
-        file = io.StringIO('person 1<one@toronto.ca>(Uni of Toronto): \n')
-        network = construct_network(file)
-        input_val = network.degree_between('one@toronto.ca', 'one@toronto.ca')
-        expected_output = 0
-        self.assertEqual(input_val, expected_output, 'Wrong degree between')
-    
-    def test_two_people_all_friends(self: 'TestDegree') -> None:
-        """
-        Two Nodes in the graph, both friends with each other. Test to see if
-        the degree between the two is 1.
-        """
-        file = io.StringIO('A Kirby<kirby@toronto.ca>(Uni of Toronto):'
-                           'metaknight@toronto.ca\n'
-                         
-                           'M Knight<metaknight@toronto.ca>(Uni of Toronto):'
-                           'kirby@toronto.ca\n')
-        network = construct_network(file)
-        input_val = network.degree_between('kirby@toronto.ca',
-                                           'metaknight@toronto.ca')
-        expected_output = 1
-        self.assertEqual(input_val, expected_output, 'Wrong degree between')
-        
-    def test_triangle_shaped_graph(self: 'TestDegree') -> None:
-        """
-        A graph with 3 nodes are generated. Every node in the graph is
-        connected to each other.
-        """
-        file = io.StringIO('Kyon<kyon@toronto.ca>(Uni of Toronto):'
-                           'Haruhi@toronto.ca\n'
-                   
-                        'Suzumiya Haruhi<Haruhi@toronto.ca>(Uni of Toronto):'
-                        'YukiN@toronto.ca\n'
-                        
-                        'Nagato Yuki<YukiN@toronto.ca>(Uni of Toronto):'
-                        'kyon@toronto.ca\n')
-        network = construct_network(file)
-        input_val = network.degree_between('kyon@toronto.ca',
-                                           'Haruhi@toronto.ca')
-        expected_output = 1
-        self.assertEqual(input_val, expected_output, 'Wrong degree between')        
-    
-    def test_two_people_no_path(self: 'TestDegree') -> None:
-        """
-        Two Nodes in the graph, testing degree_between one node and other,
-        with no path in between the nodes. Test to see if it returns inf
-        """
-        file = io.StringIO('A Kirby<kirby@toronto.ca>(Uni of Toronto): \n'
-                        'M Knight<metaknight@toronto.ca>(Uni of Toronto): \n')
-        network = construct_network(file)
-        input_val = network.degree_between('kirby@toronto.ca',
-                                           'metaknight@toronto.ca')
-        expected_output = float('inf')
-        self.assertEqual(input_val, expected_output, 'Wrong degree between')
-    
-    def test_one_friend_multiple_path_length(self: 'TestDegree') -> None:
-        """
-        Six Nodes in the graph.
-        Tests to see that degree of one node to another takes the shortest
-        path. First node only has one path then branches off 
-        converging to target.
-        """
-        file = io.StringIO('C Falcon<showmeyamoves@toronto.ca>'
-                           '(Uni of Toronto):'
-                           'FZero@toronto.ca\n'
-                   
-                           'F Zero<FZero@toronto.ca>(Uni of Toronto):'
-                           'kirby@toronto.ca,finn@toronto.ca\n'
-                   
-                           'A Kirby<kirby@toronto.ca>(Uni of Toronto):'
-                           'FZero@toronto.ca,king@princess.ca\n'
-                   
-                           'Finn<finn@toronto.ca>(Uni of Toronto):'
-                           'iceking@princess.ca\n'
-                   
-                           'Simon<iceking@princess.ca>(Uni of Toronto):'
-                           'king@princess.ca,finn@toronto.ca\n'
-                           
-                           'king<king@princess.ca>(Uni of Toronto): \n')
-        network = construct_network(file)
-        input_val = network.degree_between('showmeyamoves@toronto.ca',
-                                           'king@princess.ca')
-        expected_output = 3
-        self.assertEqual(input_val, expected_output, 'Wrong degree between')
-    
-    def test_one_path_one_friend(self: 'TestDegree') -> None:
-        """
-        Seven Nodes in the graph. Everyone has at most 1 friend.
-        Tests to see if it follows the path given.
-        looks like: X-o-o-o-o-Y-o
-        Where x is the start and y is the end
-        """
-        file = io.StringIO('C Falcon<showmeyamoves@toronto.ca>'
-                           '(Uni of Toronto):'
-                           'FZero@toronto.ca\n'
-                   
-                           'F Zero<FZero@toronto.ca>(Uni of Toronto):'
-                           'kirby@toronto.ca\n'
-                   
-                           'A Kirby<kirby@toronto.ca>(Uni of Toronto):'
-                           'cooguy@toronto.ca\n'
-                   
-                           'Coo Guy<cooguy@toronto.ca>(Uni of Toronto):'
-                           'iceking@princess.ca\n'
-                   
-                           'Simon<iceking@princess.ca>(Uni of Toronto):'
-                           'king@princess.ca\n'
-                           
-                           'king<king@princess.ca>(Uni of Toronto):'
-                           'meepo@geomancer.ca\n'
-                           
-                           'Meepo<meepo@geomancer.ca>(Uni of Toronto): \n')
-        network = construct_network(file)
-        input_val = network.degree_between('showmeyamoves@toronto.ca',
-                                           'king@princess.ca')
-        expected_output = 5
-        self.assertEqual(input_val, expected_output, 'Wrong degree between')
-    
-    def test_multiple_friends_multiple_path_length(self: 'TestDegree') -> None:
-        """
-        10 nodes in graph. Every person has more than 3 friends
-        Tests to see if degree between X and Y returns the shortest one.
-        """
-        file = io.StringIO('C Falcon<showmeyamoves@toronto.ca>'
-                           '(Uni of Toronto):'
-                           'FZero@toronto.ca,kirby@toronto.ca,'
-                           'cooguy@toronto.ca\n'
-                   
-                           'F Zero<FZero@toronto.ca>(Uni of Toronto):'
-                           'kirby@toronto.ca,showmeyamoves@toronto.ca,'
-                           'meepo@geomancer.ca\n'
-                   
-                           'A Kirby<kirby@toronto.ca>(Uni of Toronto):'
-                           'cooguy@toronto.ca,iceking@princess.ca,'
-                           'king@princess.ca,meepo@geomancer.ca,'
-                           'showmeyamoves@toronto.ca,FZero@toronto.ca\n'
-                   
-                           'Coo Guy<cooguy@toronto.ca>(Uni of Toronto):'
-                           'iceking@princess.ca,axe@axed.ca\n'
-                   
-                           'Simon<iceking@princess.ca>(Uni of Toronto):'
-                           'king@princess.ca,axe@axed.ca,'
-                           'cooguy@toronto.ca,dk@dragon.ca\n'
-                           
-                           'king<king@princess.ca>(Uni of Toronto):'
-                           'meepo@geomancer.ca,dk@dragon.ca,'
-                           'kirby@toronto.ca,iceking@princess.ca\n'
-                           
-                           'Meepo<meepo@geomancer.ca>(Uni of Toronto):'
-                           'dk@dragon.ca,king@princess.ca,kirby@toronto.ca,'
-                           'FZero@toronto.ca\n'
-                           
-                           'axe<axe@axed.ca>(Uni of Toronto):'
-                           'cooguy@toronto.ca,alistar@moo.ca,'
-                           'iceking@princess.ca\n'
-                           
-                           'alistar<alistar@moo.ca>(Uni of Toronto):'
-                           'dk@dragon.ca,axe@axed.ca,iceking@princess.ca\n'
-                           
-                           'Knight Davian<dk@dragon.ca>(Uni of Toronto):'
-                           'alistar@moo.ca,meepo@geomancer.ca,'
-                           'king@princess.ca,iceking@princess.ca\n')
-        network = construct_network(file)
-        input_val = network.degree_between('showmeyamoves@toronto.ca',
-                                           'king@princess.ca')
-        expected_output = 2
-        self.assertEqual(input_val, expected_output, 'Wrong degree between')
-
-    def test_a_lot_people_no_friends(self: 'TestDegree') -> None:
-        """
-        10 nodes in graph. No one is friends with one another
-        target is not itself. Test to see if degree_between returns 
-        infinity with a large set.
-        """
-        file = io.StringIO('C Falcon<showmeyamoves@toronto.ca>'
-                           '(Uni of Toronto): \n'
-                   
-                           'F Zero<FZero@toronto.ca>(Uni of Toronto): \n'
-                   
-                           'A Kirby<kirby@toronto.ca>(Uni of Toronto): \n'
-                   
-                           'Coo Guy<cooguy@toronto.ca>(Uni of Toronto): \n'
-                   
-                           'Simon<iceking@princess.ca>(Uni of Toronto): \n'
-                           
-                           'king<king@princess.ca>(Uni of Toronto): \n'
-                           
-                           'Meepo<meepo@geomancer.ca>(Uni of Toronto): \n'
-                           
-                           'axe<axe@axed.ca>(Uni of Toronto): \n'
-                           
-                           'alistar<alistar@moo.ca>(Uni of Toronto): \n'
-                           
-                           'Knight Davian<dk@dragon.ca>(Uni of Toronto): \n')
-        network = construct_network(file)
-        input_val = network.degree_between('showmeyamoves@toronto.ca',
-                                           'king@princess.ca')
-        expected_output = float('inf')
-        self.assertEqual(input_val, expected_output, 'Wrong degree between')
-        
-    def test_multiple_friends_same_path_length(self: 'TestDegree') -> None:
-        """
-        A graph with 6 nodes are created. Then 2 specific nodes will be
-        selected such that every path between these 2 nodes will yield
-        the same number of edges.
-        """
-        
-        file = io.StringIO('A Dylan<a@dra.net>(Uni of Toronto):c@dra.net,'
-                           'b@dra.net\nB Ba<b@dra.net>():e@dra.net\n'
-                           'E Ea<e@dra.net>():z@dra.net\nZ Za<z@dra.net>'
-                           '():d@dra.net\nD Da<d@dra.net>():c@dra.net\n'
-                           'C Ca<c@dra.net>():')
-        network = construct_network(file)
-        input_val = network.degree_between('a@dra.net', 'z@dra.net')
-        expected_output = 3
-        self.assertEqual(input_val, expected_output, 'Wrong degree between')       
-        
-    def test_multiple_friends_no_path(self: 'TestDegree') -> None:
-        """
-        A graph with 7 nodes are created. Then 2 specific nodes will be
-        selected such that no path exists between these two nodes.
-        """
-        file = io.StringIO('A Dylan<a@dra.net>(Uni of Toronto):c@dra.net,'
-                   'b@dra.net\nB Ba<b@dra.net>():\n'
-                   'E Ea<e@dra.net>():z@dra.net\nZ Za<z@dra.net>'
-                   '():d@dra.net\nD Da<d@dra.net>():\n'
-                   'C Ca<c@dra.net>():\nS Ta<s@dra.net>():')
-        network = construct_network(file)
-        input_val = network.degree_between('a@dra.net', 'z@dra.net')
-        expected_output = float('inf')
-        self.assertEqual(input_val, expected_output, 'Wrong degree between')
-    
-    def test_multiple_friends_one_path(self: 'TestDegree') -> None:
-        """
-        A graph with 9 nodes are created. Then 2 specific nodes will be 
-        selected such that only one path exists between the two nodes. 
-        Some paths will lead to a deadend. Test to see if even if it are 
-        deadends in the graph, degree_between can still find the path 
-        to target node from the beginning node.
-        """
-        
-        file = io.StringIO('A Dylan<a@dra.net>(Uni of Toronto):b@dra.net\n'
-                   'B Ba<b@dra.net>():c@dra.net,e@dra.net,g@dra.net\n'
-                   'C Ca<c@dra.net>():d@dra.net\n'
-                   'D Da<d@dra.net>():\n'
-                   'E Ea<e@dra.net>():f@dra.net\n'
-                   'F Fa<f@dra.net>():\n'
-                   'G Ga<g@dra.net>():h@dra.net,i@dra.net\n'
-                   'H Ha<h@dra.net>():\n'
-                   'I Ia<i@dra.net>():\n')
-        network = construct_network(file)
-        input_val = network.degree_between('a@dra.net', 'i@dra.net')
-        expected_output = 3
-        self.assertEqual(input_val, expected_output, 'Wrong degree between')                 
-    
-    def test_one_person_with_friends_same_person(self: 'TestDegree') -> None:
-        """
-        Graph contains 6 nodes. 5 nodes are connected to the same node. That 
-        same node is our target node. Test if the degree_between is still 0.
-        """
-        
-        file = io.StringIO('A Dylan<a@dra.net>(Uni of Toronto):\n'
-           'B Ba<b@dra.net>():a@dra.net\n'
-           'C Ca<c@dra.net>():a@dra.net\n'
-           'D Da<d@dra.net>():a@dra.net\n'
-           'E Ea<e@dra.net>():a@dra.net\n'
-           'F Fa<f@dra.net>():a@dra.net\n')
-        network = construct_network(file)
-        input_val = network.degree_between('a@dra.net', 'a@dra.net')
-        expected_output = 0
-        self.assertEqual(input_val, expected_output, 'Wrong degree between') 
-    
-    def test_long_graph_multiple_routes(self: 'TestDegree') -> None:
-        """
-        Graph with 20 are created. 2 specific nodes will be selected such that
-        multiple paths exist between those 2 nodes.
-        Test to see if the degree_between function can still find the shortest 
-        path.
-        """
-        
-        file = io.StringIO('A Dylan<a@dra.net>(Uni of Toronto):b@dra.net,'
-                           'e@dra.net,f@dra.net\n'
-                   'B Ba<b@dra.net>():c@dra.net,g@dra.net\n'
-                   'C Ca<c@dra.net>():h@dra.net\n'
-                   'D Da<d@dra.net>():e@dra.net\n'
-                   'E Ea<e@dra.net>():i@dra.net\n'
-                   'F Fa<f@dra.net>():j@dra.net\n,g@dra.net,i@dra.net'
-                   'G Ga<g@dra.net>():k@dra.net\n'
-                   'H Ha<h@dra.net>():g@dra.net,l@dra.net\n'
-                   'I Ia<i@dra.net>():m@dra.net\n'
-                   'J Ja<j@dra.net>():k@dra.net,m@dra.net,n@dra.net\n'
-                   'K Ka<k@dra.net>():n@dra.net\n'
-                   'L La<l@dra.net>():k@dra.net,n@dra.net\n'
-                   'M Ma<m@dra.net>():n@dra.net\n'
-                   'N Na<n@dra.net>():\n')
-        network = construct_network(file)
-        input_val = network.degree_between('a@dra.net', 'n@dra.net')
-        expected_output = 3
-        self.assertEqual(input_val, expected_output, 'Wrong degree between')
-        
-    def test_starter_no_connected_nodes(self: 'TestDegree') -> None:
-        """
-        Graph with 3 nodes, the starting node is not connected to any node
-        The other 2 nodes along with the target node is connected to each other
-        """
-        file = io.StringIO('Kyon<kyon@toronto.ca>(Uni of Toronto): \n'
-                   
-                        'Suzumiya Haruhi<Haruhi@toronto.ca>(Uni of Toronto):'
-                        'YukiN@toronto.ca\n'
-                        
-                        'Nagato Yuki<YukiN@toronto.ca>(Uni of Toronto):'
-                        'Haruhi@toronto.ca\n')
-        network = construct_network(file)
-        input_val = network.degree_between('kyon@toronto.ca',
-                                           'Haruhi@toronto.ca')
-        expected_output = float('inf')
-        self.assertEqual(input_val, expected_output, 'Wrong degree between')
-
-    def test_starter_no_connected_nodes(self: 'TestDegree') -> None:
-        """
-        Graph with 3 nodes, the starting node is connected to all nodes
-        avaliable except for the target node.
-        """
-        file = io.StringIO('Kyon<kyon@toronto.ca>(Uni of Toronto): \n'
-                   
-                        'Suzumiya Haruhi<Haruhi@toronto.ca>(Uni of Toronto):'
-                        'YukiN@toronto.ca\n'
-                        
-                        'Nagato Yuki<YukiN@toronto.ca>(Uni of Toronto):'
-                        'Haruhi@toronto.ca\n')
-        network = construct_network(file)
-        input_val = network.degree_between('Haruhi@toronto.ca',
-                                           'kyon@toronto.ca')
-        expected_output = float('inf')
-        self.assertEqual(input_val, expected_output, 'Wrong degree between')
-    
-    def test_275_people(self: 'TestDegree') -> None:
-        """
-        Graph with 275 nodes are randomly generated. One node and node adjacent
-        to that one node are selected. Test to see if degree_between is 1.
+    ############################ Mutation Methods ############################
+    def thaw(self: 'SocialNetwork') -> None:
+        '''Copy a network opened from a snapshot into plain lists, arrays and
+        dicts so it can be changed. Does nothing if it already can.'''
+        
+        if isinstance(self._network, list):
+            return
+        self._emails = list(self._emails)
+        self._email_ids = {email: idx for idx, email in enumerate(self._emails)}
+        self._names = list(self._names)
+        self.school_index().thaw()
+        self._network = [array('i', friends) for friends in self._network]
+        if self._name_index is not None:
+            self._name_index = array('i', self._name_index[0]), None
+        self._mapped = None
+        # Found again, in a form that can be changed, when needed.
+        self._components = None
+        
+    def add_person(self: 'SocialNetwork', name: str, email: str, 
+                   schools: 'list of str'=()) -> None:
+        """
+        Add a person with no friends yet to the network. Raise ValueError
+        if the email is already in the network.
         """
         
-        lst = []
-        lst_email = []
-        alph = 'abcdefghijklmnopqrstuvwxyz'
-        for i in range(275):
-            string = ''
-            last = ''
-            for n in range(5):
-                string += alph[random.randint(0, 25)]
-                last += alph[random.randint(0, 25)]
-            name = string + ' ' + last
-            email = string + '@user.net'
-            school = 'University of Kawaii'
-            if lst_email:
-                friends = lst_email[random.randint(0, len(lst_email) - 1)]
+        self.thaw()
+        if email in self._email_ids:
+            raise ValueError('{} is already in the network'.format(email))
+        self._email_ids[email] = len(self._emails)
+        self._emails.append(email)
+        self._names.append(name)
+        self.school_index().add_person(schools)
+        self._network.append(array('i'))
+        if self._name_index is not None:
+            order = self._name_index[0]
+            order.insert(self.name_position(len(self._emails) - 1), 
+                         len(self._emails) - 1)
+            self._name_index = order, None
+        self.clear_cache()
+        if self._components is not None:
+            self._components.add()
+            
+    def remove_person(self: 'SocialNetwork', email: str) -> None:
+        """
+        Remove the person with the email, and all their friendships, from the
+        network. The person with the last id takes over their id, so Node
+        views of that person must be fetched again.
+        """
+        
+        self.thaw()
+        idx = self.email_index(email)
+        former = [friend for friend in self._network[idx] if friend != idx]
+        for friend in former:
+            self._network[friend].remove(idx)
+        self.school_index().remove_person(idx)
+        last = len(self._emails) - 1
+        if self._name_index is not None:
+            # The last person is taken out of the name order too, and put
+            # back under their new id once they moved.
+            order = self._name_index[0]
+            del order[self.name_position(idx)]
+            if idx != last:
+                del order[self.name_position(last)]
+            self._name_index = order, None
+        if idx != last:
+            # Move the last person into the free id.
+            for friend in self._network[last]:
+                friends = self._network[friend]
+                friends[friends.index(last)] = idx
+            self._network[idx] = self._network[last]
+            self._names[idx] = self._names[last]
+            self._emails[idx] = self._emails[last]
+            self._email_ids[self._emails[idx]] = idx
+        self._network.pop()
+        self._names.pop()
+        self._emails.pop()
+        del self._email_ids[email]
+        if self._name_index is not None and idx != last:
+            order.insert(self.name_position(idx), idx)
+        # The component only split if the friends of the person are no
+        # longer connected to each other, in which case the components are
+        # found again when needed.
+        if self._components is not None:
+            moved = [idx if friend == last else friend for friend in former]
+            if any(self.search_degree(moved[0], friend) == float('inf')
+                   for friend in moved[1:]):
+                self._components = None
             else:
-                friends = ''
-            final = name + '<' + email + '>(' + school + '):' + friends + '\n'
-            if email not in lst_email:
-                lst_email.append(email)
-                lst.append(final)
-        final_file = ''.join(lst)
-        file = io.StringIO(final_file)
-        network = construct_network(file)
-        starting_email = network._emails[150]
-        end_email = network.find_node_by_email(starting_email).get_friends()
-        input_val = network.degree_between(starting_email, end_email[0])
-        expected_output = 1
-        self.assertEqual(input_val, expected_output, 'Wrong degree between')
-     
-     
-################################ Unittest end #################################      
+                self._components.remove(idx, former[0] if former else None)
+        self.clear_cache()
+        
+    def add_friendship(self: 'SocialNetwork', a: str, b: str) -> None:
+        """
+        Make the people with emails a and b friends with each other.
+        """
+        
+        self.thaw()
+        idx_a, idx_b = self.email_index(a), self.email_index(b)
+        if idx_b in self._network[idx_a]:
+            return
+        self._network[idx_a].append(idx_b)
+        if idx_a != idx_b:
+            self._network[idx_b].append(idx_a)
+        if self._components is not None:
+            self._components.union(idx_a, idx_b)
+        self.clear_cache()
+        
+    def remove_friendship(self: 'SocialNetwork', a: str, b: str) -> None:
+        """
+        Make the people with emails a and b no longer friends.
+        """
+        
+        self.thaw()
+        idx_a, idx_b = self.email_index(a), self.email_index(b)
+        if idx_b not in self._network[idx_a]:
+            return
+        self._network[idx_a].remove(idx_b)
+        if idx_a != idx_b:
+            self._network[idx_b].remove(idx_a)
+            # The component only split if a and b are now disconnected, in
+            # which case the components are found again when needed.
+            if (self._components is not None and 
+                    self.search_degree(idx_a, idx_b) == float('inf')):
+                self._components = None
+        self.clear_cache()
+        
+    def set_schools(self: 'SocialNetwork', email: str, 
+                    schools: 'list of str') -> None:
+        """
+        Replace the schools of the person with the email by schools.
+        """
+        
+        self.thaw()
+        self.school_index().set_schools(self.email_index(email), schools)
+        if self._bitsets is not None:
+            self._bitsets.forget_schools()
+            
+    def bit_parallel_search(self: 'SocialNetwork', 
+                            sources: 'sequence of int') -> tuple:
+        """
+        Run a breadth first search from every id of sources at once and
+        return (counts, eccentricities): counts[d - 1] is the number of
+        (source, person) pairs d degrees apart and eccentricities[k] the
+        largest degree between sources[k] and anyone they can reach.
+        
+        Source k owns bit k of the int kept for every person: seen holds
+        the sources that reached them and frontier those that reached them
+        at the last depth, so one pass over the friends of the frontier
+        moves every search one step with a single OR per friendship.
+        """
+        
+        network = self._network
+        seen = [0] * len(network)
+        frontier = {}
+        for bit, idx in enumerate(sources):
+            seen[idx] |= 1 << bit
+            frontier[idx] = frontier.get(idx, 0) | 1 << bit
+        counts = []
+        # reached[d - 1]: the sources that reached someone new at depth d.
+        reached = []
+        while frontier:
+            touched = {}
+            get = touched.get
+            for idx, bits in frontier.items():
+                for friend in network[idx]:
+                    touched[friend] = get(friend, 0) | bits
+            frontier = {}
+            count = 0
+            level = 0
+            for idx, bits in touched.items():
+                new = bits & ~seen[idx]
+                if new:
+                    seen[idx] |= new
+                    frontier[idx] = new
+                    count += new.bit_count()
+                    level |= new
+            if frontier:
+                counts.append(count)
+                reached.append(level)
+        eccentricities = [0] * len(sources)
+        # The sources whose eccentricity is not known yet.
+        remaining = (1 << len(sources)) - 1
+        for depth in range(len(reached), 0, -1):
+            bits = reached[depth - 1] & remaining
+            for bit in bit_positions(bits):
+                eccentricities[bit] = depth
+            remaining &= ~bits
+        return counts, eccentricities
+    
+    def separations(self: 'SocialNetwork', emails: 'list of str'=None,
+                    workers: int=None, progress: 'callable'=None) -> tuple:
+        """
+        Return (histogram, eccentricities) of the people of emails, or of
+        everyone if emails is None. histogram maps every degree d to the
+        number of (person of emails, other person) pairs d degrees apart, in
+        increasing order of d, ending with inf for the pairs with no path
+        between them if there are any. eccentricities maps every email to
+        the largest degree between that person and anyone they can reach, 0
+        if they have no friends.
+        
+        The people are searched SEARCH_WIDTH at a time with
+        bit_parallel_search, the searches being spread over workers
+        processes that share this network read-only if workers is more than
+        one. progress, if given, is called with (people searched so far,
+        people to search) after every SEARCH_WIDTH people.
+        """
+        
+        if emails is None:
+            emails = self._emails
+        ids = [self.email_index(email) for email in emails]
+        batches = [ids[i:i + self.SEARCH_WIDTH] 
+                   for i in range(0, len(ids), self.SEARCH_WIDTH)]
+        counts = []
+        eccentricities = {}
+        done = 0
+        pool = None
+        if workers is not None and workers > 1 and len(batches) > 1:
+            import multiprocessing
+            pool = multiprocessing.Pool(workers, 
+                                        initializer=set_worker_network,
+                                        initargs=(self,))
+            results = pool.imap(separation_batch, batches)
+        else:
+            results = (separation_batch(batch, self) for batch in batches)
+        try:
+            for batch, (batch_counts, batch_eccentricities) in zip(batches,
+                                                                   results):
+                counts.extend([0] * (len(batch_counts) - len(counts)))
+                for depth, count in enumerate(batch_counts):
+                    counts[depth] += count
+                for idx, eccentricity in zip(batch, batch_eccentricities):
+                    eccentricities[self._emails[idx]] = eccentricity
+                done += len(batch)
+                if progress is not None:
+                    progress(done, len(ids))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        histogram = {depth: count for depth, count in enumerate(counts, 1)}
+        unreachable = len(ids) * (len(self._emails) - 1) - sum(counts)
+        if unreachable:
+            histogram[float('inf')] = unreachable
+        return histogram, eccentricities
+    
+    def separation_summary(self: 'SocialNetwork', histogram: dict, 
+                           sources: int) -> dict:
+        """
+        Return the statistics of a histogram given by separations for
+        sources people: the number of sources and of pairs, of those
+        connected, the mean, median and largest degree of the connected
+        pairs, and the histogram itself.
+        """
+        
+        connected = {depth: count for depth, count in histogram.items() 
+                     if depth != float('inf')}
+        pairs = sum(connected.values())
+        median = 0
+        below = 0
+        for depth, count in connected.items():
+            below += count
+            if 2 * below >= pairs:
+                median = depth
+                break
+        return {'sources': sources,
+                'exact': sources == len(self._emails),
+                'pairs': sources * (len(self._emails) - 1),
+                'connected_pairs': pairs,
+                'mean_separation': (sum(depth * count for depth, count in 
+                                        connected.items()) / pairs 
+                                    if pairs else 0.0),
+                'median_separation': median,
+                'max_separation': max(connected, default=0),
+                'histogram': histogram}
+    
+    def separation_stats(self: 'SocialNetwork', samples: int=1000, 
+                         seed: int=0, workers: int=None,
+                         progress: 'callable'=None) -> dict:
+        """
+        Return the separation_summary of the separations from samples
+        people picked at random with the given seed to everyone, or from
+        everyone if samples is None or at least the size of the network, in
+        which case the statistics are exact for all pairs.
+        """
+        
+        people = len(self._emails)
+        if samples is None or samples >= people:
+            emails = self._emails
+        else:
+            import random
+            emails = [self._emails[idx] for idx in sorted(
+                random.Random(seed).sample(range(people), samples))]
+        histogram, eccentricities = self.separations(emails, workers,
+                                                     progress)
+        return self.separation_summary(histogram, len(emails))
+    
+
+######################### Shared Graph Class ##################################
+def attach_memory(name: str) -> 'mmap.mmap':
+    """
+    Return a read-only mmap of the existing shared memory block name.
+    
+    The block is opened as a SharedMemory that is closed again at once, so
+    no SharedMemory is left whose close fails while views of the block are
+    alive, and it is not registered with the resource tracker of this
+    process, which would otherwise unlink it when this process ends.
+    """
+    
+    # Imported here: shared_memory imports random, which plain queries do
+    # not need.
+    from multiprocessing import resource_tracker, shared_memory
+    if sys.version_info >= (3, 13):
+        memory = shared_memory.SharedMemory(name, track=False)
+    else:
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            memory = shared_memory.SharedMemory(name)
+        finally:
+            resource_tracker.register = register
+    try:
+        if os.name == 'nt':
+            return mmap.mmap(-1, memory.size, tagname=name, 
+                             access=mmap.ACCESS_READ)
+        return mmap.mmap(memory._fd, memory.size, access=mmap.ACCESS_READ)
+    finally:
+        memory.close()
+
+
+class SharedGraph(object):
+    '''Versions of a SocialNetwork published in shared memory for other
+    processes to query in place, without copying or unpickling them.
+    
+    Each version is a .timfb snapshot in a block of its own, named after
+    name and the version number. A small control block called name holds
+    the current version and the name of its block, written under a
+    sequence counter that is odd while they change, so readers retry
+    instead of seeing half of an update. Publishing a version unlinks the
+    block of the previous one: processes still using it keep their mapping
+    until they move on, and nobody can open it any more.
+    
+    The process that creates the SharedGraph publishes and finally closes
+    it; every other process opens it by name and calls network() before
+    each query to get the current version.'''
+    
+    CONTROL = struct.Struct('=Q64s')
+    
+    def __init__(self, name: str, create: bool=False, **options):
+        '''Open the shared graph called name, creating it if create is
+        True. options are given to the SocialNetwork of every version
+        opened, e.g. cache_budget or stats.'''
+        
+        self.name = name
+        self._options = options
+        self._owner = create
+        self._block = None
+        self._version = 0
+        self._network = None
+        if create:
+            from multiprocessing import shared_memory
+            self._control = shared_memory.SharedMemory(
+                name, create=True, size=self.CONTROL.size)
+            self._control.buf[:self.CONTROL.size] = bytes(self.CONTROL.size)
+            self._view = self._control.buf
+        else:
+            self._control = attach_memory(name)
+            self._view = self._control
+            
+    def current(self) -> tuple:
+        '''Return the current version and the name of its block; version 0
+        means nothing was published yet.'''
+        
+        while True:
+            sequence, block = self.CONTROL.unpack_from(self._view)
+            if sequence % 2 == 0 and self.CONTROL.unpack_from(
+                    self._view)[0] == sequence:
+                return sequence // 2, block.rstrip(b'\0').decode()
+            
+    def publish(self, network: 'SocialNetwork') -> int:
+        '''Publish network as the next version and return its number.'''
+        
+        from multiprocessing import shared_memory
+        parts = network.snapshot_parts()
+        version = self.current()[0] + 1
+        name = '{}_{}'.format(self.name, version)
+        block = shared_memory.SharedMemory(
+            name, create=True, size=sum(len(part) for part in parts))
+        position = 0
+        for part in parts:
+            block.buf[position:position + len(part)] = part
+            position += len(part)
+        self.CONTROL.pack_into(self._view, 0, 2 * version - 1, 
+                               name.encode())
+        self.CONTROL.pack_into(self._view, 0, 2 * version, name.encode())
+        if self._block is not None:
+            self._block.close()
+            self._block.unlink()
+        self._block = block
+        return version
+    
+    def network(self) -> 'SocialNetwork':
+        '''Return the SocialNetwork of the current version, opening it the
+        first time. Raise SnapshotError if nothing was published yet.'''
+        
+        while True:
+            version, block = self.current()
+            if version == self._version:
+                return self._network
+            if version == 0:
+                raise SnapshotError('Nothing was published as {}'.format(
+                    self.name))
+            try:
+                mapped = attach_memory(block)
+            except FileNotFoundError:
+                # A newer version replaced it while we were looking.
+                continue
+            network = SocialNetwork(**self._options)
+            network.open_snapshot(mapped, block)
+            self._network, self._version = network, version
+            
+    def close(self) -> None:
+        '''Stop using the shared graph. The process that created it also
+        unlinks every block, after which nobody can open it again.'''
+        
+        self._network = None
+        self._version = 0
+        if self._owner:
+            self._view = None
+            if self._block is not None:
+                self._block.close()
+                self._block.unlink()
+                self._block = None
+            self._control.close()
+            self._control.unlink()
+        else:
+            self._view = None
+            self._control.close()
+
+
+######################### Batch Worker Functions ##############################
+# The network shared by the functions run in worker processes, set once per
+# worker by set_worker_network.
+worker_network = None
+
+
+def set_worker_network(network: 'SocialNetwork') -> None:
+    """
+    Make network the network used by this worker process.
+    """
+    global worker_network
+    worker_network = network
+
+
+def likely_friends_shard(ids: 'sequence of int', 
+                         network: 'SocialNetwork'=None) -> list:
+    """
+    Return the lines 'email<TAB>names' of the likeliest missing friends of
+    the people with the given ids, in network or in the network of this
+    worker process.
+    """
+    
+    if network is None:
+        network = worker_network
+    lines = []
+    for idx in ids:
+        email = network._emails[idx]
+        lines.append('{}\t{}\n'.format(email, 
+                                          network.likely_friends(email)))
+    return lines
+
+
+def separation_batch(ids: 'sequence of int', 
+                     network: 'SocialNetwork'=None) -> tuple:
+    """
+    Return the bit_parallel_search of network, or of the network of this
+    worker process, from the people with the given ids.
+    """
+    
+    if network is None:
+        network = worker_network
+    return network.bit_parallel_search(ids)
+
+
+def parse_timf_range(task: tuple) -> tuple:
+    """
+    Parse the lines of the byte range start to end of the .timf file at
+    path, task being (path, start, end). Return (emails, names, schools,
+    friend offsets, friend indexes, friend table, number of lines, load
+    report): the people of every well formed line in order, duplicates
+    included, the friends of the k-th one being the emails of the friend
+    table at friend indexes[friend offsets[k]:friend offsets[k + 1]]. The
+    line numbers of the report count from the start of the range.
+    """
+    
+    path, start, end = task
+    report = LoadReport()
+    emails, names, schools = [], [], []
+    offsets, refs = array('i', [0]), array('i')
+    # friend email: its index in table
+    table = {}
+    line_count = 0
+    with open(path, 'rb') as opened_file, mmap.mmap(
+            opened_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        
+        def lines() -> 'iterator of bytes':
+            nonlocal line_count
+            mapped.seek(start)
+            while mapped.tell() < end:
+                line_count += 1
+                yield mapped.readline()
+        
+        for name, email, school_line, friends in parse_timf(lines(), report):
+            emails.append(email)
+            names.append(name)
+            schools.append(school_line)
+            if friends:
+                refs.extend(table.setdefault(friend, len(table)) 
+                            for friend in friends.split(','))
+            offsets.append(len(refs))
+    return emails, names, schools, offsets, refs, list(table), line_count, \
+        report
+
+
 if __name__ == '__main__':
-    unittest.main(exit=False)
+    # The tests live in test_TwitInMyFace.py, out of the way of imports.
+    import unittest
+    unittest.main(module='test_TwitInMyFace', exit=False)
@@ -0,0 +1,314 @@
+"""
+      TwitInMyFace Benchmarks
+
+Synthetic .timf generator and the scaling benchmark of SocialNetwork.
+
+    python TwitInMyFace_Bench.py generate big.timf --people 1000000
+    python TwitInMyFace_Bench.py run --sizes 1000 10000 100000 \\
+        --output new.json --compare old.json
+
+Authors:
+    Jason Tran
+    Steven Tan
+"""
+
+import argparse
+import bisect
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from array import array
+
+import TwitInMyFace
+import TwitInMyFace_Driver
+
+
+FIRST_NAMES = ['Anya', 'Steve', 'David', 'Jonathan', 'Harold', 'Brian',
+               'Annie', 'Henry', 'Hannibal', 'Andy', 'Dewey', 'Rosalie']
+LAST_NAMES = ['Tafliovich', 'Engels', 'Liu', 'Lung', 'Finch', 'Law',
+              'Jekyll', 'Lecter', 'Hwang', 'Finn', 'Mullins', 'Evil']
+COMMANDS = ('friends', 'degree', 'degrees', 'within', 'mutual', 'likely',
+            'classmates')
+
+
+######################### Generator ###########################################
+def generate_timf(file: 'path or file object', people: int,
+                  degree: float=10, exponent: float=2.5, schools: int=100,
+                  components: int=1, seed: int=0) -> None:
+    """
+    Write a random network of people to file in the .timf format.
+
+    Friendships follow the Chung-Lu model: the k-th person of a component
+    gets the weight degree * k ** (-1 / (exponent - 1)), rescaled so the
+    mean weight is degree, and lists about half their weight of friends
+    drawn in proportion to weight, so degrees follow a power law with the
+    given exponent. People are split into the given number of components
+    of equal size that share no friendships. Each person went to up to two
+    of the schools, popular schools being much more likely. Lines are
+    written as they are made, so any size fits in memory.
+    """
+
+    if isinstance(file, str):
+        with open(file, 'w') as opened_file:
+            generate_timf(opened_file, people, degree, exponent, schools,
+                          components, seed)
+        return
+    generator = random.Random(seed)
+    alpha = 1 / (exponent - 1)
+    # cumulative[i] is the total weight of the people 0 .. i.
+    cumulative = array('d')
+    bounds = [people * c // components for c in range(components + 1)]
+    weights = []
+    for c in range(components):
+        size = bounds[c + 1] - bounds[c]
+        raw = [(k + 1) ** -alpha for k in range(size)]
+        scale = degree * size / sum(raw) if size else 0
+        total = cumulative[-1] if cumulative else 0.0
+        for weight in raw:
+            weight = min(weight * scale, size - 1)
+            weights.append(weight)
+            total += weight
+            cumulative.append(total)
+    school_weights = [(k + 1) ** -1.0 for k in range(schools)]
+    school_names = ['School {}'.format(k) for k in range(schools)]
+
+    for c in range(components):
+        low, high = bounds[c], bounds[c + 1]
+        before = cumulative[low - 1] if low else 0.0
+        span = cumulative[high - 1] - before if high > low else 0.0
+        for idx in range(low, high):
+            wanted = weights[idx] / 2
+            count = int(wanted) + (generator.random() < wanted % 1)
+            friends = set()
+            for attempt in range(count):
+                friend = bisect.bisect_left(
+                    cumulative, before + generator.random() * span,
+                    low, high)
+                if friend != idx:
+                    friends.add(min(friend, high - 1))
+            chosen = set()
+            if schools:
+                chosen.update(generator.choices(
+                    range(schools), school_weights,
+                    k=generator.randint(0, 2)))
+            file.write('{} {}<p{}@example.com>({}):{}\n'.format(
+                generator.choice(FIRST_NAMES), generator.choice(LAST_NAMES),
+                idx, ','.join(school_names[k] for k in sorted(chosen)),
+                ','.join('p{}@example.com'.format(f)
+                         for f in sorted(friends))))
+
+
+######################### Benchmark ###########################################
+def percentile(sorted_values: list, fraction: float) -> float:
+    """
+    Return the value below which the given fraction of sorted_values lies.
+    """
+
+    if not sorted_values:
+        return 0.0
+    position = min(int(fraction * len(sorted_values)),
+                   len(sorted_values) - 1)
+    return sorted_values[position]
+
+
+def random_queries(graph: 'SocialNetwork', command: str, count: int,
+                   generator: 'random.Random') -> list:
+    """
+    Return count random queries of the given driver command against graph,
+    as lists of words.
+    """
+
+    emails = graph._emails
+    queries = []
+    for n in range(count):
+        x = emails[generator.randrange(len(emails))]
+        if command in ('friends', 'likely'):
+            queries.append([command, x])
+        elif command in ('degree', 'mutual'):
+            queries.append([command, x,
+                            emails[generator.randrange(len(emails))]])
+        else:
+            queries.append([command, x, str(generator.randint(1, 3))])
+    return queries
+
+
+def peak_memory() -> int:
+    """
+    Return the peak resident memory of this process so far, in bytes.
+    """
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def measure(path: str, queries: int, seed: int) -> dict:
+    """
+    Load the .timf file at path and time queries random queries of every
+    driver command against it. Return the results as a dictionary.
+    """
+
+    start = time.perf_counter()
+    graph = TwitInMyFace.SocialNetwork()
+    graph.load_from_file(path)
+    load_time = time.perf_counter() - start
+    result = {'people': len(graph._emails),
+              'friendships': sum(len(friends) for friends in
+                                 graph._network) // 2,
+              'load_seconds': load_time,
+              'load_people_per_second': len(graph._emails) / load_time,
+              'commands': {}}
+    generator = random.Random(seed)
+    for command in COMMANDS:
+        latencies = []
+        for query in random_queries(graph, command, queries, generator):
+            start = time.perf_counter()
+            TwitInMyFace_Driver.answer_query(query, graph)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        total = sum(latencies)
+        result['commands'][command] = {
+            'queries': len(latencies),
+            'queries_per_second': len(latencies) / total if total else 0.0,
+            'p50_seconds': percentile(latencies, 0.5),
+            'p90_seconds': percentile(latencies, 0.9),
+            'p99_seconds': percentile(latencies, 0.99),
+            'max_seconds': latencies[-1] if latencies else 0.0}
+    result['peak_memory_bytes'] = peak_memory()
+    return result
+
+
+def measure_in_child(path: str, queries: int, seed: int,
+                     results: 'multiprocessing.Queue') -> None:
+    """
+    Run measure in a fresh process, so its peak memory is its own, and put
+    the result on results.
+    """
+
+    results.put(measure(path, queries, seed))
+
+
+def run_benchmark(sizes: 'list of int', queries: int=100,
+                  directory: str=None, seed: int=0, label: str='',
+                  **generator_options) -> dict:
+    """
+    Generate a network of every size in directory (a temporary one by
+    default), measure it in a fresh process and return all the results.
+    """
+
+    context = multiprocessing.get_context('spawn')
+    results = {'label': label, 'python': platform.python_version(),
+               'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'sizes': {}}
+    with tempfile.TemporaryDirectory() as temporary:
+        for size in sizes:
+            path = os.path.join(directory or temporary,
+                                'bench_{}.timf'.format(size))
+            if not os.path.exists(path):
+                generate_timf(path, size, seed=seed, **generator_options)
+            queue = context.Queue()
+            child = context.Process(target=measure_in_child,
+                                    args=(path, queries, seed, queue))
+            child.start()
+            results['sizes'][str(size)] = queue.get()
+            child.join()
+            print_size(size, results['sizes'][str(size)])
+    return results
+
+
+def print_size(size: int, result: dict) -> None:
+    """
+    Print the results of one size as a table.
+    """
+
+    print('{} people, {} friendships: loaded in {:.3f}s ({:.0f} people/s), '
+          'peak memory {:.1f} MB'.format(
+              result['people'], result['friendships'],
+              result['load_seconds'], result['load_people_per_second'],
+              result['peak_memory_bytes'] / 2 ** 20))
+    print('  {:<11}{:>12}{:>12}{:>12}{:>12}{:>12}'.format(
+        'command', 'queries/s', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms'))
+    for command, timing in result['commands'].items():
+        print('  {:<11}{:>12.1f}{:>12.3f}{:>12.3f}{:>12.3f}{:>12.3f}'.format(
+            command, timing['queries_per_second'],
+            timing['p50_seconds'] * 1000, timing['p90_seconds'] * 1000,
+            timing['p99_seconds'] * 1000, timing['max_seconds'] * 1000))
+
+
+def compare(old: dict, new: dict) -> list:
+    """
+    Return lines comparing the load time and the median latency of every
+    command between two saved benchmark results, as new / old ratios.
+    """
+
+    lines = ['{} -> {} (ratio new / old, above 1 is slower)'.format(
+        old.get('label') or 'old', new.get('label') or 'new')]
+    for size, result in new['sizes'].items():
+        if size not in old['sizes']:
+            continue
+        before = old['sizes'][size]
+        lines.append('{} people: load {:.2f}, memory {:.2f}'.format(
+            size, result['load_seconds'] / before['load_seconds'],
+            result['peak_memory_bytes'] / before['peak_memory_bytes']))
+        for command, timing in result['commands'].items():
+            if command in before['commands']:
+                old_p50 = before['commands'][command]['p50_seconds']
+                lines.append('  {:<11} p50 {:.2f}'.format(
+                    command, timing['p50_seconds'] / old_p50
+                    if old_p50 else float('inf')))
+    return lines
+
+
+def main():
+    '''The TwitInMyFace benchmark program.'''
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[3])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help='write a random .timf')
+    generate.add_argument('output')
+    generate.add_argument('--people', type=int, default=1000)
+    run = commands.add_parser('run', help='run the scaling benchmark')
+    run.add_argument('--sizes', type=int, nargs='+',
+                     default=[1000, 10000, 100000])
+    run.add_argument('--queries', type=int, default=100,
+                     help='queries timed per command and size')
+    run.add_argument('--directory',
+                     help='where to keep the generated files (reused)')
+    run.add_argument('--label', default='', help='name of this version')
+    run.add_argument('--output', help='save the results as JSON')
+    run.add_argument('--compare', help='JSON results to compare with')
+    for command in (generate, run):
+        command.add_argument('--degree', type=float, default=10)
+        command.add_argument('--exponent', type=float, default=2.5)
+        command.add_argument('--schools', type=int, default=100)
+        command.add_argument('--components', type=int, default=1)
+        command.add_argument('--seed', type=int, default=0)
+    options = parser.parse_args()
+
+    generator_options = {'degree': options.degree,
+                         'exponent': options.exponent,
+                         'schools': options.schools,
+                         'components': options.components}
+    if options.command == 'generate':
+        generate_timf(options.output, options.people, seed=options.seed,
+                      **generator_options)
+        return
+    results = run_benchmark(options.sizes, options.queries,
+                            options.directory, options.seed, options.label,
+                            **generator_options)
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    if options.compare:
+        with open(options.compare) as saved:
+            print('\n'.join(compare(json.load(saved), results)))
+
+
+if __name__ == '__main__':
+    main()
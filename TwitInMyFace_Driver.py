@@ -1,55 +1,403 @@
+import argparse
+import itertools
+import multiprocessing
 import sys
-from TwitInMyFace import SocialNetwork
+import time
+import os
+from TwitInMyFace import SharedGraph, SocialNetwork
 
-def initialize_graph() -> 'SocialNetwork':
+def initialize_graph(graph_filename: str=None) -> 'SocialNetwork':
     '''Return a SocialNetwork that is loaded from a file. The name of the file
-    to be loaded is provided at the command line or defaults to 'example.timf'
+    to be loaded is graph_filename, or else provided at the command line or
+    defaults to 'example.timf'.
+    A file ending in '.timfb' is opened as a binary snapshot. The graph
+    counts its queries for the stats command.
     '''
 
     # Choose a file name
-    graph_filename = (sys.argv[1:] + ['example.timf'])[0]
+    if graph_filename is None:
+        graph_filename = (sys.argv[1:] + ['example.timf'])[0]
     
     # Build and return a graph
-    graph = SocialNetwork()
-    graph.load_from_file(open(graph_filename))
+    graph = SocialNetwork(stats=True)
+    if graph_filename.endswith('.timfb'):
+        graph.load_snapshot(graph_filename)
+    else:
+        graph.load_from_file(open(graph_filename))
+    report = graph.get_load_report()
+    if not report.is_clean():
+        print(report, file=sys.stderr)
     return graph
     
 
-def process_input(query: 'list of str', graph: 'SocialNetwork') -> bool:
-    '''Handle query commands (friends, degree, etc.) against graph and
-    return True iff the 'quit' command is given.
+# The number of words of the commands whose names can be paged with two more
+# words, offset and limit, e.g. 'degrees annie@mgo.org 2 100 50'.
+PAGED_COMMANDS = {'friends': 2, 'degrees': 3, 'classmates': 3}
+# The query type the stats count those commands under.
+PAGED_QUERY_TYPES = {'friends': 'friends', 'degrees': 'people_with_degree', 
+                     'classmates': 'classmates'}
+# The most names of a streamed output line held at once.
+STREAM_CHUNK = 1024
+
+
+def is_paged(query: 'list of str') -> bool:
+    '''Return True iff query is a friends, degrees or classmates query,
+    with or without offset and limit. The d of degrees and classmates must
+    be an int, and offset and limit ints of at least 0.'''
+    
+    words = PAGED_COMMANDS.get(query[0]) if query else None
+    if words is None or len(query) not in (words, words + 2):
+        return False
+    if words == 3:
+        try:
+            int(query[2])
+        except ValueError:
+            return False
+    return all(word.isdecimal() for word in query[words:])
+
+
+def stream_query(query: 'list of str', 
+                 graph: 'SocialNetwork') -> 'iterator of str':
+    '''Return an iterator over the names answering a friends, degrees or
+    classmates query against graph, in alphabetical order and paged if the
+    query ends with offset and limit, or None for any other query.
     '''
     
-    if len(query) == 2 and query[0] == 'friends':
-        print(graph.friends(query[1]))
+    if not is_paged(query):
+        return None
+    page = [int(word) for word in query[PAGED_COMMANDS[query[0]]:]]
+    if query[0] == 'friends':
+        return graph.iter_friends(query[1], *page)
+    elif query[0] == 'degrees':
+        return graph.iter_people_with_degree(query[1], query[2], *page)
+    return graph.iter_classmates(query[1], query[2], *page)
+
+
+def join_names(graph: 'SocialNetwork', query: 'list of str') -> str:
+    '''Return the names answering a paged query against graph joined into
+    one output line.'''
+    
+    return ' '.join(stream_query(query, graph))
+
+
+def write_names(graph: 'SocialNetwork', query: 'list of str', 
+                output: 'file') -> None:
+    '''Write the names answering a paged query against graph to output,
+    STREAM_CHUNK at a time instead of joining them into one string first.
+    '''
+    
+    names = stream_query(query, graph)
+    chunk = ' '.join(itertools.islice(names, STREAM_CHUNK))
+    while chunk:
+        output.write(chunk)
+        chunk = ' '.join(itertools.islice(names, STREAM_CHUNK))
+        if chunk:
+            output.write(' ')
+
+
+def counted(graph: 'SocialNetwork', query: 'list of str', 
+            method: 'function', *args) -> object:
+    '''Return method(graph, query, *args) for a paged query, counted by the
+    query stats of graph, if it keeps them, as the whole query: the names
+    are picked as they are consumed, after the iterator is made.
+    '''
+    
+    stats = graph.get_query_stats()
+    if stats is None:
+        return method(graph, query, *args)
+    return stats.record(PAGED_QUERY_TYPES[query[0]], graph, method, 
+                        (query,) + args, {})
+    
+
+def answer_query(query: 'list of str', graph: 'SocialNetwork') -> str:
+    '''Return the output line of a query command (friends, degree, etc.)
+    against graph, or None iff the 'quit' command is given.
+    '''
+    
+    if is_paged(query):
+        return counted(graph, query, join_names)
 
     elif len(query) == 3 and query[0] == 'degree':
-        print(graph.degree_between(query[1], query[2]))
+        return str(graph.degree_between(query[1], query[2]))
 
-    elif len(query) == 3 and query[0] == 'degrees':
-        print(graph.people_with_degree(query[1], query[2]))
+    elif len(query) == 3 and query[0] == 'within':
+        return graph.people_within_degrees(query[1], query[2])
 
     elif len(query) == 3 and query[0] == 'mutual':
-        print(graph.mutual_friends(query[1], query[2]))
+        return graph.mutual_friends(query[1], query[2])
 
     elif len(query) == 2 and query[0] == 'likely':
-        print(graph.likely_friends(query[1]))
-
-    elif len(query) == 3 and query[0] == 'classmates':
-        print(graph.classmates(query[1], query[2]))
+        return graph.likely_friends(query[1])
+                
+    elif query == ['stats']:
+        stats = graph.get_query_stats()
+        return 'Query stats are off.' if stats is None else str(stats)
+    
+    elif query == ['stats', 'json']:
+        stats = graph.get_query_stats()
+        return 'null' if stats is None else stats.to_json()
                 
     elif query == ['quit']:
-        return False
+        return None
         
     else:
-        print('Invalid command or wrong number of arguments provided.')
-        
+        return 'Invalid command or wrong number of arguments provided.'
+
+
+def write_answer(query: 'list of str', graph: 'SocialNetwork', 
+                 output: 'file'=None) -> bool:
+    '''Write the output line of a query command against graph to output
+    (stdout by default) and return False iff the 'quit' command is given.
+    The names of friends, degrees and classmates are written STREAM_CHUNK
+    at a time instead of being joined into one string first.
+    '''
+    
+    if output is None:
+        output = sys.stdout
+    if is_paged(query):
+        counted(graph, query, write_names, output)
+    else:
+        answer = answer_query(query, graph)
+        if answer is None:
+            return False
+        output.write(answer)
+    output.write('\n')
     return True
 
+
+def process_input(query: 'list of str', graph: 'SocialNetwork') -> bool:
+    '''Handle query commands (friends, degree, etc.) against graph and
+    return False iff the 'quit' command is given.
+    '''
+    
+    return write_answer(query, graph)
+
+
+# The graph queried by batch worker processes, set by set_worker_graph, or
+# the SharedGraph whose current version they query, set by 
+# attach_worker_graph.
+worker_graph = None
+worker_shared = None
+
+
+def set_worker_graph(graph: 'SocialNetwork') -> None:
+    '''Make graph the graph queried by this worker process.'''
+    
+    global worker_graph
+    worker_graph = graph
+    
+
+def attach_worker_graph(name: str) -> None:
+    '''Make this worker process query the current version of the shared
+    graph called name.'''
+    
+    global worker_shared
+    worker_shared = SharedGraph(name)
+    
+    
+def share_graph(graph: 'SocialNetwork') -> 'SharedGraph':
+    '''Publish graph as a new SharedGraph named after this process and
+    return it, for worker processes to attach with attach_worker_graph.'''
+    
+    shared = SharedGraph('timf_{}'.format(os.getpid()), create=True)
+    shared.publish(graph)
+    return shared
+
+
+def answer_line(line: str, graph: 'SocialNetwork'=None) -> str:
+    '''Return the output line of the query on line against graph, or the
+    graph of this worker process (the current version if it is shared).
+    Unknown emails give an error line instead of stopping the batch.
+    '''
+    
+    if graph is None and worker_shared is not None:
+        graph = worker_shared.network()
+    elif graph is None:
+        graph = worker_graph
+    try:
+        return answer_query(line.split(), graph)
+    except ValueError as error:
+        return 'Error: {}'.format(error)
+
+
+def answer_pooled_line(line: str) -> str:
+    '''Return the output line of the query on line against the graph of
+    this worker process, as answer_line does, except for stats: each worker
+    only counts its own queries, so stats gives an error line instead.
+    '''
+    
+    if line.split()[:1] == ['stats']:
+        return 'Error: stats is not available with --workers'
+    return answer_line(line)
+
+
+def batch(args: 'list of str', graph: 'SocialNetwork') -> None:
+    '''Run the batch subcommand: answer every query of a file, or of stdin,
+    without prompting, writing the outputs in input order.
+    '''
+    
+    parser = argparse.ArgumentParser(
+        prog='TwitInMyFace_Driver.py [file] batch',
+        description='Answer one query per line, as typed at the prompt.')
+    parser.add_argument('queries', nargs='?', default='-',
+                        help='file of queries (default: stdin)')
+    parser.add_argument('--output', default='-',
+                        help='file to write the outputs to (default: stdout)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes answering queries')
+    parser.add_argument('--shared', action='store_true',
+                        help='workers query one copy of the graph in shared '
+                        'memory instead of a copy each')
+    options = parser.parse_args(args)
+    
+    if options.queries == '-':
+        queries = sys.stdin
+    else:
+        queries = open(options.queries)
+    if options.output == '-':
+        output = open(sys.stdout.fileno(), 'w', buffering=1 << 16, 
+                      closefd=False)
+    else:
+        output = open(options.output, 'w', buffering=1 << 16)
+    # Stop at the first quit, like the prompt does.
+    lines = (line for line in queries if line.strip())
+    lines = itertools.takewhile(lambda line: line.split() != ['quit'], lines)
+    
+    count = 0
+    start = time.perf_counter()
+    shared = None
+    if options.workers > 1 and options.shared:
+        shared = share_graph(graph)
+        pool = multiprocessing.Pool(options.workers, 
+                                    initializer=attach_worker_graph,
+                                    initargs=(shared.name,))
+        answers = pool.imap(answer_pooled_line, lines, chunksize=64)
+    elif options.workers > 1:
+        pool = multiprocessing.Pool(options.workers, 
+                                    initializer=set_worker_graph,
+                                    initargs=(graph,))
+        answers = pool.imap(answer_pooled_line, lines, chunksize=64)
+    else:
+        pool = None
+        answers = None
+    try:
+        if answers is None:
+            # One process streams the long outputs straight to output.
+            for line in lines:
+                try:
+                    write_answer(line.split(), graph, output)
+                except ValueError as error:
+                    output.write('Error: {}\n'.format(error))
+                count += 1
+        for answer in answers or ():
+            output.write(answer)
+            output.write('\n')
+            count += 1
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if shared is not None:
+            shared.close()
+        output.close()
+        if queries is not sys.stdin:
+            queries.close()
+    elapsed = time.perf_counter() - start
+    print('Answered {} queries in {:.3f}s ({:.0f} queries/s)'.format(
+        count, elapsed, count / elapsed if elapsed else 0), file=sys.stderr)
+
+def likely_all(args: 'list of str', graph: 'SocialNetwork') -> None:
+    '''Run the likely-all subcommand: write the likeliest missing friends of
+    everyone, or of the given people, to a file using a pool of processes.
+    '''
+    
+    parser = argparse.ArgumentParser(
+        prog='TwitInMyFace_Driver.py [file] likely-all',
+        description='Write "email<TAB>likely friends" for every person.')
+    parser.add_argument('output', help='file to write the results to')
+    parser.add_argument('emails', nargs='*', 
+                        help='people to suggest friends for (default: all)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of processes (default: all the cores)')
+    options = parser.parse_args(args)
+    with open(options.output, 'w') as output:
+        written = graph.likely_friends_batch(output, options.emails or None,
+                                             options.workers)
+    print('Wrote likely friends of {} people to {}'.format(written, 
+                                                          options.output))
+    
+
+def separations(args: 'list of str', graph: 'SocialNetwork') -> None:
+    '''Run the separations subcommand: print the degrees of separation
+    between sampled people, or everyone, and everybody else, optionally
+    writing the eccentricity of every person searched to a file.
+    '''
+    
+    parser = argparse.ArgumentParser(
+        prog='TwitInMyFace_Driver.py [file] separations',
+        description='Print the histogram and statistics of the degrees of '
+        'separation from sampled people to everyone.')
+    parser.add_argument('--samples', type=int, default=1000,
+                        help='people searched from (0: everyone)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes searching')
+    parser.add_argument('--eccentricities', 
+                        help='file to write "email<TAB>eccentricity" to')
+    parser.add_argument('--json', action='store_true',
+                        help='print the statistics as one line of JSON')
+    options = parser.parse_args(args)
+    
+    if 0 < options.samples < len(graph._emails):
+        import random
+        emails = [graph._emails[idx] for idx in sorted(random.Random(
+            options.seed).sample(range(len(graph._emails)), options.samples))]
+    else:
+        emails = None
+    
+    def progress(done: int, total: int) -> None:
+        print('\rSearched from {} of {} people'.format(done, total), 
+              end='' if done < total else '\n', file=sys.stderr)
+    
+    start = time.perf_counter()
+    histogram, eccentricities = graph.separations(emails, options.workers,
+                                                  progress)
+    elapsed = time.perf_counter() - start
+    stats = graph.separation_summary(histogram, len(eccentricities))
+    if options.eccentricities:
+        with open(options.eccentricities, 'w') as output:
+            for email, eccentricity in eccentricities.items():
+                output.write('{}\t{}\n'.format(email, eccentricity))
+    if options.json:
+        import json
+        stats['histogram'] = {str(depth): count 
+                              for depth, count in histogram.items()}
+        print(json.dumps(stats))
+        return
+    print('{} of {} pairs connected ({} sources{}), {:.3f}s'.format(
+        stats['connected_pairs'], stats['pairs'], stats['sources'],
+        '' if stats['exact'] else ', sampled', elapsed))
+    print('mean {:.3f}, median {}, max {}'.format(
+        stats['mean_separation'], stats['median_separation'], 
+        stats['max_separation']))
+    for depth, count in histogram.items():
+        print('{:>6}{:>16}'.format(depth, count))
+    
+
 def main():
     '''The main TwitInMyFace program.'''
     
     graph = initialize_graph()
+    
+    if sys.argv[2:3] == ['likely-all']:
+        likely_all(sys.argv[3:], graph)
+        return
+    if sys.argv[2:3] == ['batch']:
+        batch(sys.argv[3:], graph)
+        return
+    if sys.argv[2:3] == ['separations']:
+        separations(sys.argv[3:], graph)
+        return
 
     while process_input(input('>>> ').split(), graph):
         pass            
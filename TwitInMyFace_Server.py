@@ -0,0 +1,257 @@
+"""
+      TwitInMyFace Server
+
+Long-running query server of one SocialNetwork. Clients connect over TCP or
+a Unix socket and send the commands of the driver prompt, one per line;
+every command gets its output line back, in the order sent. Clients may
+send many commands without waiting for the answers.
+
+    python TwitInMyFace_Server.py example.timf --port 4000 --workers 4
+    python TwitInMyFace_Server.py example.timf --unix /tmp/timf.sock
+    python TwitInMyFace_Server.py big.timfb --workers 16 --shared
+
+Authors:
+    Jason Tran
+    Steven Tan
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import threading
+
+import TwitInMyFace_Driver
+
+
+class QueryServer(object):
+    '''Answers the commands of every connection against graph. Cheap
+    commands are answered on the event loop; likely, and degrees, within
+    and classmates with d of at least HEAVY_DEPTH, are sent to executor so
+    they do not hold up the other connections. executor is either a
+    ProcessPoolExecutor whose processes were given the graph with
+    TwitInMyFace_Driver.set_worker_graph or attach_worker_graph, or a
+    thread pool (the default thread pool of the loop if it is None). graph
+    is warmed before the first command. Its cache and stats are not safe
+    to change from several threads at once, so with a thread pool every
+    command is answered on the pool, one at a time.
+
+    A command sent to executor that takes more than timeout seconds is
+    answered with an error line instead; its process or thread still runs
+    it to the end, as Python cannot stop it. So is a command that fails, so
+    the answers after it still arrive. stats is answered on one line, as
+    stats json, and with processes only counts the commands answered on
+    the event loop.'''
+
+    HEAVY_DEPTH = 3
+    # The most commands of one connection read ahead of their answers.
+    PIPELINE = 256
+
+    def __init__(self, graph: 'SocialNetwork',
+                 executor: 'concurrent.futures.Executor'=None,
+                 timeout: float=10.0):
+        graph.warm()
+        self._graph = graph
+        self._executor = executor
+        self._lock = None
+        if not isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+            self._lock = threading.Lock()
+        self._timeout = timeout
+        self.connections = 0
+        self.answered = 0
+
+    def is_heavy(self, query: 'list of str') -> bool:
+        '''Return True iff query should be sent to the executor.'''
+
+        if query[:1] == ['likely']:
+            return True
+        if len(query) in (3, 5) and query[0] in ('degrees', 'within',
+                                                 'classmates'):
+            try:
+                return int(query[2]) >= self.HEAVY_DEPTH
+            except ValueError:
+                return False
+        return False
+
+    async def answer(self, line: str) -> str:
+        '''Return the output line of the command on line, or an error line
+        if it failed.'''
+
+        try:
+            return await self.run(line)
+        except asyncio.TimeoutError:
+            return 'Error: timed out after {}s'.format(self._timeout)
+        except Exception as error:
+            return 'Error: {}'.format(str(error) or type(error).__name__)
+
+    async def run(self, line: str) -> str:
+        '''Return the output line of the command on line, answering heavy
+        commands on executor.'''
+
+        query = line.split()
+        if query == ['stats']:
+            query.append('json')
+        line = ' '.join(query)
+        loop = asyncio.get_running_loop()
+        if self._lock is not None:
+            future = loop.run_in_executor(self._executor, self.answer_locked,
+                                          line)
+        elif self.is_heavy(query):
+            future = loop.run_in_executor(
+                self._executor, TwitInMyFace_Driver.answer_line, line)
+        else:
+            return TwitInMyFace_Driver.answer_line(line, self._graph)
+        return await asyncio.wait_for(future, self._timeout)
+
+    def answer_locked(self, line: str) -> str:
+        '''Return the output line of the command on line, once no other
+        thread of the pool is using the graph.'''
+
+        with self._lock:
+            return TwitInMyFace_Driver.answer_line(line, self._graph)
+
+    async def handle(self, reader: 'asyncio.StreamReader',
+                     writer: 'asyncio.StreamWriter') -> None:
+        '''Serve one connection until the client sends quit or closes its
+        side. Commands are read and started while earlier ones are still
+        being answered; the answers are written in the order of the
+        commands.'''
+
+        self.connections += 1
+        answers = asyncio.Queue(self.PIPELINE)
+        writing = asyncio.ensure_future(self.write_answers(answers, writer))
+        try:
+            while not writing.done():
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode()
+                if not line.strip():
+                    continue
+                if line.split() == ['quit']:
+                    break
+                await answers.put(asyncio.ensure_future(self.answer(line)))
+        except ConnectionError:
+            pass
+        finally:
+            await answers.put(None)
+            try:
+                await writing
+            except ConnectionError:
+                pass
+            writer.close()
+
+    async def write_answers(self, answers: 'asyncio.Queue',
+                            writer: 'asyncio.StreamWriter') -> None:
+        '''Write the answers put on answers in order, until None is put.
+        Every answer waits for the transport to drain, so a client that
+        does not read its answers stops the server from reading more of its
+        commands instead of filling the server's memory.'''
+
+        while True:
+            task = await answers.get()
+            if task is None:
+                return
+            writer.write((await task).encode() + b'\n')
+            self.answered += 1
+            await writer.drain()
+
+    async def start(self, host: str='127.0.0.1', port: int=4000,
+                    path: str=None) -> 'asyncio.AbstractServer':
+        '''Start accepting connections on host and port, or on the Unix
+        socket path if it is given, and return the asyncio server.'''
+
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle, path)
+        return await asyncio.start_server(self.handle, host, port)
+
+
+def start_process_pool(workers: int, initializer: 'callable', 
+                       initargs: tuple) -> 'concurrent.futures.Executor':
+    '''Return a ProcessPoolExecutor of workers processes, every one of them
+    started and initialized. The processes must exist before the first
+    connection is accepted: a process forked while a connection is open
+    inherits its socket, which then stays open after the server closes it.
+    '''
+
+    executor = concurrent.futures.ProcessPoolExecutor(
+        workers, initializer=initializer, initargs=initargs)
+    for future in [executor.submit(int) for worker in range(workers)]:
+        future.result()
+    return executor
+
+
+async def ask(lines: 'list of str', host: str='127.0.0.1', port: int=4000,
+              path: str=None) -> 'list of str':
+    '''Send all the commands in lines over one connection to a running
+    server without waiting between them and return their output lines.'''
+
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    writer.write(''.join(line.rstrip('\n') + '\n' for line in lines).encode())
+    await writer.drain()
+    writer.write_eof()
+    answers = []
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        answers.append(line.decode().rstrip('\n'))
+    writer.close()
+    return answers
+
+
+async def serve(server: 'QueryServer', host: str, port: int,
+                path: str) -> None:
+    '''Run server until the process is stopped.'''
+
+    listening = await server.start(host, port, path)
+    print('Serving on {}'.format(path or '{}:{}'.format(host, port)))
+    async with listening:
+        await listening.serve_forever()
+
+
+def main():
+    '''The TwitInMyFace server program.'''
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[3])
+    parser.add_argument('file', nargs='?', default='example.timf',
+                        help='.timf file or .timfb snapshot to serve')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4000)
+    parser.add_argument('--unix', help='serve on this Unix socket instead')
+    parser.add_argument('--workers', type=int, default=2,
+                        help='processes answering the heavy commands')
+    parser.add_argument('--timeout', type=float, default=10.0,
+                        help='seconds a heavy command may take')
+    parser.add_argument('--shared', action='store_true',
+                        help='workers query one copy of the graph in shared '
+                        'memory instead of a copy each')
+    options = parser.parse_args()
+
+    graph = TwitInMyFace_Driver.initialize_graph(options.file)
+    graph.warm()
+    shared = None
+    if options.shared:
+        shared = TwitInMyFace_Driver.share_graph(graph)
+        initializer = TwitInMyFace_Driver.attach_worker_graph
+        initargs = (shared.name,)
+    else:
+        initializer = TwitInMyFace_Driver.set_worker_graph
+        initargs = (graph,)
+    try:
+        with start_process_pool(options.workers, initializer,
+                                initargs) as executor:
+            server = QueryServer(graph, executor, options.timeout)
+            asyncio.run(serve(server, options.host, options.port,
+                              options.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if shared is not None:
+            shared.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,399 @@
+"""
+      TwitInMyFace Sharded
+
+A SocialNetwork split over several processes. Every person belongs to the
+shard picked by a hash of their email, and each shard process keeps only
+its own people: their names, schools and friends. The searches of
+degree_between, people_with_degree and classmates go level by level: at
+each level every shard expands the people of the frontier it owns and
+sends the friends it finds back, batched by the shard that owns them, to
+make up the next frontier. The answers are the same as those of
+SocialNetwork.
+
+    network = ShardedNetwork(4)
+    network.load_from_file('example.timf')
+    network.degree_between('annie@mgo.org', 'dr@evil.net')
+    network.close()
+
+The batches go through the process that owns the ShardedNetwork, which
+stands in for the network between the machines of a cluster.
+
+Authors:
+    Jason Tran
+    Steven Tan
+"""
+
+import itertools
+import multiprocessing
+import zlib
+from array import array
+
+from TwitInMyFace import LoadReport, list_to_string, parse_timf
+
+
+def shard_of(email: str, shards: int) -> int:
+    '''Return the number of the shard that owns the person with the email.
+    The hash is the same in every process and every run.'''
+
+    return zlib.crc32(email.encode()) % shards
+
+
+######################### Shard Class #########################################
+class Shard(object):
+    '''The people owned by one shard. A person is known everywhere by their
+    global id: local id * number of shards + number of the shard, so the
+    owner of any global id is the id modulo the number of shards.'''
+
+    def __init__(self, shard: int, shards: int):
+        self._shard = shard
+        self._shards = shards
+        self.clear()
+
+    def clear(self) -> None:
+        '''Forget every person, e.g. before a new file is loaded.'''
+
+        self._emails = []
+        self._email_ids = {}
+        self._names = []
+        self._school_ids = {}
+        self._schools = []
+        # The friend emails each person listed, until they are resolved.
+        self._listed = []
+        self._friends = []
+        self._visited = set()
+        self._duplicates = []
+        self._dangling = []
+
+    def global_id(self, idx: int) -> int:
+        '''Return the global id of the person with local id idx.'''
+
+        return idx * self._shards + self._shard
+
+    def local_id(self, gid: int) -> int:
+        '''Return the local id of the person with global id gid.'''
+
+        return gid // self._shards
+
+    def add(self, records: 'list of tuple') -> None:
+        '''Add the people of records (name, email, schools, friends) as given
+        by parse_timf, in the order of the file. When an email is listed
+        twice the first line wins.'''
+
+        for name, email, schools, friends in records:
+            if email in self._email_ids:
+                self._duplicates.append(email)
+                continue
+            self._email_ids[email] = len(self._emails)
+            self._emails.append(email)
+            self._names.append(name)
+            school_ids = array('i')
+            for school in (schools.split(',') if schools else []):
+                school_id = self._school_ids.setdefault(
+                    school, len(self._school_ids))
+                if school_id not in school_ids:
+                    school_ids.append(school_id)
+            self._schools.append(school_ids)
+            self._listed.append(friends.split(',') if friends else [])
+            self._friends.append(set())
+
+    def requests(self) -> dict:
+        '''Return {shard: [(global id, friend email), ...]}: every friend
+        listed by the people of this shard, to be resolved by its owner.'''
+
+        requests = {}
+        for idx, friends in enumerate(self._listed):
+            gid = self.global_id(idx)
+            for friend in friends:
+                requests.setdefault(shard_of(friend, self._shards),
+                                    []).append((gid, friend))
+        self._listed = []
+        return requests
+
+    def resolve(self, requests: 'list of tuple') -> list:
+        '''Return (global id, friend email, friend global id) for every
+        (global id, friend email) of requests, the friend global id being
+        None if nobody of this shard has the email. Every friend found is
+        made a friend of the person who listed them.'''
+
+        resolved = []
+        for gid, friend in requests:
+            idx = self._email_ids.get(friend)
+            if idx is None:
+                resolved.append((gid, friend, None))
+            else:
+                self._friends[idx].add(gid)
+                resolved.append((gid, friend, self.global_id(idx)))
+        return resolved
+
+    def link(self, resolved: 'list of tuple') -> tuple:
+        '''Make every resolved friend a friend of the person of this shard
+        who listed them, then store the friends as arrays. Return the
+        (email, friend) pairs of the friends nobody had and the duplicate
+        emails.'''
+
+        for gid, friend, friend_gid in resolved:
+            idx = self.local_id(gid)
+            if friend_gid is None:
+                self._dangling.append((self._emails[idx], friend))
+            else:
+                self._friends[idx].add(friend_gid)
+        self._friends = [array('q', sorted(friends))
+                         for friends in self._friends]
+        return self._dangling, self._duplicates
+
+    def lookup(self, email: str) -> int:
+        '''Return the global id of the email, or None if it is not here.'''
+
+        idx = self._email_ids.get(email)
+        return None if idx is None else self.global_id(idx)
+
+    def school_names(self, gid: int) -> list:
+        '''Return the names of the schools of the person with global id
+        gid.'''
+
+        names = list(self._school_ids)
+        return [names[school_id]
+                for school_id in self._schools[self.local_id(gid)]]
+
+    def expand(self, frontier: 'list of int', target: int, collect: object,
+               grow: bool) -> tuple:
+        '''Visit the global ids of frontier that were not visited yet in
+        this search. Return the number visited, True iff target is among
+        them, and the names of those visited that collect asks for: all of
+        them if collect is True, those who went to one of the schools named
+        in collect if it is a set, none if it is None. When grow is True,
+        also return {shard: global ids of the friends of those visited}.'''
+
+        visited = self._visited
+        found = False
+        names = []
+        outgoing = {}
+        school_ids = None
+        if isinstance(collect, (set, frozenset)):
+            school_ids = {self._school_ids[school] for school in collect
+                          if school in self._school_ids}
+        count = 0
+        for gid in frontier:
+            if gid in visited:
+                continue
+            visited.add(gid)
+            count += 1
+            found = found or gid == target
+            idx = self.local_id(gid)
+            if collect is True:
+                names.append(self._names[idx])
+            elif school_ids and not school_ids.isdisjoint(self._schools[idx]):
+                names.append(self._names[idx])
+            if grow:
+                for friend in self._friends[idx]:
+                    outgoing.setdefault(friend % self._shards,
+                                        []).append(friend)
+        return count, found, names, outgoing
+
+    def reset(self) -> None:
+        '''Forget the people visited by the last search.'''
+
+        self._visited = set()
+
+
+def shard_main(connection: 'multiprocessing.connection.Connection',
+               shard: int, shards: int) -> None:
+    '''Run one shard process: call the Shard method named by every message
+    (name, arguments) received on connection, sending back its result for
+    the messages that expect one, until 'close' is received.'''
+
+    owned = Shard(shard, shards)
+    while True:
+        name, args, reply = connection.recv()
+        if name == 'close':
+            break
+        result = getattr(owned, name)(*args)
+        if reply:
+            connection.send(result)
+    connection.close()
+
+
+######################### Sharded Network Class ###############################
+class ShardedNetwork(object):
+    '''A social network whose people are spread over shards processes,
+    answering degree_between, people_with_degree and classmates like a
+    SocialNetwork loaded from the same file.'''
+
+    # Records sent to a shard at a time while loading.
+    BATCH = 1000
+
+    def __init__(self, shards: int=4):
+        self._shards = shards
+        self._connections = []
+        self._processes = []
+        for shard in range(shards):
+            connection, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=shard_main, args=(child, shard, shards), daemon=True)
+            process.start()
+            child.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+        self._report = LoadReport()
+
+    def call(self, shard: int, name: str, *args) -> object:
+        '''Call the method name of the Shard of shard and return the
+        result.'''
+
+        self._connections[shard].send((name, args, True))
+        return self._connections[shard].recv()
+
+    def call_all(self, name: str, args: 'list of tuple') -> list:
+        '''Call the method name of every Shard at once, shard i with the
+        arguments args[i], or not at all if args[i] is None, and return the
+        results, None for the shards not called.'''
+
+        for connection, shard_args in zip(self._connections, args):
+            if shard_args is not None:
+                connection.send((name, shard_args, True))
+        return [None if shard_args is None else connection.recv()
+                for connection, shard_args in zip(self._connections, args)]
+
+    def tell_all(self, name: str, *args) -> None:
+        '''Call the method name of every Shard without waiting for them.'''
+
+        for connection in self._connections:
+            connection.send((name, args, False))
+
+    def close(self) -> None:
+        '''Stop the shard processes.'''
+
+        for connection, process in zip(self._connections, self._processes):
+            connection.send(('close', (), False))
+            connection.close()
+            process.join()
+        self._connections = []
+        self._processes = []
+
+    def load_from_file(self, file: 'file to be read') -> None:
+        '''Stream the people of file to the shards that own them, then let
+        the shards resolve every listed friend with its owner, making every
+        friendship mutual. Malformed lines, duplicates and friends without a
+        line of their own are added to the load report.'''
+
+        self._report = LoadReport()
+        self.tell_all('clear')
+        batches = [[] for shard in range(self._shards)]
+        for record in parse_timf(file, self._report):
+            batch = batches[shard_of(record[1], self._shards)]
+            batch.append(record)
+            if len(batch) >= self.BATCH:
+                self._connections[shard_of(record[1], self._shards)].send(
+                    ('add', (batch,), False))
+                batch.clear()
+        for shard, batch in enumerate(batches):
+            self._connections[shard].send(('add', (batch,), False))
+        if not self._report.records:
+            print('The File Is Empty')
+
+        requests = self.call_all('requests', [()] * self._shards)
+        resolved = self.call_all('resolve', [(
+            [pair for sent in requests for pair in sent.get(shard, ())],)
+            for shard in range(self._shards)])
+        answers = [[] for shard in range(self._shards)]
+        for results in resolved:
+            for answer in results:
+                answers[answer[0] % self._shards].append(answer)
+        for dangling, duplicates in self.call_all(
+                'link', [(answer,) for answer in answers]):
+            for email in duplicates:
+                self._report.add_duplicate(email)
+            for email, friend in dangling:
+                self._report.add_dangling(email, friend)
+
+    def get_load_report(self) -> 'LoadReport':
+        '''Return the report of the problems found by the last load.'''
+
+        return self._report
+
+    def global_id(self, email: str) -> int:
+        '''Return the global id of the email, or None if nobody has it.'''
+
+        return self.call(shard_of(email, self._shards), 'lookup', email)
+
+    def email_index(self, email: str) -> int:
+        '''Return the global id of the email. Raise ValueError if the email
+        is not in the network.'''
+
+        gid = self.global_id(email)
+        if gid is None:
+            raise ValueError('{} is not in the network'.format(email))
+        return gid
+
+    def search(self, start: int, d: int, target: int=None,
+               collect: object=None, first: int=0) -> 'iterator of tuple':
+        '''Run a breadth first search from the global id start over every
+        shard, one level at a time up to depth d (without end if d is None)
+        or until nobody is left.
+        Yield (depth, number of people at that depth, True iff target is
+        among them, names collected), collect being given to Shard.expand
+        from depth first on.'''
+
+        self.tell_all('reset')
+        frontier = {start % self._shards: [start]}
+        for depth in itertools.count() if d is None else range(d + 1):
+            grow = d is None or depth < d
+            replies = self.call_all('expand', [
+                None if shard not in frontier else
+                (frontier[shard], target,
+                 collect if depth >= first else None, grow)
+                for shard in range(self._shards)])
+            count, found, names = 0, False, []
+            frontier = {}
+            for reply in replies:
+                if reply is None:
+                    continue
+                count += reply[0]
+                found = found or reply[1]
+                names.extend(reply[2])
+                for shard, friends in reply[3].items():
+                    frontier.setdefault(shard, []).extend(friends)
+            if not count:
+                return
+            yield depth, count, found, names
+
+    def degree_between(self, x: str, y: str) -> int:
+        '''Return the degree of separation between person x and person y,
+        or inf if there is no path between them.'''
+
+        if y == x:
+            return 0
+        start = self.email_index(x)
+        target = self.global_id(y)
+        if target is None:
+            return float('inf')
+        for depth, count, found, names in self.search(start, None, target):
+            if found:
+                return depth
+        return float('inf')
+
+    def people_with_degree(self, x: str, d: int) -> str:
+        '''Return the names of every person exactly d degrees from person x,
+        in alphabetical order.'''
+
+        start, d = self.email_index(x), int(d)
+        for depth, count, found, names in self.search(start, d, collect=True,
+                                                      first=d):
+            if depth == d:
+                return list_to_string(names)
+        return ''
+
+    def classmates(self, x: str, d: int) -> str:
+        '''Return the names of every person within d degrees of person x
+        who went to one of the schools of x, in alphabetical order.'''
+
+        start, d = self.email_index(x), int(d)
+        schools = set(self.call(start % self._shards, 'school_names', start))
+        if d <= 0 or not schools:
+            return ''
+        classmates = []
+        for depth, count, found, names in self.search(start, d,
+                                                      collect=schools,
+                                                      first=1):
+            classmates.extend(names)
+        return list_to_string(classmates)
@@ -0,0 +1,95 @@
+"""
+      TwitInMyFace NumPy backend
+
+Sparse matrix versions of the searches of SocialNetwork, used when it is
+constructed with SocialNetwork(backend='numpy'). Needs numpy and scipy.
+
+Authors:
+    Jason Tran
+    Steven Tan
+"""
+
+import numpy
+from scipy import sparse
+
+
+class NumpyBackend(object):
+    '''Answers the searches of a SocialNetwork with vectorized operations on
+    its friendships stored as a CSR sparse matrix A, where A[i, j] is 1 iff
+    the people with ids i and j are friends. A is symmetric.'''
+    
+    def __init__(self, network: 'SocialNetwork'):
+        '''Initializes the backend of network. The matrix is only built the
+        first time a search needs it.'''
+        
+        self._network = network
+        self._matrix = None
+        
+    def reset(self) -> None:
+        '''Forget the matrix, to be called whenever the graph changes.'''
+        
+        self._matrix = None
+        
+    def matrix(self) -> 'sparse.csr_matrix':
+        '''Return the adjacency matrix A, building it first if needed. The
+        arrays of a network opened from a snapshot are used without a copy.
+        '''
+        
+        if self._matrix is None:
+            offsets, targets = self._network.adjacency_arrays()
+            indptr = numpy.asarray(offsets, dtype=numpy.int64)
+            indices = numpy.asarray(targets, dtype=numpy.int32)
+            size = len(indptr) - 1
+            data = numpy.ones(len(indices), dtype=numpy.int32)
+            self._matrix = sparse.csr_matrix((data, indices, indptr), 
+                                             shape=(size, size))
+        return self._matrix
+    
+    def friends_of(self, idx: int) -> 'numpy.ndarray':
+        '''Return the array of ids of the friends of the person with id idx.
+        '''
+        
+        matrix = self.matrix()
+        return matrix.indices[matrix.indptr[idx]:matrix.indptr[idx + 1]]
+    
+    def search_layers(self, start: int, d: int) -> list:
+        '''Return the layers of a breadth first search from start that stops
+        at depth d, as SocialNetwork.search_layers does. Each step is the
+        product of A with the frontier vector, masked by the people already
+        visited. The ids of a layer are in increasing order.'''
+        
+        matrix = self.matrix()
+        visited = numpy.zeros(matrix.shape[0], dtype=bool)
+        visited[start] = True
+        frontier = numpy.zeros(matrix.shape[0], dtype=numpy.int32)
+        frontier[start] = 1
+        layers = [[start]]
+        while len(layers) <= d:
+            reached = (matrix @ frontier > 0) & ~visited
+            layer = numpy.flatnonzero(reached)
+            if not len(layer):
+                break
+            visited |= reached
+            frontier = reached.astype(numpy.int32)
+            layers.append(layer.tolist())
+        return layers
+    
+    def mutual_counts(self, start: int) -> dict:
+        '''Return {id: number of mutual friends with start} for everyone two
+        degrees from start who is not already their friend, as
+        SocialNetwork.mutual_counts does, read off row start of A * A.'''
+        
+        matrix = self.matrix()
+        row = (matrix[start] @ matrix).tocsr()
+        ids, counts = row.indices, row.data
+        keep = ((ids != start) & (counts > 0) & 
+                ~numpy.isin(ids, self.friends_of(start)))
+        return dict(zip(ids[keep].tolist(), counts[keep].tolist()))
+    
+    def mutual_ids(self, first: int, second: int) -> list:
+        '''Return the ids of the mutual friends of first and second, found by
+        intersecting their sorted friend arrays.'''
+        
+        return numpy.intersect1d(self.friends_of(first), 
+                                 self.friends_of(second), 
+                                 assume_unique=True).tolist()
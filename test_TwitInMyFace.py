@@ -0,0 +1,1507 @@
+"""
+      TwitInMyFace Tests
+
+Unit tests of the TwitInMyFace modules, run from the directory holding
+example.timf:
+
+    python -m pytest -q test_TwitInMyFace.py
+
+Authors:
+    Jason Tran
+    Steven Tan
+"""
+
+import asyncio
+import io
+import json
+import mmap
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from TwitInMyFace import (Components, LayerCache, SharedGraph, SocialNetwork,
+                          attach_memory, construct_network, list_to_string,
+                          parse_timf)
+try:
+    import TwitInMyFace_numpy
+except ImportError:
+    TwitInMyFace_numpy = None
+
+
+class TestDegree(unittest.TestCase):
+        
+    def test_one_person_no_friend(self: 'TestDegree') -> None:
+        """
+        One person in the graph. Test to see if the degree between the start
+        and itself, is zero(0).
+        """
+        file = io.StringIO('person 1<one@toronto.ca>(Uni of Toronto): \n')
+        network = construct_network(file)
+        input_val = network.degree_between('one@toronto.ca', 'one@toronto.ca')
+        expected_output = 0
+        self.assertEqual(input_val, expected_output, 'Wrong degree between')
+    
+    def test_two_people_all_friends(self: 'TestDegree') -> None:
+        """
+        Two Nodes in the graph, both friends with each other. Test to see if
+        the degree between the two is 1.
+        """
+        file = io.StringIO('A Kirby<kirby@toronto.ca>(Uni of Toronto):'
+                           'metaknight@toronto.ca\n'
+                         
+                           'M Knight<metaknight@toronto.ca>(Uni of Toronto):'
+                           'kirby@toronto.ca\n')
+        network = construct_network(file)
+        input_val = network.degree_between('kirby@toronto.ca',
+                                           'metaknight@toronto.ca')
+        expected_output = 1
+        self.assertEqual(input_val, expected_output, 'Wrong degree between')
+        
+    def test_triangle_shaped_graph(self: 'TestDegree') -> None:
+        """
+        A graph with 3 nodes are generated. Every node in the graph is
+        connected to each other.
+        """
+        file = io.StringIO('Kyon<kyon@toronto.ca>(Uni of Toronto):'
+                           'Haruhi@toronto.ca\n'
+                   
+                        'Suzumiya Haruhi<Haruhi@toronto.ca>(Uni of Toronto):'
+                        'YukiN@toronto.ca\n'
+                        
+                        'Nagato Yuki<YukiN@toronto.ca>(Uni of Toronto):'
+                        'kyon@toronto.ca\n')
+        network = construct_network(file)
+        input_val = network.degree_between('kyon@toronto.ca',
+                                           'Haruhi@toronto.ca')
+        expected_output = 1
+        self.assertEqual(input_val, expected_output, 'Wrong degree between')        
+    
+    def test_two_people_no_path(self: 'TestDegree') -> None:
+        """
+        Two Nodes in the graph, testing degree_between one node and other,
+        with no path in between the nodes. Test to see if it returns inf
+        """
+        file = io.StringIO('A Kirby<kirby@toronto.ca>(Uni of Toronto): \n'
+                        'M Knight<metaknight@toronto.ca>(Uni of Toronto): \n')
+        network = construct_network(file)
+        input_val = network.degree_between('kirby@toronto.ca',
+                                           'metaknight@toronto.ca')
+        expected_output = float('inf')
+        self.assertEqual(input_val, expected_output, 'Wrong degree between')
+    
+    def test_one_friend_multiple_path_length(self: 'TestDegree') -> None:
+        """
+        Six Nodes in the graph.
+        Tests to see that degree of one node to another takes the shortest
+        path. First node only has one path then branches off 
+        converging to target.
+        """
+        file = io.StringIO('C Falcon<showmeyamoves@toronto.ca>'
+                           '(Uni of Toronto):'
+                           'FZero@toronto.ca\n'
+                   
+                           'F Zero<FZero@toronto.ca>(Uni of Toronto):'
+                           'kirby@toronto.ca,finn@toronto.ca\n'
+                   
+                           'A Kirby<kirby@toronto.ca>(Uni of Toronto):'
+                           'FZero@toronto.ca,king@princess.ca\n'
+                   
+                           'Finn<finn@toronto.ca>(Uni of Toronto):'
+                           'iceking@princess.ca\n'
+                   
+                           'Simon<iceking@princess.ca>(Uni of Toronto):'
+                           'king@princess.ca,finn@toronto.ca\n'
+                           
+                           'king<king@princess.ca>(Uni of Toronto): \n')
+        network = construct_network(file)
+        input_val = network.degree_between('showmeyamoves@toronto.ca',
+                                           'king@princess.ca')
+        expected_output = 3
+        self.assertEqual(input_val, expected_output, 'Wrong degree between')
+    
+    def test_one_path_one_friend(self: 'TestDegree') -> None:
+        """
+        Seven Nodes in the graph. Everyone has at most 1 friend.
+        Tests to see if it follows the path given.
+        looks like: X-o-o-o-o-Y-o
+        Where x is the start and y is the end
+        """
+        file = io.StringIO('C Falcon<showmeyamoves@toronto.ca>'
+                           '(Uni of Toronto):'
+                           'FZero@toronto.ca\n'
+                   
+                           'F Zero<FZero@toronto.ca>(Uni of Toronto):'
+                           'kirby@toronto.ca\n'
+                   
+                           'A Kirby<kirby@toronto.ca>(Uni of Toronto):'
+                           'cooguy@toronto.ca\n'
+                   
+                           'Coo Guy<cooguy@toronto.ca>(Uni of Toronto):'
+                           'iceking@princess.ca\n'
+                   
+                           'Simon<iceking@princess.ca>(Uni of Toronto):'
+                           'king@princess.ca\n'
+                           
+                           'king<king@princess.ca>(Uni of Toronto):'
+                           'meepo@geomancer.ca\n'
+                           
+                           'Meepo<meepo@geomancer.ca>(Uni of Toronto): \n')
+        network = construct_network(file)
+        input_val = network.degree_between('showmeyamoves@toronto.ca',
+                                           'king@princess.ca')
+        expected_output = 5
+        self.assertEqual(input_val, expected_output, 'Wrong degree between')
+    
+    def test_multiple_friends_multiple_path_length(self: 'TestDegree') -> None:
+        """
+        10 nodes in graph. Every person has more than 3 friends
+        Tests to see if degree between X and Y returns the shortest one.
+        """
+        file = io.StringIO('C Falcon<showmeyamoves@toronto.ca>'
+                           '(Uni of Toronto):'
+                           'FZero@toronto.ca,kirby@toronto.ca,'
+                           'cooguy@toronto.ca\n'
+                   
+                           'F Zero<FZero@toronto.ca>(Uni of Toronto):'
+                           'kirby@toronto.ca,showmeyamoves@toronto.ca,'
+                           'meepo@geomancer.ca\n'
+                   
+                           'A Kirby<kirby@toronto.ca>(Uni of Toronto):'
+                           'cooguy@toronto.ca,iceking@princess.ca,'
+                           'king@princess.ca,meepo@geomancer.ca,'
+                           'showmeyamoves@toronto.ca,FZero@toronto.ca\n'
+                   
+                           'Coo Guy<cooguy@toronto.ca>(Uni of Toronto):'
+                           'iceking@princess.ca,axe@axed.ca\n'
+                   
+                           'Simon<iceking@princess.ca>(Uni of Toronto):'
+                           'king@princess.ca,axe@axed.ca,'
+                           'cooguy@toronto.ca,dk@dragon.ca\n'
+                           
+                           'king<king@princess.ca>(Uni of Toronto):'
+                           'meepo@geomancer.ca,dk@dragon.ca,'
+                           'kirby@toronto.ca,iceking@princess.ca\n'
+                           
+                           'Meepo<meepo@geomancer.ca>(Uni of Toronto):'
+                           'dk@dragon.ca,king@princess.ca,kirby@toronto.ca,'
+                           'FZero@toronto.ca\n'
+                           
+                           'axe<axe@axed.ca>(Uni of Toronto):'
+                           'cooguy@toronto.ca,alistar@moo.ca,'
+                           'iceking@princess.ca\n'
+                           
+                           'alistar<alistar@moo.ca>(Uni of Toronto):'
+                           'dk@dragon.ca,axe@axed.ca,iceking@princess.ca\n'
+                           
+                           'Knight Davian<dk@dragon.ca>(Uni of Toronto):'
+                           'alistar@moo.ca,meepo@geomancer.ca,'
+                           'king@princess.ca,iceking@princess.ca\n')
+        network = construct_network(file)
+        input_val = network.degree_between('showmeyamoves@toronto.ca',
+                                           'king@princess.ca')
+        expected_output = 2
+        self.assertEqual(input_val, expected_output, 'Wrong degree between')
+
+    def test_a_lot_people_no_friends(self: 'TestDegree') -> None:
+        """
+        10 nodes in graph. No one is friends with one another
+        target is not itself. Test to see if degree_between returns 
+        infinity with a large set.
+        """
+        file = io.StringIO('C Falcon<showmeyamoves@toronto.ca>'
+                           '(Uni of Toronto): \n'
+                   
+                           'F Zero<FZero@toronto.ca>(Uni of Toronto): \n'
+                   
+                           'A Kirby<kirby@toronto.ca>(Uni of Toronto): \n'
+                   
+                           'Coo Guy<cooguy@toronto.ca>(Uni of Toronto): \n'
+                   
+                           'Simon<iceking@princess.ca>(Uni of Toronto): \n'
+                           
+                           'king<king@princess.ca>(Uni of Toronto): \n'
+                           
+                           'Meepo<meepo@geomancer.ca>(Uni of Toronto): \n'
+                           
+                           'axe<axe@axed.ca>(Uni of Toronto): \n'
+                           
+                           'alistar<alistar@moo.ca>(Uni of Toronto): \n'
+                           
+                           'Knight Davian<dk@dragon.ca>(Uni of Toronto): \n')
+        network = construct_network(file)
+        input_val = network.degree_between('showmeyamoves@toronto.ca',
+                                           'king@princess.ca')
+        expected_output = float('inf')
+        self.assertEqual(input_val, expected_output, 'Wrong degree between')
+        
+    def test_multiple_friends_same_path_length(self: 'TestDegree') -> None:
+        """
+        A graph with 6 nodes are created. Then 2 specific nodes will be
+        selected such that every path between these 2 nodes will yield
+        the same number of edges.
+        """
+        
+        file = io.StringIO('A Dylan<a@dra.net>(Uni of Toronto):c@dra.net,'
+                           'b@dra.net\nB Ba<b@dra.net>():e@dra.net\n'
+                           'E Ea<e@dra.net>():z@dra.net\nZ Za<z@dra.net>'
+                           '():d@dra.net\nD Da<d@dra.net>():c@dra.net\n'
+                           'C Ca<c@dra.net>():')
+        network = construct_network(file)
+        input_val = network.degree_between('a@dra.net', 'z@dra.net')
+        expected_output = 3
+        self.assertEqual(input_val, expected_output, 'Wrong degree between')       
+        
+    def test_multiple_friends_no_path(self: 'TestDegree') -> None:
+        """
+        A graph with 7 nodes are created. Then 2 specific nodes will be
+        selected such that no path exists between these two nodes.
+        """
+        file = io.StringIO('A Dylan<a@dra.net>(Uni of Toronto):c@dra.net,'
+                   'b@dra.net\nB Ba<b@dra.net>():\n'
+                   'E Ea<e@dra.net>():z@dra.net\nZ Za<z@dra.net>'
+                   '():d@dra.net\nD Da<d@dra.net>():\n'
+                   'C Ca<c@dra.net>():\nS Ta<s@dra.net>():')
+        network = construct_network(file)
+        input_val = network.degree_between('a@dra.net', 'z@dra.net')
+        expected_output = float('inf')
+        self.assertEqual(input_val, expected_output, 'Wrong degree between')
+    
+    def test_multiple_friends_one_path(self: 'TestDegree') -> None:
+        """
+        A graph with 9 nodes are created. Then 2 specific nodes will be 
+        selected such that only one path exists between the two nodes. 
+        Some paths will lead to a deadend. Test to see if even if it are 
+        deadends in the graph, degree_between can still find the path 
+        to target node from the beginning node.
+        """
+        
+        file = io.StringIO('A Dylan<a@dra.net>(Uni of Toronto):b@dra.net\n'
+                   'B Ba<b@dra.net>():c@dra.net,e@dra.net,g@dra.net\n'
+                   'C Ca<c@dra.net>():d@dra.net\n'
+                   'D Da<d@dra.net>():\n'
+                   'E Ea<e@dra.net>():f@dra.net\n'
+                   'F Fa<f@dra.net>():\n'
+                   'G Ga<g@dra.net>():h@dra.net,i@dra.net\n'
+                   'H Ha<h@dra.net>():\n'
+                   'I Ia<i@dra.net>():\n')
+        network = construct_network(file)
+        input_val = network.degree_between('a@dra.net', 'i@dra.net')
+        expected_output = 3
+        self.assertEqual(input_val, expected_output, 'Wrong degree between')                 
+    
+    def test_one_person_with_friends_same_person(self: 'TestDegree') -> None:
+        """
+        Graph contains 6 nodes. 5 nodes are connected to the same node. That 
+        same node is our target node. Test if the degree_between is still 0.
+        """
+        
+        file = io.StringIO('A Dylan<a@dra.net>(Uni of Toronto):\n'
+           'B Ba<b@dra.net>():a@dra.net\n'
+           'C Ca<c@dra.net>():a@dra.net\n'
+           'D Da<d@dra.net>():a@dra.net\n'
+           'E Ea<e@dra.net>():a@dra.net\n'
+           'F Fa<f@dra.net>():a@dra.net\n')
+        network = construct_network(file)
+        input_val = network.degree_between('a@dra.net', 'a@dra.net')
+        expected_output = 0
+        self.assertEqual(input_val, expected_output, 'Wrong degree between') 
+    
+    def test_long_graph_multiple_routes(self: 'TestDegree') -> None:
+        """
+        Graph with 20 are created. 2 specific nodes will be selected such that
+        multiple paths exist between those 2 nodes.
+        Test to see if the degree_between function can still find the shortest 
+        path.
+        """
+        
+        file = io.StringIO('A Dylan<a@dra.net>(Uni of Toronto):b@dra.net,'
+                           'e@dra.net,f@dra.net\n'
+                   'B Ba<b@dra.net>():c@dra.net,g@dra.net\n'
+                   'C Ca<c@dra.net>():h@dra.net\n'
+                   'D Da<d@dra.net>():e@dra.net\n'
+                   'E Ea<e@dra.net>():i@dra.net\n'
+                   'F Fa<f@dra.net>():j@dra.net\n,g@dra.net,i@dra.net'
+                   'G Ga<g@dra.net>():k@dra.net\n'
+                   'H Ha<h@dra.net>():g@dra.net,l@dra.net\n'
+                   'I Ia<i@dra.net>():m@dra.net\n'
+                   'J Ja<j@dra.net>():k@dra.net,m@dra.net,n@dra.net\n'
+                   'K Ka<k@dra.net>():n@dra.net\n'
+                   'L La<l@dra.net>():k@dra.net,n@dra.net\n'
+                   'M Ma<m@dra.net>():n@dra.net\n'
+                   'N Na<n@dra.net>():\n')
+        network = construct_network(file)
+        input_val = network.degree_between('a@dra.net', 'n@dra.net')
+        expected_output = 3
+        self.assertEqual(input_val, expected_output, 'Wrong degree between')
+        
+    def test_starter_no_connected_nodes(self: 'TestDegree') -> None:
+        """
+        Graph with 3 nodes, the starting node is not connected to any node
+        The other 2 nodes along with the target node is connected to each other
+        """
+        file = io.StringIO('Kyon<kyon@toronto.ca>(Uni of Toronto): \n'
+                   
+                        'Suzumiya Haruhi<Haruhi@toronto.ca>(Uni of Toronto):'
+                        'YukiN@toronto.ca\n'
+                        
+                        'Nagato Yuki<YukiN@toronto.ca>(Uni of Toronto):'
+                        'Haruhi@toronto.ca\n')
+        network = construct_network(file)
+        input_val = network.degree_between('kyon@toronto.ca',
+                                           'Haruhi@toronto.ca')
+        expected_output = float('inf')
+        self.assertEqual(input_val, expected_output, 'Wrong degree between')
+
+    def test_starter_no_connected_nodes(self: 'TestDegree') -> None:
+        """
+        Graph with 3 nodes, the starting node is connected to all nodes
+        avaliable except for the target node.
+        """
+        file = io.StringIO('Kyon<kyon@toronto.ca>(Uni of Toronto): \n'
+                   
+                        'Suzumiya Haruhi<Haruhi@toronto.ca>(Uni of Toronto):'
+                        'YukiN@toronto.ca\n'
+                        
+                        'Nagato Yuki<YukiN@toronto.ca>(Uni of Toronto):'
+                        'Haruhi@toronto.ca\n')
+        network = construct_network(file)
+        input_val = network.degree_between('Haruhi@toronto.ca',
+                                           'kyon@toronto.ca')
+        expected_output = float('inf')
+        self.assertEqual(input_val, expected_output, 'Wrong degree between')
+    
+    def test_275_people(self: 'TestDegree') -> None:
+        """
+        Graph with 275 nodes are randomly generated. One node and node adjacent
+        to that one node are selected. Test to see if degree_between is 1.
+        """
+        
+        lst = []
+        lst_email = []
+        alph = 'abcdefghijklmnopqrstuvwxyz'
+        for i in range(275):
+            string = ''
+            last = ''
+            for n in range(5):
+                string += alph[random.randint(0, 25)]
+                last += alph[random.randint(0, 25)]
+            name = string + ' ' + last
+            email = string + '@user.net'
+            school = 'University of Kawaii'
+            if lst_email:
+                friends = lst_email[random.randint(0, len(lst_email) - 1)]
+            else:
+                friends = ''
+            final = name + '<' + email + '>(' + school + '):' + friends + '\n'
+            if email not in lst_email:
+                lst_email.append(email)
+                lst.append(final)
+        final_file = ''.join(lst)
+        file = io.StringIO(final_file)
+        network = construct_network(file)
+        starting_email = network._emails[150]
+        end_email = network.find_node_by_email(starting_email).get_friends()
+        input_val = network.degree_between(starting_email, end_email[0])
+        expected_output = 1
+        self.assertEqual(input_val, expected_output, 'Wrong degree between')
+    
+    def test_matches_single_source_search(self: 'TestDegree') -> None:
+        """
+        On a random graph of 60 people with a few components, the degree
+        between every pair matches the layer found by a search from x alone.
+        """
+        
+        generator = random.Random(275)
+        lines = []
+        for i in range(60):
+            friends = ['p{}@user.net'.format(generator.randrange(60))
+                       for n in range(generator.randint(0, 2))]
+            lines.append('P{0}<p{0}@user.net>():{1}\n'.format(
+                i, ','.join(friends)))
+        network = construct_network(io.StringIO(''.join(lines)))
+        for x in network._emails:
+            expected = {}
+            for depth, layer in enumerate(network.degree_layers(x, 60)):
+                for idx in layer:
+                    expected[network._emails[idx]] = depth
+            for y in network._emails:
+                self.assertEqual(network.degree_between(x, y), 
+                                 expected.get(y, float('inf')),
+                                 'Wrong degree between')
+     
+     
+class TestIdentity(unittest.TestCase):
+    
+    def test_emails_interned_to_dense_ids(self: 'TestIdentity') -> None:
+        """
+        Every email gets the next free id in file order, and a repeated email
+        keeps the id of its first line.
+        """
+        file = io.StringIO('A Aa<a@dra.net>():b@dra.net\n'
+                           'B Bb<b@dra.net>():\n'
+                           'A Again<a@dra.net>():\n'
+                           'C Cc<c@dra.net>():a@dra.net\n')
+        network = construct_network(file)
+        ids = [network.email_index(email) for email in 
+               ['a@dra.net', 'b@dra.net', 'c@dra.net']]
+        self.assertEqual(ids, [0, 1, 2], 'Wrong ids')
+        self.assertEqual(network.friends('a@dra.net'), 'B Bb C Cc',
+                         'Wrong friends')
+    
+    def test_nodes_are_views(self: 'TestIdentity') -> None:
+        """
+        A node reads its data from the network, so it sees later edits, and
+        each school is stored once however many people went there.
+        """
+        file = io.StringIO('A Aa<a@dra.net>(Rock,Jazz):\n'
+                           'B Bb<b@dra.net>(Jazz):\n')
+        network = construct_network(file)
+        node = network.find_node_by_email('a@dra.net')
+        network.add_friendship('a@dra.net', 'b@dra.net')
+        self.assertEqual((node.get_name(), node.get_schools(), 
+                          node.get_friends()), 
+                         ('A Aa', ['Rock', 'Jazz'], ['b@dra.net']),
+                         'Wrong node')
+        self.assertEqual(list(network.school_index().schools_of(1)), [1],
+                         'Wrong school ids')
+        self.assertFalse(hasattr(node, '__dict__'), 'Node is not slotted')
+    
+    def test_unknown_email(self: 'TestIdentity') -> None:
+        """
+        Looking up an email that is not in the network raises ValueError.
+        """
+        file = io.StringIO('A Aa<a@dra.net>():\n')
+        network = construct_network(file)
+        self.assertRaises(ValueError, network.email_index, 'z@dra.net')
+     
+     
+class TestLoad(unittest.TestCase):
+    
+    def test_one_directional_friendship_becomes_mutual(self: 'TestLoad'
+                                                       ) -> None:
+        """
+        A friendship listed by only one side, or listed twice, ends up once
+        on both sides, including in the friends of each node.
+        """
+        file = io.StringIO('A Aa<a@dra.net>():b@dra.net,b@dra.net\n'
+                           'B Bb<b@dra.net>():\n'
+                           'C Cc<c@dra.net>():a@dra.net\n')
+        network = construct_network(file)
+        self.assertEqual(network.find_node_by_email('a@dra.net').get_friends(),
+                         ['b@dra.net', 'c@dra.net'], 'Wrong friends')
+        self.assertEqual(network.find_node_by_email('b@dra.net').get_friends(),
+                         ['a@dra.net'], 'Wrong friends')
+        self.assertEqual(network.friends('c@dra.net'), 'A Aa', 
+                         'Wrong friends')
+        
+    def test_bad_lines_and_dangling_friends_reported(self: 'TestLoad'
+                                                     ) -> None:
+        """
+        Malformed lines and friends without a line of their own are left out
+        of the network and counted in the load report.
+        """
+        file = io.StringIO('A Aa<a@dra.net>():b@dra.net,ghost@dra.net\n'
+                           'this is not a person\n'
+                           'B Bb<b@dra.net>():a@dra.net\n')
+        network = construct_network(file)
+        report = network.get_load_report()
+        self.assertEqual(network.friends('a@dra.net'), 'B Bb', 
+                         'Wrong friends')
+        self.assertEqual((report.records, report.bad_line_count, 
+                          report.dangling), 
+                         (2, 1, [('a@dra.net', 'ghost@dra.net')]),
+                         'Wrong report')
+        
+    def test_parse_memory_mapped_file(self: 'TestLoad') -> None:
+        """
+        parse_timf reads the same records from a memory-mapped file as from
+        a file object.
+        """
+        with open('example.timf', 'rb') as opened_file:
+            mapped = mmap.mmap(opened_file.fileno(), 0, 
+                               access=mmap.ACCESS_READ)
+            records = list(parse_timf(mapped))
+            mapped.close()
+        with open('example.timf') as opened_file:
+            self.assertEqual(records, list(parse_timf(opened_file)), 
+                             'Wrong records')
+            
+    def test_second_file_adds_people(self: 'TestLoad') -> None:
+        """
+        Loading a second file keeps the people and friendships of the first
+        and adds its own, friends listed before their line and friends from
+        the first file included, on a text file or a snapshot.
+        """
+        network = construct_network(io.StringIO('A<a@dra.net>():\n'
+                                                'B<b@dra.net>():\n'))
+        path = tempfile.mktemp(suffix='.timfb')
+        network.save_snapshot(path)
+        snapshot = SocialNetwork()
+        snapshot.load_snapshot(path)
+        for loaded in (network, snapshot):
+            loaded.load_from_file(io.StringIO(
+                'C<c@dra.net>():\nD<d@dra.net>():c@dra.net,e@dra.net\n'
+                'E<e@dra.net>():a@dra.net,ghost@dra.net\n'))
+            self.assertEqual([loaded.friends(email) for email in (
+                'a@dra.net', 'b@dra.net', 'c@dra.net', 'd@dra.net', 
+                'e@dra.net')], ['E', '', 'D', 'C E', 'A D'], 'Wrong friends')
+            self.assertEqual(loaded.degree_between('a@dra.net', 'c@dra.net'),
+                             3, 'Wrong degree')
+            self.assertEqual((loaded.get_load_report().records, 
+                              loaded.get_load_report().dangling),
+                             (3, [('e@dra.net', 'ghost@dra.net')]), 
+                             'Wrong report')
+        os.remove(path)
+        
+    def test_parallel_load_matches_sequential(self: 'TestLoad') -> None:
+        """
+        Parsing a file split into many ranges with several processes gives
+        the same ids, names, schools, friends and load report as reading it
+        line by line, duplicates, dangling friends and bad lines included.
+        """
+        from TwitInMyFace_Bench import generate_timf
+        file = io.StringIO()
+        generate_timf(file, 400, degree=6, seed=5)
+        lines = file.getvalue().splitlines(True)
+        lines[10:10] = ['this is not a person\n', '\n']
+        lines[50:50] = [lines[300], lines[20]]
+        lines[200:200] = ['A Aa<a@dra.net>(Rock):ghost@dra.net,p3@example.com'
+                          '\n', 'B Bb<b@dra.net>():ghost@dra.net,a@dra.net\n']
+        with tempfile.NamedTemporaryFile('w', suffix='.timf', 
+                                         delete=False) as opened_file:
+            opened_file.writelines(lines)
+        try:
+            sequential = construct_network(opened_file.name)
+            parallel = SocialNetwork()
+            parallel.PARSE_CHUNK = 512
+            parallel.load_from_file(opened_file.name, workers=3)
+        finally:
+            os.remove(opened_file.name)
+        for attribute in ('_emails', '_names', '_school_lines', '_network'):
+            self.assertEqual(getattr(parallel, attribute), 
+                             getattr(sequential, attribute), 
+                             'Wrong {}'.format(attribute))
+        self.assertEqual(vars(parallel.get_load_report()), 
+                         vars(sequential.get_load_report()), 'Wrong report')
+        self.assertEqual((parallel.get_load_report().bad_lines[0][0],
+                          parallel.get_load_report().duplicate_count), 
+                         (11, 2), 'Wrong report')
+     
+     
+class TestLazy(unittest.TestCase):
+    
+    def test_indexes_built_when_needed(self: 'TestLazy') -> None:
+        """
+        Loading builds neither the components nor the school index, the
+        queries that need them build them, and warm builds them all.
+        """
+        network = construct_network('example.timf')
+        self.assertEqual((network._components, len(network._schools._names)),
+                         (None, 0), 'Indexes built when loading')
+        self.assertEqual(network.friends('hl@imaeatchu.com'), 'Annie Dr. Evil',
+                         'Wrong friends')
+        self.assertEqual(network._components, None, 'Components built')
+        self.assertEqual(network.classmates('dfinn2003@gmail.com', 3),
+                         'Rosalie Mullins', 'Wrong classmates')
+        self.assertNotEqual(network._components, None, 'No components')
+        network = construct_network('example.timf')
+        network.warm()
+        self.assertEqual((network._school_lines, network._components is None,
+                          network._schools._members is None),
+                         ([], False, False), 'Not warmed')
+        
+    def test_import_is_light(self: 'TestLazy') -> None:
+        """
+        Importing TwitInMyFace loads neither unittest nor random.
+        """
+        code = ('import sys, TwitInMyFace; '
+                'print(sorted({"unittest", "random"} & set(sys.modules)))')
+        output = subprocess.run([sys.executable, '-c', code], check=True,
+                                capture_output=True, text=True).stdout
+        self.assertEqual(output.strip(), '[]', 'Heavy imports')
+     
+     
+class TestLayers(unittest.TestCase):
+    
+    def test_layers_stop_at_depth(self: 'TestLayers') -> None:
+        """
+        A path a-b-c-d searched from a up to depth 2 gives three layers, and
+        within 2 lists both layers past a.
+        """
+        file = io.StringIO('A Aa<a@dra.net>():b@dra.net\n'
+                           'B Bb<b@dra.net>():c@dra.net\n'
+                           'C Cc<c@dra.net>():d@dra.net\n'
+                           'D Dd<d@dra.net>():\n')
+        network = construct_network(file)
+        self.assertEqual(network.degree_layers('a@dra.net', 2), 
+                         [[0], [1], [2]], 'Wrong layers')
+        self.assertEqual(network.people_within_degrees('a@dra.net', '2'),
+                         'B Bb C Cc', 'Wrong people within degrees')
+        self.assertEqual(network.people_with_degree('a@dra.net', '5'), '',
+                         'Wrong people with degree')
+        self.assertEqual((network.people_with_degree('a@dra.net', '-1'),
+                          network.people_with_degree_list('a@dra.net', -2)),
+                         ('', []), 'Wrong negative degree')
+     
+     
+class TestLayerCache(unittest.TestCase):
+    
+    def test_cached_answers_match(self: 'TestLayerCache') -> None:
+        """
+        A network with a cache answers every degree query like one without,
+        and once every source was asked twice, the queries are answered by
+        the cache.
+        """
+        network = construct_network('example.timf')
+        cached = SocialNetwork(cache_budget=1000)
+        cached.load_from_file('example.timf')
+        misses = []
+        for rounds in range(3):
+            for x in network._emails:
+                for y in network._emails:
+                    self.assertEqual(cached.degree_between(x, y),
+                                     network.degree_between(x, y),
+                                     'Wrong degree between')
+                self.assertEqual(cached.people_with_degree(x, 2), 
+                                 network.people_with_degree(x, 2),
+                                 'Wrong degrees')
+            misses.append(cached.get_cache_stats()['misses'])
+        self.assertEqual(misses[1], misses[2], 'Third round missed')
+        
+    def test_only_repeated_sources_searched(self: 'TestLayerCache') -> None:
+        """
+        A source is searched in full and cached only when it misses a second
+        time and its component fits the budget.
+        """
+        cache = LayerCache(3)
+        self.assertEqual([cache.missed_again(0), cache.missed_again(1), 
+                          cache.missed_again(0), cache.fits(3), 
+                          cache.fits(4)],
+                         [False, False, True, True, False], 'Wrong sources')
+        
+    def test_least_recently_used_evicted(self: 'TestLayerCache') -> None:
+        """
+        Going over the budget evicts the search used longest ago, and
+        clearing the cache drops everything.
+        """
+        cache = LayerCache(5)
+        cache.put(0, [[0], [1, 2]], True)
+        cache.put(3, [[3], [4]], True)
+        cache.layers(0, 1)
+        cache.put(5, [[5], [6]], True)
+        self.assertEqual((cache.layers(0, 1), cache.layers(3, 1)), 
+                         ([[0], [1, 2]], None), 'Wrong eviction')
+        cache.clear()
+        self.assertEqual(cache.layers(0, 1), None, 'Cache not cleared')
+     
+     
+class TestStats(unittest.TestCase):
+    
+    def test_stats_count_queries(self: 'TestStats') -> None:
+        """
+        Counting queries does not change their answers, and every query
+        type gets its calls, its work and its cache lookups.
+        """
+        network = construct_network('example.timf')
+        counted = SocialNetwork(cache_budget=1000, stats=True)
+        counted.load_from_file('example.timf')
+        self.assertEqual(network.get_query_stats(), None, 'Stats not off')
+        for x in network._emails:
+            self.assertEqual(counted.likely_friends(x), 
+                             network.likely_friends(x), 'Wrong likely')
+            for y in network._emails:
+                self.assertEqual(counted.degree_between(x, y),
+                                 network.degree_between(x, y),
+                                 'Wrong degree between')
+        stats = counted.get_query_stats().to_dict()
+        people = len(network._emails)
+        self.assertEqual(stats['degree_between']['calls'], people * people,
+                         'Wrong number of calls')
+        self.assertEqual(sum(stats['degree_between']['histogram_us']
+                             .values()), people * people, 'Wrong histogram')
+        cache = counted.get_cache_stats()
+        self.assertEqual((stats['degree_between']['cache_hits'],
+                          stats['degree_between']['cache_misses']),
+                         (cache['hits'], cache['misses']), 
+                         'Wrong cache lookups')
+        self.assertTrue(stats['likely_friends']['edges_scanned'] > 0,
+                        'No edges scanned')
+        self.assertEqual(json.loads(counted.get_query_stats().to_json()),
+                         stats, 'Wrong JSON')
+     
+     
+class TestComponents(unittest.TestCase):
+    
+    def test_components_of_example(self: 'TestComponents') -> None:
+        """
+        example.timf has three components: Harold Finch alone, Dewey Finn
+        with Rosalie Mullins, and the other ten people.
+        """
+        network = construct_network('example.timf')
+        self.assertEqual(sorted(network.component_sizes().values()), 
+                         [1, 2, 10], 'Wrong component sizes')
+        self.assertEqual(network.component_of('dfinn2003@gmail.com'),
+                         network.component_of('principal@gppr.edu'),
+                         'Wrong component')
+        self.assertNotEqual(network.component_of('harold@alias.me'),
+                            network.component_of('annie@mgo.org'),
+                            'Wrong component')
+        
+    def test_union_joins_components(self: 'TestComponents') -> None:
+        """
+        Joining components adds up their sizes.
+        """
+        components = Components(4)
+        components.union(0, 1)
+        components.union(2, components.add())
+        components.union(1, 0)
+        self.assertEqual(sorted(components.sizes().values()), [1, 2, 2],
+                         'Wrong component sizes')
+     
+     
+    def test_components_kept_through_edits(self: 'TestComponents') -> None:
+        """
+        Removing people who leave their component connected keeps the
+        components, and after any edits they are those found from scratch.
+        """
+        from TwitInMyFace_Bench import generate_timf
+        file = io.StringIO()
+        generate_timf(file, 120, degree=3, components=4, seed=8)
+        file.seek(0)
+        network = construct_network(file)
+        generator = random.Random(4)
+        kept = 0
+        for edit in range(60):
+            emails = network._emails
+            if edit % 3 == 2:
+                network.add_person('N', 'n{}@dra.net'.format(edit))
+                network.add_friendship(generator.choice(emails), 
+                                       'n{}@dra.net'.format(edit))
+            else:
+                network.components()
+                network.remove_person(generator.choice(emails))
+                kept += network._components is not None
+            found = {}
+            for idx in range(len(network._emails)):
+                found.setdefault(network.components().find(idx), 
+                                 []).append(idx)
+            expected = {}
+            fresh = Components(len(network._emails))
+            for idx, friends in enumerate(network._network):
+                for friend in friends:
+                    fresh.union(idx, friend)
+            for idx in range(len(network._emails)):
+                expected.setdefault(fresh.find(idx), []).append(idx)
+            self.assertEqual(sorted(found.values()), 
+                             sorted(expected.values()), 'Wrong components')
+            self.assertEqual(network.component_sizes(), 
+                             {root: len(ids) for root, ids in found.items()},
+                             'Wrong sizes')
+        self.assertTrue(kept > 0, 'Components never kept')
+     
+     
+class TestLikely(unittest.TestCase):
+    
+    def test_same_name_not_mutual(self: 'TestLikely') -> None:
+        """
+        a and z each have a friend called Sam, but not the same Sam, so they
+        have no mutual friends and z is not suggested to a.
+        """
+        file = io.StringIO('A Aa<a@dra.net>():sam1@dra.net\n'
+                           'Sam<sam1@dra.net>():\n'
+                           'Sam<sam2@dra.net>():\n'
+                           'Z Zz<z@dra.net>():sam2@dra.net\n')
+        network = construct_network(file)
+        self.assertEqual(network.mutual_friends('a@dra.net', 'z@dra.net'), 
+                         '', 'Wrong mutual friends')
+        self.assertEqual(network.likely_friends('a@dra.net'), '',
+                         'Wrong likely friends')
+        
+    def test_topk_ranked_by_mutual_friends(self: 'TestLikely') -> None:
+        """
+        likely_friends_topk ranks candidates by their number of mutual
+        friends, ties by name.
+        """
+        network = construct_network('example.timf')
+        self.assertEqual(network.likely_friends_topk('sengels@cdf.toronto.edu',
+                                                     3),
+                         [('blaw@cdf.toronto.edu', 2), 
+                          ('henry@hyde.net', 1)], 'Wrong ranking')
+        self.assertEqual(network.likely_friends('lungj@cdf.toronto.edu'),
+                         'Anya Tafliovich', 'Wrong likely friends')
+    
+    def test_batch_matches_likely_friends(self: 'TestLikely') -> None:
+        """
+        The batch job run over two worker processes writes one line per
+        person, each matching likely_friends.
+        """
+        network = construct_network('example.timf')
+        output = io.StringIO()
+        written = network.likely_friends_batch(output, workers=2, 
+                                               shard_size=4)
+        lines = sorted(output.getvalue().splitlines())
+        expected = sorted('{}\t{}'.format(email, 
+                                            network.likely_friends(email)) 
+                          for email in network._emails)
+        self.assertEqual((written, lines), (len(expected), expected),
+                         'Wrong batch output')
+     
+     
+class TestClassmates(unittest.TestCase):
+    
+    def test_every_plan_gives_same_classmates(self: 'TestClassmates') -> None:
+        """
+        Probing each classmate, iterating over the neighbourhood and
+        iterating over the classmates all give the classmates found by
+        checking everyone within d degrees.
+        """
+        network = construct_network('example.timf')
+        for probe_limit in (0, 1, 16):
+            network.PROBE_LIMIT = probe_limit
+            for x in network._emails:
+                schools = set(network.find_node_by_email(x).get_schools())
+                for d in range(5):
+                    expected = [
+                        network.find_node_by_email(email).get_name() 
+                        for email in network.get_people_within_degrees(x, d)
+                        if schools.intersection(
+                            network.find_node_by_email(email).get_schools())]
+                    self.assertEqual(network.classmates(x, d), 
+                                     list_to_string(expected),
+                                     'Wrong classmates')
+                    
+    def test_classmates_sharing_a_name(self: 'TestClassmates') -> None:
+        """
+        Two different classmates with the same name are both listed.
+        """
+        file = io.StringIO('A Aa<a@dra.net>(Rock):sam1@dra.net,sam2@dra.net\n'
+                           'Sam<sam1@dra.net>(Rock):\n'
+                           'Sam<sam2@dra.net>(Rock):\n')
+        network = construct_network(file)
+        self.assertEqual(network.classmates('a@dra.net', 1), 'Sam Sam', 
+                         'Wrong classmates')
+     
+     
+class TestPaging(unittest.TestCase):
+    
+    def test_pages_are_slices_of_full_answer(self: 'TestPaging') -> None:
+        """
+        Every page of friends, degrees and classmates, small ones picked
+        with a heap, large ones out of the name order and the rest sorted,
+        is the same slice of the names of the full answer, whether the name
+        index is built or not; answering does not build it.
+        """
+        from TwitInMyFace_Bench import generate_timf
+        file = io.StringIO()
+        generate_timf(file, 300, degree=8, schools=5, seed=3)
+        file.seek(0)
+        network = construct_network(file)
+        cold = SocialNetwork()
+        file.seek(0)
+        cold.load_from_file(file)
+        network.name_index()
+        pages = [(0, None), (0, 1), (2, 3), (5, 100), (40, 0), (1000, 5)]
+        for email in network._emails[::7]:
+            for d in range(4):
+                for offset, limit in pages:
+                    stop = None if limit is None else offset + limit
+                    for full, method, args in (
+                            (network.friends(email), network.iter_friends,
+                             (email,)),
+                            (network.people_with_degree(email, d), 
+                             network.iter_people_with_degree, (email, d)),
+                            (network.classmates(email, d),
+                             network.iter_classmates, (email, d))):
+                        names = list(method(*args))
+                        self.assertEqual(' '.join(names), full, 
+                                         'Wrong names')
+                        self.assertEqual(list(method(*args, offset, limit)),
+                                         names[offset:stop], 'Wrong page')
+                        cold_method = getattr(cold, method.__name__)
+                        self.assertEqual(
+                            list(cold_method(*args, offset, limit)),
+                            names[offset:stop], 'Wrong page without index')
+        self.assertEqual(cold._name_index, None, 'Name index built')
+        
+    def test_name_index_kept_across_friendships(self: 'TestPaging'
+                                                ) -> None:
+        """
+        Changing friendships keeps the name index, while adding or removing
+        a person puts them in or takes them out of its order, the ranks
+        being found again when needed.
+        """
+        network = construct_network('example.timf')
+        index = network.name_index()
+        network.add_friendship('annie@mgo.org', 'dr@evil.net')
+        network.remove_friendship('annie@mgo.org', 'dr@evil.net')
+        self.assertIs(network.name_index(), index, 'Name index dropped')
+        network.add_person('Aaron', 'aaron@dra.net')
+        network.add_person('Annie', 'annie@dra.net')
+        network.add_friendship('aaron@dra.net', 'dr@evil.net')
+        self.assertEqual(network.friends('dr@evil.net').split(' ')[0], 
+                         'Aaron', 'Name index not updated')
+        for email in ('annie@mgo.org', 'aaron@dra.net', 'hl@imaeatchu.com'):
+            network.remove_person(email)
+            order, ranks = network.name_index()
+            self.assertEqual(list(order), sorted(
+                range(len(network._names)), 
+                key=lambda idx: (network._names[idx], idx)), 
+                             'Name index not updated')
+            self.assertEqual([ranks[idx] for idx in order], 
+                             list(range(len(order))), 'Wrong ranks')
+        
+    def test_driver_streams_pages(self: 'TestPaging') -> None:
+        """
+        The driver writes the same line streaming the names a few at a
+        time as answering the query at once, pages with offset and limit,
+        and counts the whole of every streamed query.
+        """
+        import TwitInMyFace_Driver
+        from TwitInMyFace_Driver import answer_query, write_answer
+        network = SocialNetwork(stats=True)
+        network.load_from_file('example.timf')
+        chunk = TwitInMyFace_Driver.STREAM_CHUNK
+        TwitInMyFace_Driver.STREAM_CHUNK = 2
+        try:
+            for line in ('friends hl@imaeatchu.com', 
+                         'degrees annie@mgo.org 2',
+                         'classmates sengels@cdf.toronto.edu 3 1 2',
+                         'degree annie@mgo.org dr@evil.net'):
+                output = io.StringIO()
+                self.assertTrue(write_answer(line.split(), network, output))
+                self.assertEqual(output.getvalue(), 
+                                 answer_query(line.split(), network) + '\n',
+                                 'Wrong line')
+        finally:
+            TwitInMyFace_Driver.STREAM_CHUNK = chunk
+        self.assertTrue(len(network.friends('hl@imaeatchu.com').split()) > 2,
+                        'Not streamed in chunks')
+        stats = network.get_query_stats().to_dict()
+        self.assertEqual((stats['friends']['calls'], 
+                          stats['people_with_degree']['calls'],
+                          stats['classmates']['calls']), (3, 2, 2),
+                         'Wrong number of calls')
+        self.assertTrue(stats['friends']['edges_scanned'] > 0,
+                        'No edges scanned')
+        self.assertEqual(answer_query(
+            'classmates sengels@cdf.toronto.edu 3 1 2'.split(), network),
+                         'Brian Law David Liu', 'Wrong page')
+        for line in ('friends hl@imaeatchu.com a b', 
+                     'friends hl@imaeatchu.com 0 -1',
+                     'degrees annie@mgo.org x', 
+                     'classmates sengels@cdf.toronto.edu 3 -1 2'):
+            output = io.StringIO()
+            self.assertTrue(write_answer(line.split(), network, output))
+            self.assertEqual(output.getvalue(), 'Invalid command or wrong '
+                             'number of arguments provided.\n', 
+                             'Not invalid')
+     
+     
+class TestMutation(unittest.TestCase):
+    
+    def check_same(self: 'TestMutation', network: 'SocialNetwork', 
+                   lines: str) -> None:
+        """
+        Check that network answers like a network loaded from lines.
+        """
+        expected = construct_network(io.StringIO(lines))
+        self.assertEqual(sorted(network._emails), sorted(expected._emails),
+                         'Wrong people')
+        self.assertEqual(sorted(network.component_sizes().values()),
+                         sorted(expected.component_sizes().values()),
+                         'Wrong components')
+        for x in expected._emails:
+            self.assertEqual(network.friends(x), expected.friends(x),
+                             'Wrong friends')
+            node = network.find_node_by_email(x)
+            expected_node = expected.find_node_by_email(x)
+            self.assertEqual(sorted(node.get_friends()), 
+                             sorted(expected_node.get_friends()), 
+                             'Wrong friends')
+            self.assertEqual(network.classmates(x, 3), 
+                             expected.classmates(x, 3), 'Wrong classmates')
+            for y in expected._emails:
+                self.assertEqual(network.degree_between(x, y),
+                                 expected.degree_between(x, y),
+                                 'Wrong degree between')
+    
+    def test_edits_match_reload(self: 'TestMutation') -> None:
+        """
+        A series of edits leaves the network as if the edited file had been
+        loaded from scratch.
+        """
+        network = construct_network(io.StringIO(
+            'A Aa<a@dra.net>(Rock):b@dra.net\n'
+            'B Bb<b@dra.net>(Rock):c@dra.net\n'
+            'C Cc<c@dra.net>(Jazz):\n'))
+        network.add_person('D Dd', 'd@dra.net', ['Jazz', 'Rock'])
+        network.add_friendship('c@dra.net', 'd@dra.net')
+        self.check_same(network, 'A Aa<a@dra.net>(Rock):b@dra.net\n'
+                                 'B Bb<b@dra.net>(Rock):c@dra.net\n'
+                                 'C Cc<c@dra.net>(Jazz):d@dra.net\n'
+                                 'D Dd<d@dra.net>(Jazz,Rock):\n')
+        network.remove_friendship('b@dra.net', 'c@dra.net')
+        network.set_schools('a@dra.net', ['Jazz'])
+        self.check_same(network, 'A Aa<a@dra.net>(Jazz):b@dra.net\n'
+                                 'B Bb<b@dra.net>(Rock):\n'
+                                 'C Cc<c@dra.net>(Jazz):d@dra.net\n'
+                                 'D Dd<d@dra.net>(Jazz,Rock):\n')
+        network.add_friendship('a@dra.net', 'd@dra.net')
+        network.remove_person('b@dra.net')
+        self.check_same(network, 'A Aa<a@dra.net>(Jazz):d@dra.net\n'
+                                 'C Cc<c@dra.net>(Jazz):d@dra.net\n'
+                                 'D Dd<d@dra.net>(Jazz,Rock):\n')
+        self.assertRaises(ValueError, network.add_person, 'A', 'a@dra.net')
+        
+    def test_edit_snapshot(self: 'TestMutation') -> None:
+        """
+        A network opened from a snapshot can be edited too.
+        """
+        handle, path = tempfile.mkstemp(suffix='.timfb')
+        os.close(handle)
+        try:
+            construct_network(io.StringIO(
+                'A Aa<a@dra.net>():\nB Bb<b@dra.net>():\n')).save_snapshot(path)
+            network = SocialNetwork()
+            network.load_snapshot(path)
+            network.add_friendship('a@dra.net', 'b@dra.net')
+        finally:
+            os.remove(path)
+        self.check_same(network, 'A Aa<a@dra.net>():b@dra.net\n'
+                                 'B Bb<b@dra.net>():\n')
+     
+     
+class TestBackend(unittest.TestCase):
+    
+    @unittest.skipIf(TwitInMyFace_numpy is None, 'needs numpy and scipy')
+    def test_numpy_same_answers_as_python(self: 'TestBackend') -> None:
+        """
+        The numpy backend answers every query on example.timf like the
+        default backend, before and after an edit.
+        """
+        network = construct_network('example.timf')
+        vectorized = SocialNetwork(backend='numpy')
+        vectorized.load_from_file('example.timf')
+        for edits in range(2):
+            for x in network._emails:
+                self.assertEqual(vectorized.likely_friends(x), 
+                                 network.likely_friends(x), 'Wrong likely')
+                for d in range(4):
+                    self.assertEqual(vectorized.people_with_degree(x, d), 
+                                     network.people_with_degree(x, d),
+                                     'Wrong degrees')
+                    self.assertEqual(vectorized.classmates(x, d), 
+                                     network.classmates(x, d),
+                                     'Wrong classmates')
+                for y in network._emails:
+                    self.assertEqual(vectorized.mutual_friends(x, y), 
+                                     network.mutual_friends(x, y),
+                                     'Wrong mutual friends')
+            for graph in (network, vectorized):
+                graph.add_friendship('harold@alias.me', 'annie@mgo.org')
+    
+    def test_bitsets_same_answers(self: 'TestBackend') -> None:
+        """
+        With bitsets for a near-clique of 8 people next to a path of 5, every
+        query answers like without bitsets, and only the near-clique gets
+        bitsets.
+        """
+        generator = random.Random(15)
+        lines = []
+        for i in range(8):
+            friends = ['c{}@dra.net'.format(j) for j in range(8) 
+                       if j != i and generator.random() < 0.8]
+            lines.append('C{0}<c{0}@dra.net>({1}):{2}\n'.format(
+                i, 'Rock' if i % 2 else 'Jazz', ','.join(friends)))
+        lines.append('P Pp<p@dra.net>(Rock):q@dra.net\n'
+                     'Q Qq<q@dra.net>(Rock):r@dra.net\n'
+                     'R Rr<r@dra.net>(Jazz):s@dra.net\n'
+                     'S Ss<s@dra.net>(Jazz):t@dra.net\n'
+                     'T Tt<t@dra.net>(Rock):\n')
+        network = construct_network(io.StringIO(''.join(lines)))
+        dense = SocialNetwork(bitset_density=0.5)
+        dense.load_from_file(io.StringIO(''.join(lines)))
+        self.assertEqual([dense.bitset_index().covers(idx) 
+                          for idx in range(13)], [True] * 8 + [False] * 5,
+                         'Wrong dense components')
+        for x in network._emails:
+            self.assertEqual(dense.likely_friends(x), 
+                             network.likely_friends(x), 'Wrong likely')
+            for d in range(4):
+                self.assertEqual(dense.people_with_degree(x, d), 
+                                 network.people_with_degree(x, d),
+                                 'Wrong degrees')
+                self.assertEqual(dense.classmates(x, d), 
+                                 network.classmates(x, d),
+                                 'Wrong classmates')
+            for y in network._emails:
+                self.assertEqual(dense.mutual_friends(x, y), 
+                                 network.mutual_friends(x, y),
+                                 'Wrong mutual friends')
+    
+    def test_unknown_backend(self: 'TestBackend') -> None:
+        """
+        Asking for a backend that does not exist raises ValueError.
+        """
+        self.assertRaises(ValueError, SocialNetwork, backend='fortran')
+     
+     
+class TestGenerator(unittest.TestCase):
+    
+    def test_generated_network_loads(self: 'TestGenerator') -> None:
+        """
+        A generated network of 500 people in 4 components loads without
+        problems, has no friendships across components, and a hub with many
+        more friends than the average.
+        """
+        from TwitInMyFace_Bench import generate_timf
+        file = io.StringIO()
+        generate_timf(file, 500, degree=6, components=4, seed=17)
+        file.seek(0)
+        network = construct_network(file)
+        self.assertTrue(network.get_load_report().is_clean(), 'Bad file')
+        self.assertEqual(len(network._emails), 500, 'Wrong people')
+        self.assertGreaterEqual(len(network.component_sizes()), 4, 
+                                'Wrong components')
+        self.assertNotEqual(network.component_of('p0@example.com'),
+                            network.component_of('p499@example.com'),
+                            'Wrong components')
+        degrees = [len(friends) for friends in network._network]
+        self.assertGreater(max(degrees), 4 * sum(degrees) / len(degrees),
+                           'No hub')
+     
+     
+class TestSeparations(unittest.TestCase):
+    
+    def setUp(self: 'TestSeparations') -> None:
+        from TwitInMyFace_Bench import generate_timf
+        file = io.StringIO()
+        generate_timf(file, 300, degree=4, components=3, seed=11)
+        file.seek(0)
+        self.network = construct_network(file)
+        self.network.SEARCH_WIDTH = 64
+    
+    def test_matches_one_search_per_person(self: 'TestSeparations') -> None:
+        """
+        The histogram and eccentricities found many sources at a time are
+        those of a breadth first search from every person, in one process
+        or several, and progress is reported after every search.
+        """
+        network = self.network
+        expected = {}
+        eccentricities = {}
+        for email in network._emails:
+            layers = network.search_layers(network.email_index(email), 
+                                           len(network._emails))
+            for depth, layer in enumerate(layers[1:], 1):
+                expected[depth] = expected.get(depth, 0) + len(layer)
+            eccentricities[email] = len(layers) - 1
+            unreachable = len(network._emails) - sum(map(len, layers))
+            if unreachable:
+                expected[float('inf')] = (expected.get(float('inf'), 0) + 
+                                          unreachable)
+        expected = dict(sorted(expected.items()))
+        calls = []
+        self.assertEqual(network.separations(progress=lambda *done: 
+                                             calls.append(done)),
+                         (expected, eccentricities), 'Wrong separations')
+        self.assertEqual(calls, [(64, 300), (128, 300), (192, 300), 
+                                 (256, 300), (300, 300)], 'Wrong progress')
+        self.assertEqual(network.separations(workers=2), 
+                         (expected, eccentricities), 'Wrong in processes')
+        
+    def test_stats(self: 'TestSeparations') -> None:
+        """
+        The statistics of everyone are exact and match the histogram, and
+        sampled ones only count pairs of the sampled people.
+        """
+        stats = self.network.separation_stats(None)
+        histogram = stats['histogram']
+        connected = sum(count for depth, count in histogram.items() 
+                        if depth != float('inf'))
+        self.assertEqual((stats['exact'], stats['pairs'], 
+                          stats['connected_pairs'], stats['max_separation']),
+                         (True, 300 * 299, connected, 
+                          max(self.network.separations()[1].values())),
+                         'Wrong stats')
+        sampled = self.network.separation_stats(50, seed=2)
+        self.assertEqual((sampled['exact'], sampled['sources'], 
+                          sampled['pairs'], sum(sampled['histogram'].values())),
+                         (False, 50, 50 * 299, 50 * 299), 'Wrong samples')
+     
+     
+class TestServer(unittest.TestCase):
+    
+    def test_pipelined_answers_in_order(self: 'TestServer') -> None:
+        """
+        Commands sent together over TCP and over a Unix socket come back in
+        order with the answers of the driver, heavy ones included, and a
+        heavy command over its time limit gives an error line.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from TwitInMyFace_Driver import answer_line
+        from TwitInMyFace_Server import QueryServer, ask
+        network = construct_network('example.timf')
+        network.warm()
+        lines = []
+        for x in network._emails:
+            lines.extend(['friends ' + x, 'likely ' + x, 
+                          'degrees {} 3'.format(x), 'classmates {} 1'.format(x),
+                          'degree {} {}'.format(x, network._emails[0])])
+        lines.append('friends nobody@nowhere.net')
+        expected = [answer_line(line, network) for line in lines]
+        
+        async def scenario(directory: str) -> tuple:
+            with ThreadPoolExecutor(2) as executor:
+                server = QueryServer(network, executor)
+                tcp = await server.start(port=0)
+                port = tcp.sockets[0].getsockname()[1]
+                path = os.path.join(directory, 'timf.sock')
+                unix = await server.start(path=path)
+                answers = await asyncio.gather(ask(lines, port=port), 
+                                               ask(lines, path=path))
+                server._timeout = 0
+                late = await ask(['likely ' + network._emails[0], 
+                                  'quit', 'friends ' + network._emails[0]],
+                                 port=port)
+                for listening in (tcp, unix):
+                    listening.close()
+                    await listening.wait_closed()
+            return answers, late
+        
+        with tempfile.TemporaryDirectory() as directory:
+            answers, late = asyncio.run(scenario(directory))
+        self.assertEqual(answers, [expected, expected], 'Wrong answers')
+        self.assertEqual(late, ['Error: timed out after 0s'], 'No timeout')
+     
+     
+    def test_failed_command_gives_error_line(self: 'TestServer') -> None:
+        """
+        A command failing with any error is answered with an error line and
+        the commands after it are still answered; stats takes one line.
+        """
+        from TwitInMyFace_Server import QueryServer, ask
+        network = SocialNetwork(stats=True)
+        network.load_from_file('example.timf')
+        network.mutual_friends = lambda x, y: 1 / 0
+        x = network._emails[0]
+        lines = ['friends ' + x, 'mutual {} {}'.format(x, x), 'stats',
+                 'friends ' + x]
+        
+        async def scenario() -> list:
+            server = QueryServer(network)
+            tcp = await server.start(port=0)
+            answers = await asyncio.wait_for(
+                ask(lines, port=tcp.sockets[0].getsockname()[1]), 10)
+            tcp.close()
+            await tcp.wait_closed()
+            return answers
+        
+        answers = asyncio.run(scenario())
+        self.assertEqual(len(answers), 4, 'Answers lost')
+        self.assertEqual((answers[0], answers[1], answers[3]), 
+                         (network.friends(x), 'Error: division by zero',
+                          network.friends(x)), 'Wrong answers')
+        self.assertEqual(json.loads(answers[2])['friends']['calls'], 1,
+                         'Wrong stats')
+        
+    def test_process_pool_closes_connections(self: 'TestServer') -> None:
+        """
+        With heavy commands answered by worker processes, the server still
+        closes every connection once its client quits.
+        """
+        from TwitInMyFace_Driver import answer_line, set_worker_graph
+        from TwitInMyFace_Server import QueryServer, ask, start_process_pool
+        network = construct_network('example.timf')
+        lines = ['likely ' + x for x in network._emails]
+        expected = [answer_line(line, network) for line in lines]
+        
+        async def scenario() -> list:
+            server = QueryServer(network, executor)
+            tcp = await server.start(port=0)
+            port = tcp.sockets[0].getsockname()[1]
+            answers = []
+            for line in lines[:3]:
+                answers.extend(await asyncio.wait_for(
+                    ask([line, 'quit'], port=port), 10))
+            answers.extend(await asyncio.wait_for(ask(lines[3:], port=port),
+                                                  10))
+            tcp.close()
+            await tcp.wait_closed()
+            return answers
+        
+        with start_process_pool(2, set_worker_graph, (network,)) as executor:
+            self.assertEqual(asyncio.run(scenario()), expected, 
+                             'Wrong answers')
+     
+     
+class TestBatch(unittest.TestCase):
+    
+    def test_workers_answer_in_order(self: 'TestBatch') -> None:
+        """
+        batch answers the same lines in the same order with one process or
+        several, unknown emails giving error lines, stops at the first quit
+        and reports the queries answered; stats is refused with workers.
+        """
+        from TwitInMyFace_Driver import answer_line
+        network = construct_network('example.timf')
+        lines = []
+        for x in network._emails:
+            lines.extend(['friends ' + x, 'degrees {} 2'.format(x), 
+                          'likely ' + x, 'degree {} harold@alias.me'.format(x)])
+        lines += ['mutual nobody@dra.net harold@alias.me', '', 'quit', 
+                  'friends harold@alias.me']
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'queries.txt')
+            with open(path, 'w') as opened_file:
+                opened_file.write('\n'.join(lines) + '\n')
+            outputs = []
+            for workers, shared in (('1', []), ('3', []), ('3', ['--shared'])):
+                done = subprocess.run(
+                    [sys.executable, 'TwitInMyFace_Driver.py', 'example.timf',
+                     'batch', path, '--workers', workers] + shared,
+                    capture_output=True, text=True, check=True)
+                outputs.append(done.stdout)
+                self.assertIn('Answered {} queries'.format(len(lines) - 3),
+                              done.stderr, 'Wrong summary')
+            stats = subprocess.run(
+                [sys.executable, 'TwitInMyFace_Driver.py', 'example.timf',
+                 'batch', '--workers', '2'], input='stats\n', 
+                capture_output=True, text=True, check=True).stdout
+        expected = [answer_line(line, network) for line in lines[:-3]]
+        self.assertEqual(outputs[0].splitlines(), expected, 'Wrong answers')
+        self.assertEqual(outputs[1:], outputs[:1] * 2, 'Wrong order')
+        self.assertEqual(expected[-1], 
+                         'Error: nobody@dra.net is not in the network',
+                         'No error line')
+        self.assertEqual(stats, 
+                         'Error: stats is not available with --workers\n',
+                         'Wrong stats')
+     
+     
+class TestSharedGraph(unittest.TestCase):
+    
+    def test_workers_follow_published_versions(self: 'TestSharedGraph'
+                                               ) -> None:
+        """
+        Worker processes attached to a shared graph answer like the network
+        it was published from, move to a new version once it is published,
+        and every block is gone once the shared graph is closed.
+        """
+        from TwitInMyFace_Driver import answer_line, attach_worker_graph
+        network = construct_network('example.timf')
+        lines = ['friends ' + x for x in network._emails]
+        lines += ['classmates {} 3'.format(x) for x in network._emails]
+        lines += ['degree {} {}'.format(x, network._emails[-1]) 
+                  for x in network._emails]
+        shared = SharedGraph('timf_test_{}'.format(os.getpid()), create=True)
+        try:
+            self.assertEqual(shared.publish(network), 1, 'Wrong version')
+            with multiprocessing.Pool(2, initializer=attach_worker_graph,
+                                      initargs=(shared.name,)) as pool:
+                self.assertEqual(pool.map(answer_line, lines, chunksize=3),
+                                 [answer_line(line, network) 
+                                  for line in lines], 'Wrong answers')
+                network.remove_friendship('hl@imaeatchu.com', 
+                                          'annie@mgo.org')
+                self.assertEqual(shared.publish(network), 2, 'Wrong version')
+                self.assertEqual(pool.map(answer_line, lines, chunksize=3),
+                                 [answer_line(line, network) 
+                                  for line in lines], 'Old version used')
+        finally:
+            shared.close()
+        self.assertRaises(FileNotFoundError, SharedGraph, shared.name)
+        self.assertRaises(FileNotFoundError, attach_memory, 
+                          shared.name + '_2')
+     
+     
+class TestSharded(unittest.TestCase):
+    
+    def test_same_answers_as_one_process(self: 'TestSharded') -> None:
+        """
+        A network spread over 3 shard processes answers degree, degrees and
+        classmates queries like a SocialNetwork, and reports the same
+        problems with its file.
+        """
+        from TwitInMyFace_Sharded import ShardedNetwork
+        network = construct_network('example.timf')
+        sharded = ShardedNetwork(3)
+        try:
+            sharded.load_from_file('example.timf')
+            for x in network._emails:
+                for d in range(5):
+                    self.assertEqual(sharded.people_with_degree(x, d),
+                                     network.people_with_degree(x, d),
+                                     'Wrong degrees')
+                    self.assertEqual(sharded.classmates(x, d),
+                                     network.classmates(x, d),
+                                     'Wrong classmates')
+                for y in network._emails:
+                    self.assertEqual(sharded.degree_between(x, y),
+                                     network.degree_between(x, y),
+                                     'Wrong degree between')
+            self.assertRaises(ValueError, sharded.people_with_degree,
+                              'nobody@nowhere.net', 1)
+            
+            text = ('A Aa<a@dra.net>(U):b@dra.net,ghost@dra.net\n'
+                    'this is not a person\n'
+                    'B Bb<b@dra.net>(U):\n'
+                    'A Zz<a@dra.net>(U):c@dra.net\n'
+                    'C Cc<c@dra.net>(U):b@dra.net\n')
+            sharded.load_from_file(io.StringIO(text))
+            network = construct_network(io.StringIO(text))
+            self.assertEqual(sharded.classmates('a@dra.net', 2), 
+                             network.classmates('a@dra.net', 2),
+                             'Wrong classmates')
+            reports = [(report.records, report.bad_line_count, 
+                        report.dangling, report.duplicates) for report in
+                       (sharded.get_load_report(), 
+                        network.get_load_report())]
+            self.assertEqual(reports[0], reports[1], 'Wrong report')
+        finally:
+            sharded.close()
+     
+     
+class TestSnapshot(unittest.TestCase):
+    
+    def setUp(self: 'TestSnapshot') -> None:
+        self.network = construct_network('example.timf')
+        handle, self.path = tempfile.mkstemp(suffix='.timfb')
+        os.close(handle)
+        self.network.save_snapshot(self.path)
+        self.snapshot = SocialNetwork()
+        self.snapshot.load_snapshot(self.path)
+        
+    def tearDown(self: 'TestSnapshot') -> None:
+        os.remove(self.path)
+    
+    def test_snapshot_answers_like_text_file(self: 'TestSnapshot') -> None:
+        """
+        Every friends, degrees and classmates query gives the same answer on
+        the snapshot as on the network it was saved from.
+        """
+        for email in self.network._emails:
+            self.assertEqual(self.snapshot.friends(email), 
+                             self.network.friends(email), 'Wrong friends')
+            for d in range(4):
+                self.assertEqual(self.snapshot.people_with_degree(email, d),
+                                 self.network.people_with_degree(email, d),
+                                 'Wrong degrees')
+                self.assertEqual(self.snapshot.classmates(email, d),
+                                 self.network.classmates(email, d),
+                                 'Wrong classmates')
+        
+    def test_snapshot_unknown_email(self: 'TestSnapshot') -> None:
+        """
+        An email missing from the snapshot raises ValueError, like an email
+        missing from a text file.
+        """
+        self.assertRaises(ValueError, self.snapshot.email_index, 'z@dra.net')
+
+
+if __name__ == '__main__':
+    unittest.main(exit=False)